@@ -1,14 +1,50 @@
 import logging
+import os
 import sys
 import tempfile
 import time
 
 import click
 import coco_agent
+import srsly
+from coco_agent.remote import hook as push_hook
 from coco_agent.remote.logging import apply_log_config, install_thread_excepthook
 from coco_agent.remote.transfer import upload_dir_to_cc_gcs
+from coco_agent.remote.upload_benchmark import (
+    DEFAULT_UPLOAD_BENCHMARK_CHUNK_SIZE_KB,
+    DEFAULT_UPLOAD_BENCHMARK_FILE_SIZE_KB,
+    DEFAULT_UPLOAD_BENCHMARK_MAX_WORKERS,
+    DEFAULT_UPLOAD_BENCHMARK_NUM_FILES,
+    UPLOAD_BENCHMARK_FLOWS,
+    run_upload_benchmark,
+)
 from coco_agent.services import tm_id
-from coco_agent.services.git import ingest_repo_to_jsonl, update_repo
+from coco_agent.services.benchmark import (
+    BENCHMARK_SINKS,
+    DEFAULT_BENCHMARK_MAX_COMMITS,
+    run_benchmark,
+)
+from coco_agent.services.churn import DEFAULT_CHURN_PATH_DEPTH
+from coco_agent.services.commit_cache import CommitCache
+from coco_agent.services.git import (
+    DEFAULT_HUNK_MAX_COMMIT_LINES,
+    DEFAULT_HUNK_MAX_FILE_LINES,
+    GIT_BACKENDS,
+    GITPYTHON_BACKEND,
+    MERGE_DIFF_STRATEGIES,
+    MERGE_DIFFS_FIRST_PARENT,
+    RENAME_DETECTION_MODES,
+    RENAME_DETECTION_ON,
+    ingest_repo_to_jsonl,
+    ingest_repo_to_jsonl_in_windows,
+    ingest_repo_to_jsonl_with_submodules,
+    ingest_repo_to_sink,
+    is_branch_glob,
+    is_clone_url,
+    update_repo,
+    write_commit_graph,
+)
+from coco_agent.services.sinks import FILE_SINK, SINKS, SQLITE_SINK, create_sink
 
 from . import params
 
@@ -83,12 +119,27 @@ def extract() -> str:
     default="./out",
     help="Output directory - ignored if upload flag specified, a temp dir will be used instead",
 )
-@click.option("--branch", default="master", help="Branch / rev spec")
+@click.option(
+    "--branch",
+    "branches",
+    multiple=True,
+    default=["master"],
+    help="Branch / rev spec. Repeat, or use a glob such as 'release/*', to extract "
+    "several branches in one pass - each commit is then extracted once, recording "
+    "the branches that contain it",
+)
 @click.option(
     "--git-pull-latest/--no-git-pull-latest",
     default=False,
     help="Pull latest changes for given repo + branch",
 )
+@click.option(
+    "--write-commit-graph/--no-write-commit-graph",
+    "commit_graph",
+    default=False,
+    help="Write or refresh the repo's commit-graph, with changed-path Bloom filters, "
+    "before extracting - speeds up history walks on large repos",
+)
 @click.option(
     "--ignore-errors",
     is_flag=True,
@@ -103,6 +154,176 @@ def extract() -> str:
     required=False,
     help="Use pure Python repo DB in case of issues - not suitable for server processes",
 )
+@click.option(
+    "--merge-diffs",
+    type=click.Choice(MERGE_DIFF_STRATEGIES, case_sensitive=False),
+    default=MERGE_DIFFS_FIRST_PARENT,
+    help="How to diff merge commits: against the first parent, only files changed "
+    "relative to all parents (as git's combined diff), or not at all",
+)
+@click.option(
+    "--first-parent/--no-first-parent",
+    default=False,
+    help="Only follow the first parent of merge commits when walking history",
+)
+@click.option(
+    "--include-path",
+    "include_paths",
+    multiple=True,
+    help="Only extract diffs for paths matching this glob, e.g. 'src/**' - may be "
+    "repeated. * doesn't match /, ** matches across directories",
+)
+@click.option(
+    "--exclude-path",
+    "exclude_paths",
+    multiple=True,
+    help="Skip diffs for paths matching this glob, e.g. '**/node_modules/**' - may be "
+    "repeated",
+)
+@click.option(
+    "--repo-path-mapping",
+    "repo_path_mappings",
+    multiple=True,
+    type=params.path_mapping_parameter,
+    help="Split a monorepo: attribute diffs under a path prefix to a separate logical "
+    "repo, as PREFIX=NAME, e.g. 'services/billing=billing' - may be repeated",
+)
+@click.option(
+    "--rename-detection",
+    type=click.Choice(RENAME_DETECTION_MODES, case_sensitive=False),
+    default=RENAME_DETECTION_ON,
+    help="Detect renames (on), only detect renames of unchanged files (exact), "
+    "or report renames as deletes and adds (off)",
+)
+@click.option(
+    "--rename-limit",
+    type=int,
+    required=False,
+    help="Skip inexact rename detection for commits with more than this many "
+    "added or deleted files, as git's diff.renameLimit",
+)
+@click.option(
+    "--commit-timeout-sec",
+    type=float,
+    required=False,
+    help="Time budget for diffing each commit - commits taking longer are extracted "
+    "without diffs, marked with diffs_skipped",
+)
+@click.option(
+    "--hunks/--no-hunks",
+    default=False,
+    help="Also extract the changed line ranges of each diff's hunks, streamed from "
+    "a patch per commit",
+)
+@click.option(
+    "--hunk-max-file-lines",
+    type=int,
+    default=DEFAULT_HUNK_MAX_FILE_LINES,
+    help="Drop hunks of files with more changed lines than this, e.g. generated files",
+)
+@click.option(
+    "--hunk-max-commit-lines",
+    type=int,
+    default=DEFAULT_HUNK_MAX_COMMIT_LINES,
+    help="Stop reading a commit's patch after this many changed lines",
+)
+@click.option(
+    "--commit-cache-path",
+    required=False,
+    help="SQLite file caching extracted commits and diffs across runs - e.g. so that "
+    "overlapping date ranges only extract new commits",
+)
+@click.option(
+    "--commit-cache-max-mb",
+    type=int,
+    default=1024,
+    help="Size of the commit cache, beyond which least recently used commits are "
+    "evicted",
+)
+@click.option(
+    "--backend",
+    type=click.Choice(list(GIT_BACKENDS), case_sensitive=False),
+    default=GITPYTHON_BACKEND,
+    help="Library for walking history and diffing: GitPython (git command line) or "
+    "pygit2 (libgit2, in-process - needs the pygit2 extra)",
+)
+@click.option(
+    "--trace-git/--no-trace-git",
+    default=False,
+    help="Record the git commands run per commit, and log a summary of them and "
+    "the slowest ones at the end of the extract",
+)
+@click.option(
+    "--compact-users/--no-compact-users",
+    default=False,
+    help="Extract commit authors and committers as deduplicated git_users, "
+    "referenced from commits by id",
+)
+@click.option(
+    "--compact-diffs/--no-compact-diffs",
+    default=False,
+    help="Write diffs in the compact schema, with fields common to a file in a "
+    "header and paths in a table",
+)
+@click.option(
+    "--churn-daily/--no-churn-daily",
+    default=False,
+    help="Also extract daily churn rollups per author and path prefix, as "
+    "git_churn_daily",
+)
+@click.option(
+    "--churn-path-depth",
+    type=int,
+    default=DEFAULT_CHURN_PATH_DEPTH,
+    help="Number of leading dirs of the path prefixes churn is rolled up by",
+)
+@click.option(
+    "--diffs/--no-diffs",
+    "store_diffs",
+    default=True,
+    help="Store raw diffs - e.g. leave out with --churn-daily, to upload rollups "
+    "instead",
+)
+@click.option(
+    "--date-windows",
+    type=int,
+    default=1,
+    help="Split the start to end date range into this many windows, extracted "
+    "concurrently into subdirs of the output dir - for large backfills",
+)
+@click.option(
+    "--submodules/--no-submodules",
+    default=False,
+    help="Also extract checked out submodules, up to the commits pinned by the "
+    "branch, concurrently - each as its own repo, linked to its parent",
+)
+@click.option(
+    "--max-workers",
+    type=int,
+    required=False,
+    help="Max processes extracting date windows or submodules at once - defaults "
+    "to CPU count",
+)
+@click.option(
+    "--sink",
+    type=click.Choice((FILE_SINK, *SINKS), case_sensitive=False),
+    default=FILE_SINK,
+    help="Where to write records: JSONL files in the output dir, a SQLite database, "
+    "NDJSON to stdout (e.g. to pipe into a loader), or nowhere (to measure "
+    "extraction throughput)",
+)
+@click.option(
+    "--sink-path",
+    required=False,
+    help="Database file for the sqlite sink - created if it doesn't exist, and "
+    "upserted into if it does",
+)
+@click.option(
+    "--resume/--no-resume",
+    default=False,
+    help="Continue an interrupted extract into the same output dir from its "
+    "checkpoint, rather than starting over",
+)
 @click.option("--log-level", **CLI_LOG_LEVEL_OPT_KWARGS)
 @click.option("--log-to-file/--no-log-to-file", required=False, default=True)
 @click.option("--log-to-cloud/--no-log-to-cloud", required=False, default=False)
@@ -116,10 +337,37 @@ def extract() -> str:
 def extract_git(
     connector_id,
     output_dir,
-    branch,
+    branches,
     git_pull_latest,
+    commit_graph,
     ignore_errors,
     use_non_native_repo_db,
+    merge_diffs,
+    first_parent,
+    include_paths,
+    exclude_paths,
+    repo_path_mappings,
+    rename_detection,
+    rename_limit,
+    commit_timeout_sec,
+    hunks,
+    hunk_max_file_lines,
+    hunk_max_commit_lines,
+    commit_cache_path,
+    commit_cache_max_mb,
+    backend,
+    trace_git,
+    compact_users,
+    compact_diffs,
+    churn_daily,
+    churn_path_depth,
+    store_diffs,
+    date_windows,
+    submodules,
+    max_workers,
+    sink,
+    sink_path,
+    resume,
     log_level,
     log_to_file,
     log_to_cloud,
@@ -140,22 +388,70 @@ def extract_git(
 
     if upload and not credentials_file:
         raise ValueError(f"Credentials file required for upload")
+    if upload and resume:
+        raise ValueError(f"Can't resume when uploading, as output goes to a temp dir")
+    if date_windows > 1 and not (start_date and end_date):
+        raise ValueError(f"Start and end dates required for date windows")
+    if date_windows > 1 and commit_cache_path:
+        raise ValueError(f"Commit cache is not supported with date windows")
+    if submodules and (date_windows > 1 or commit_cache_path or sink != FILE_SINK):
+        raise ValueError(
+            f"Submodules are not supported with date windows, the commit cache or "
+            f"sinks other than {FILE_SINK}"
+        )
+    if submodules and (
+        is_clone_url(repo_path) or len(branches) != 1 or is_branch_glob(branches[0])
+    ):
+        raise ValueError(
+            f"Submodules need a local checkout of the repo, and a single branch"
+        )
+    if sink != FILE_SINK and (upload or resume or compact_diffs or date_windows > 1):
+        raise ValueError(
+            f"Upload, resume, compact diffs and date windows need the {FILE_SINK} sink"
+        )
+    if (sink == SQLITE_SINK) != bool(sink_path):
+        raise ValueError(
+            f"--sink-path is required for, and only used by, the {SQLITE_SINK} sink"
+        )
 
     customer_id, _, source_id = tm_id.split_connector_id(connector_id)
 
+    # a single plain branch keeps the single rev spec behaviour, incl. fallback to main
+    if len(branches) == 1 and not is_branch_glob(branches[0]):
+        branch = branches[0]
+    else:
+        branch = list(branches)
+
     while True:
         start_time = time.time()
         temp_dir = None
+        commit_cache = None
 
         if git_pull_latest:
-            update_repo(repo_dir=repo_path, branch=branch)
+            for branch_to_pull in branches:
+                if is_branch_glob(branch_to_pull):
+                    log.info(f"Not pulling branch glob {branch_to_pull}")
+                    continue
+                update_repo(repo_dir=repo_path, branch=branch_to_pull)
+
+        if commit_graph:
+            try:
+                write_commit_graph(repo_dir=repo_path)
+            except RuntimeError:
+                # extraction still works without a commit-graph, just slower
+                log.warning("Could not write commit-graph", exc_info=True)
 
         try:
             if upload:
                 temp_dir = tempfile.TemporaryDirectory()
                 output_dir = temp_dir.name
 
-            ingest_repo_to_jsonl(
+            if commit_cache_path:
+                commit_cache = CommitCache(
+                    commit_cache_path, max_size_bytes=commit_cache_max_mb * 1024 * 1024
+                )
+
+            ingest_kwargs = dict(
                 customer_id=customer_id,
                 source_id=source_id,
                 output_dir=output_dir,
@@ -166,9 +462,56 @@ def extract_git(
                 use_non_native_repo_db=use_non_native_repo_db,
                 start_date=start_date,
                 end_date=end_date,
+                merge_diffs=merge_diffs,
+                first_parent=first_parent,
+                include_paths=include_paths,
+                exclude_paths=exclude_paths,
+                path_repo_names=dict(repo_path_mappings),
+                rename_detection=rename_detection,
+                rename_limit=rename_limit,
+                commit_timeout_sec=commit_timeout_sec,
+                hunks=hunks,
+                hunk_max_file_lines=hunk_max_file_lines,
+                hunk_max_commit_lines=hunk_max_commit_lines,
+                backend=backend,
+                trace_git=trace_git,
+                commit_cache=commit_cache,
+                compact_users=compact_users,
+                compact_diffs=compact_diffs,
+                churn_daily=churn_daily,
+                churn_path_depth=churn_path_depth,
+                store_diffs=store_diffs,
+                resume=resume,
             )
-
-            if upload:
+            window_dirs = None
+            if sink != FILE_SINK:
+                for file_sink_arg in ("output_dir", "compact_diffs", "resume"):
+                    del ingest_kwargs[file_sink_arg]
+                sink_kwargs = dict(path=sink_path) if sink_path else {}
+                ingest_repo_to_sink(
+                    sink=create_sink(sink, **sink_kwargs), **ingest_kwargs
+                )
+            elif submodules:
+                ingest_repo_to_jsonl_with_submodules(
+                    max_workers=max_workers, **ingest_kwargs
+                )
+            elif date_windows > 1:
+                window_dirs = ingest_repo_to_jsonl_in_windows(
+                    num_windows=date_windows, max_workers=max_workers, **ingest_kwargs
+                )
+            else:
+                ingest_repo_to_jsonl(**ingest_kwargs)
+
+            if upload and window_dirs:
+                # each window is uploaded separately, as their files have the same names
+                for window_dir in window_dirs:
+                    upload_dir_to_cc_gcs(
+                        credentials_file,
+                        window_dir,
+                        connector_id=connector_id,
+                        upload_name=os.path.basename(window_dir),
+                    )
+            elif upload:
                 upload_dir_to_cc_gcs(
                     credentials_file,
                     output_dir,
@@ -179,6 +522,8 @@ def extract_git(
         finally:
             if temp_dir:
                 temp_dir.cleanup()
+            if commit_cache:
+                commit_cache.close()
 
         if not repeat_interval_sec or repeat_interval_sec <= 0:
             break
@@ -231,6 +576,73 @@ def upload_data_dir(
     )
 
 
+@upload.command("benchmark")
+@click.option(
+    "--flow",
+    "flows",
+    multiple=True,
+    type=click.Choice(UPLOAD_BENCHMARK_FLOWS, case_sensitive=False),
+    default=UPLOAD_BENCHMARK_FLOWS,
+    help="Upload flow to benchmark - may be repeated. Defaults to all",
+)
+@click.option("--num-files", type=int, default=DEFAULT_UPLOAD_BENCHMARK_NUM_FILES)
+@click.option("--file-size-kb", type=int, default=DEFAULT_UPLOAD_BENCHMARK_FILE_SIZE_KB)
+@click.option(
+    "--max-workers",
+    type=int,
+    default=DEFAULT_UPLOAD_BENCHMARK_MAX_WORKERS,
+    help="Threads uploading at once, for the concurrent flow",
+)
+@click.option(
+    "--resumable-chunk-size-kb",
+    type=int,
+    default=DEFAULT_UPLOAD_BENCHMARK_CHUNK_SIZE_KB,
+    help="Chunk size for the resumable flow - a multiple of 256",
+)
+@click.option(
+    "--api-endpoint",
+    help="GCS emulator to upload to, anonymously - defaults to an in-process fake "
+    "GCS server, so that no network is needed",
+)
+@click.option(
+    "--report-file",
+    help="Write the JSON report to this file, rather than stdout",
+)
+@click.option("--log-level", **CLI_LOG_LEVEL_OPT_KWARGS)
+def upload_benchmark(
+    flows,
+    num_files,
+    file_size_kb,
+    max_workers,
+    resumable_chunk_size_kb,
+    api_endpoint,
+    report_file,
+    log_level,
+) -> str:
+    """Benchmark upload throughput - files / sec and MB / sec for sequential,
+    concurrent and resumable uploads, and uploads writing the completion marker.
+    """
+
+    _setup_logging(
+        log_level, log_to_file=False, log_to_cloud=False, credentials_file=None
+    )
+
+    report = run_upload_benchmark(
+        flows=flows,
+        num_files=num_files,
+        file_size_kb=file_size_kb,
+        max_workers=max_workers,
+        resumable_chunk_size_kb=resumable_chunk_size_kb,
+        api_endpoint=api_endpoint,
+    )
+
+    if report_file:
+        srsly.write_json(report_file, report)
+        log.info(f"Upload benchmark report written to {report_file}")
+    else:
+        print(srsly.json_dumps(report, indent=2))
+
+
 @cli.group("update")
 def update() -> str:
     """Update a resource"""
@@ -258,6 +670,205 @@ def update_local_git(log_level, log_to_file, branch, repo_path) -> str:
     update_repo(repo_dir=repo_path, branch=branch)
 
 
+@cli.group("maintain")
+def maintain() -> str:
+    """Maintain a resource, e.g. to speed up extraction"""
+    pass
+
+
+@maintain.command("git-repo")
+@click.argument("repo_path")
+@click.option(
+    "--changed-paths/--no-changed-paths",
+    default=True,
+    help="Also write changed-path Bloom filters, for path-limited history",
+)
+@click.option("--log-level", **CLI_LOG_LEVEL_OPT_KWARGS)
+@click.option("--log-to-file/--no-log-to-file", required=False, default=False)
+def maintain_local_git(changed_paths, log_level, log_to_file, repo_path) -> str:
+    """Write or refresh the commit-graph of a git repo clone, so that history
+    walks read it instead of parsing commit objects. Cheap to re-run after pulls.
+
+    REPO_PATH   - the file system path to repo to maintain
+    """
+
+    _setup_logging(log_level, log_to_file, log_to_cloud=False, credentials_file=None)
+
+    write_commit_graph(repo_dir=repo_path, changed_paths=changed_paths)
+
+
+@cli.group("hook")
+def hook() -> str:
+    """git server hooks, for extracting pushes as they arrive"""
+    pass
+
+
+@hook.command("post-receive")
+@click.option("--connector-id", required=True, help="CC connector identifier")
+@click.option("--credentials-file", help="Upload extracted pushes with these")
+@click.option(
+    "--output-dir",
+    help="Keep extracted pushes in this dir, rather than uploading them",
+)
+@click.option("--forced-repo-name", help="Defaults to the repo dir name, less .git")
+@click.option(
+    "--repo-path",
+    default=".",
+    help="Repo the hook runs for - git runs hooks in the repo dir",
+)
+@click.option(
+    "--queue-dir",
+    help=f"Defaults to the {push_hook.DEFAULT_QUEUE_DIR_NAME} dir in the repo",
+)
+@click.option(
+    "--background/--foreground",
+    default=True,
+    help="Process queued pushes in a detached worker, so the push isn't held up",
+)
+@click.option("--log-level", **CLI_LOG_LEVEL_OPT_KWARGS)
+def hook_post_receive(
+    connector_id,
+    credentials_file,
+    output_dir,
+    forced_repo_name,
+    repo_path,
+    queue_dir,
+    background,
+    log_level,
+) -> str:
+    """Queue the commits of a push for extraction, reading git's post-receive
+    "<old> <new> <ref>" lines from stdin. Install as, or call from, the hooks/
+    post-receive script of a repo on a git server.
+    """
+    if bool(credentials_file) == bool(output_dir):
+        raise ValueError(f"One of credentials file or output dir required")
+
+    _setup_logging(
+        log_level, log_to_file=False, log_to_cloud=False, credentials_file=None
+    )
+
+    repo_path = os.path.abspath(repo_path)
+    queue_dir = queue_dir or os.path.join(repo_path, push_hook.DEFAULT_QUEUE_DIR_NAME)
+    for old, new, ref in push_hook.parse_post_receive_lines(sys.stdin):
+        push_hook.enqueue_push(
+            queue_dir,
+            dict(
+                repo_path=repo_path,
+                old=old,
+                new=new,
+                ref=ref,
+                connector_id=connector_id,
+                forced_repo_name=forced_repo_name
+                or push_hook.default_repo_name(repo_path),
+                credentials_file=credentials_file and os.path.abspath(credentials_file),
+                output_dir=output_dir and os.path.abspath(output_dir),
+            ),
+        )
+
+    if background:
+        push_hook.start_queue_worker(queue_dir, log_level=log_level)
+    else:
+        push_hook.process_queue(queue_dir)
+
+
+@hook.command("process-queue")
+@click.option("--log-level", **CLI_LOG_LEVEL_OPT_KWARGS)
+@click.option("--log-to-file/--no-log-to-file", required=False, default=False)
+@click.argument("queue_dir")
+def hook_process_queue(log_level, log_to_file, queue_dir) -> str:
+    """Extract pushes queued by hooks, until the queue is empty - run by the hooks,
+    or to retry jobs moved back from the failed dir.
+
+    QUEUE_DIR   - the queue dir of a repo
+    """
+
+    _setup_logging(log_level, log_to_file, log_to_cloud=False, credentials_file=None)
+
+    push_hook.process_queue(queue_dir)
+
+
+@cli.command("benchmark")
+@click.option("--branch", default="master", help="Branch / rev spec to sample")
+@click.option(
+    "--max-commits",
+    type=int,
+    default=DEFAULT_BENCHMARK_MAX_COMMITS,
+    help="Number of most recent commits to extract",
+)
+@click.option(
+    "--sink",
+    "sink_names",
+    multiple=True,
+    type=click.Choice(BENCHMARK_SINKS, case_sensitive=False),
+    default=BENCHMARK_SINKS,
+    help="Sink to extract to - may be repeated, for a run per sink. Defaults to all",
+)
+@click.option(
+    "--backend",
+    type=click.Choice(list(GIT_BACKENDS), case_sensitive=False),
+    default=GITPYTHON_BACKEND,
+)
+@click.option(
+    "--merge-diffs",
+    type=click.Choice(MERGE_DIFF_STRATEGIES, case_sensitive=False),
+    default=MERGE_DIFFS_FIRST_PARENT,
+)
+@click.option("--first-parent/--no-first-parent", default=False)
+@click.option(
+    "--rename-detection",
+    type=click.Choice(RENAME_DETECTION_MODES, case_sensitive=False),
+    default=RENAME_DETECTION_ON,
+)
+@click.option("--hunks/--no-hunks", default=False)
+@click.option(
+    "--report-file",
+    help="Write the JSON report to this file, rather than stdout",
+)
+@click.option("--log-level", **CLI_LOG_LEVEL_OPT_KWARGS)
+@click.option("--log-to-file/--no-log-to-file", required=False, default=False)
+@click.argument("repo_path")
+def benchmark(
+    branch,
+    max_commits,
+    sink_names,
+    backend,
+    merge_diffs,
+    first_parent,
+    rename_detection,
+    hunks,
+    report_file,
+    log_level,
+    log_to_file,
+    repo_path,
+) -> str:
+    """Benchmark extraction of a repo with the given engine options - reports
+    commits / diffs per sec, peak RSS, output bytes per commit and time per phase
+    as JSON, with no repo content, e.g. to share when extraction is slow.
+
+    REPO_PATH   - the file system path to repo to benchmark
+    """
+
+    _setup_logging(log_level, log_to_file, log_to_cloud=False, credentials_file=None)
+
+    report = run_benchmark(
+        repo_path,
+        branch,
+        sink_names=sink_names,
+        max_commits=max_commits,
+        backend=backend,
+        merge_diffs=merge_diffs,
+        first_parent=first_parent,
+        rename_detection=rename_detection,
+        hunks=hunks,
+    )
+
+    if report_file:
+        srsly.write_json(report_file, report)
+        log.info(f"Benchmark report written to {report_file}")
+    else:
+        print(srsly.json_dumps(report, indent=2))
+
+
 # --- setup / admin stuff ---
 
 
@@ -45,3 +45,12 @@ def date_parameter_option(param_desc, required=False):
         required=required,
         help=f"{param_desc} as yyyy-dd-mm, integer days offset from today, or one of 'yesterday, today, tomorrow'",
     )
+
+
+def path_mapping_parameter(value):
+    """Parse a path prefix to name mapping, given as PREFIX=NAME"""
+    prefix, sep, name = value.partition("=")
+    if not sep or not prefix.strip("/ ") or not name.strip():
+        raise ValueError(f"Argument {value} should be a mapping, as PREFIX=NAME")
+
+    return prefix.strip(), name.strip()
@@ -0,0 +1,187 @@
+import fcntl
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import git
+import srsly
+from coco_agent.remote.transfer import upload_dir_to_cc_gcs
+from coco_agent.services import tm_id
+from coco_agent.services.git import ingest_repo_to_jsonl
+
+log = logging.getLogger(__name__)
+
+ZERO_HEXSHA = "0" * 40
+DEFAULT_QUEUE_DIR_NAME = "coco-agent-queue"
+PENDING_DIR_NAME = "pending"
+FAILED_DIR_NAME = "failed"
+WORKER_LOCK_FILE_NAME = "worker.lock"
+
+
+def parse_post_receive_lines(lines):
+    """
+    (old, new, ref) updates from the "<old> <new> <ref>" lines git passes to a
+    post-receive hook on stdin - ref deletions are skipped, as there's nothing to
+    extract
+    """
+    updates = []
+    for line in lines:
+        if not line.strip():
+            continue
+        old, new, ref = line.split()
+        if new == ZERO_HEXSHA:
+            log.debug(f"Skipping deleted ref {ref}")
+            continue
+        updates.append((old, new, ref))
+    return updates
+
+
+def default_repo_name(repo_path):
+    """Name of a repo on a git server, from its dir - e.g. project.git -> project"""
+    name = os.path.basename(os.path.abspath(repo_path).rstrip(os.sep))
+    return name[: -len(".git")] if name.endswith(".git") else name
+
+
+def push_rev_range(repo, old, new, ref):
+    """
+    Rev spec of the commits a push added to ref - old..new for an updated ref. A new
+    ref is taken to branch off HEAD, so its commits are those since its merge base
+    with HEAD - or all of them, if it is HEAD's branch or has no common history.
+    """
+    if old != ZERO_HEXSHA:
+        return f"{old}..{new}"
+
+    try:
+        if repo.git.symbolic_ref("HEAD") == ref:
+            return new
+        merge_base = repo.git.merge_base("HEAD", new)
+    except git.GitCommandError:
+        return new
+    return f"{merge_base}..{new}"
+
+
+def enqueue_push(queue_dir, job):
+    """
+    Queue a push for extraction by the worker - job files are named so that they
+    sort in the order queued, and written atomically, so the worker only ever sees
+    complete jobs
+    """
+    pending_dir = os.path.join(queue_dir, PENDING_DIR_NAME)
+    os.makedirs(pending_dir, exist_ok=True)
+
+    job_name = f"{time.time_ns():020d}-{job['new'][:12]}.json"
+    tmp_path = os.path.join(queue_dir, f".{job_name}.tmp")
+    srsly.write_json(tmp_path, job)
+    os.replace(tmp_path, os.path.join(pending_dir, job_name))
+    return job_name
+
+
+def start_queue_worker(queue_dir, log_level="info"):
+    """
+    Start a worker for the queue, detached from the hook so that the push isn't
+    held up - it runs in the queue dir, where it also logs to.
+
+    git's environment is dropped, e.g. GIT_DIR, which is relative to the hook's
+    working dir - jobs carry the absolute repo path instead.
+    """
+    env = {k: v for k, v in os.environ.items() if not k.startswith("GIT_")}
+    subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "coco_agent.remote.cli.__init__",
+            "hook",
+            "process-queue",
+            f"--log-level={log_level}",
+            "--log-to-file",
+            os.path.abspath(queue_dir),
+        ],
+        cwd=queue_dir,
+        env=env,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
+def process_push_job(job, job_name):
+    """Extract the commits of a queued push, then upload them or keep them locally"""
+    customer_id, _, source_id = tm_id.split_connector_id(job["connector_id"])
+    repo = git.Repo(job["repo_path"])
+    rev = push_rev_range(repo, job["old"], job["new"], job["ref"])
+    log.info(f"Extracting {rev} for push to {job['ref']} of {job['repo_path']}")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output_dir = (
+            os.path.join(job["output_dir"], os.path.splitext(job_name)[0])
+            if job.get("output_dir")
+            else temp_dir
+        )
+        ingest_repo_to_jsonl(
+            customer_id,
+            source_id,
+            job["repo_path"],
+            rev,
+            output_dir=output_dir,
+            fall_back_from_master_to_main=False,
+            forced_repo_name=job["forced_repo_name"],
+        )
+
+        if job.get("credentials_file"):
+            upload_dir_to_cc_gcs(
+                job["credentials_file"],
+                output_dir,
+                connector_id=job["connector_id"],
+                upload_name=os.path.splitext(job_name)[0],
+            )
+
+
+def _pending_jobs(queue_dir):
+    pending_dir = os.path.join(queue_dir, PENDING_DIR_NAME)
+    if not os.path.isdir(pending_dir):
+        return []
+    return sorted(f for f in os.listdir(pending_dir) if f.endswith(".json"))
+
+
+def process_queue(queue_dir):
+    """
+    Process queued pushes in order until none are left. Only one worker processes a
+    queue at a time - others exit straight away, leaving the jobs to it.
+
+    Jobs that fail are moved aside to the failed dir, for inspection or requeueing.
+    Returns the number of jobs processed.
+    """
+    num_jobs = 0
+    lock_path = os.path.join(queue_dir, WORKER_LOCK_FILE_NAME)
+
+    # a job queued as the worker releases the lock is picked up by checking again
+    while _pending_jobs(queue_dir):
+        with open(lock_path, "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                log.info(f"Queue {queue_dir} is being processed by another worker")
+                break
+
+            while True:
+                job_names = _pending_jobs(queue_dir)
+                if not job_names:
+                    break
+
+                job_path = os.path.join(queue_dir, PENDING_DIR_NAME, job_names[0])
+                try:
+                    process_push_job(srsly.read_json(job_path), job_names[0])
+                    os.remove(job_path)
+                except Exception:
+                    log.exception(f"Failed to process queued push {job_names[0]}")
+                    failed_dir = os.path.join(queue_dir, FAILED_DIR_NAME)
+                    os.makedirs(failed_dir, exist_ok=True)
+                    os.replace(job_path, os.path.join(failed_dir, job_names[0]))
+                num_jobs += 1
+
+    log.info(f"Processed {num_jobs} queued push(es)")
+    return num_jobs
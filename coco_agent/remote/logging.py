@@ -1,15 +1,31 @@
+import atexit
+import functools
+import gzip
 import json
 import logging
+import logging.handlers
+import multiprocessing.util
+import os
+import queue
+import shutil
 import sys
 import threading
+from datetime import datetime, timezone
 
 import coco_agent
 import google.cloud.logging
 from google.cloud.logging.handlers import CloudLoggingHandler
+from google.cloud.logging.handlers.transports import Transport
 from google.oauth2.service_account import Credentials
 
 DEFAULT_LOG_FILE_NAME = "coco-agent"
+DEFAULT_LOG_FILE_MAX_BYTES = 20 * 1024 * 1024
+DEFAULT_LOG_FILE_BACKUP_COUNT = 5
+DEFAULT_LOG_QUEUE_SIZE = 10000
 DEFAULT_CLOUD_LOGGING_HANDLER_NAME = "coco-agent"
+DEFAULT_CLOUD_LOG_QUEUE_SIZE = 1000
+DEFAULT_CLOUD_LOG_BATCH_SIZE = 50
+DEFAULT_CLOUD_LOG_GRACE_PERIOD_SEC = 5
 LOG_FORMAT = (
     "%(asctime)s.%(msecs)03d %(filename)s:%(lineno)d %(levelname)s: %(message)s"
 )
@@ -47,10 +63,165 @@ def install_thread_excepthook():
     threading.Thread.__init__ = init
 
 
-def set_up_cloud_logging(
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queues log records for a listener thread to write, so that logging never
+    blocks the caller on I/O - records are dropped while the queue is full, and
+    the number dropped logged once there is room again
+    """
+
+    def __init__(self, queue_):
+        super().__init__(queue_)
+        self.num_dropped = 0
+        self._num_unreported = 0
+
+    def enqueue(self, record):
+        if self._num_unreported:
+            try:
+                self.queue.put_nowait(
+                    logging.makeLogRecord(
+                        {
+                            "name": record.name,
+                            "levelno": logging.WARNING,
+                            "levelname": logging.getLevelName(logging.WARNING),
+                            "msg": f"Dropped {self._num_unreported} log record(s) "
+                            "- log queue full",
+                        }
+                    )
+                )
+                self._num_unreported = 0
+            except queue.Full:
+                pass
+
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.num_dropped += 1
+            self._num_unreported += 1
+
+
+class QueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # block until there's room, rather than failing on a full queue
+        self.queue.put(self._sentinel)
+
+
+class BoundedBackgroundThreadTransport(Transport):
+    """
+    Cloud logging transport sending entries in batches from a thread of its own, fed
+    by a bounded queue - entries are dropped while the queue is full, rather than
+    buffered without limit when cloud logging is slow or unreachable
+    """
+
+    _sentinel = None
+
+    def __init__(
+        self,
+        client,
+        name,
+        max_queue_size=DEFAULT_CLOUD_LOG_QUEUE_SIZE,
+        batch_size=DEFAULT_CLOUD_LOG_BATCH_SIZE,
+        grace_period_sec=DEFAULT_CLOUD_LOG_GRACE_PERIOD_SEC,
+        **kwargs,
+    ):
+        super().__init__(client, name, **kwargs)
+        self.cloud_logger = client.logger(name, **kwargs)
+        self.batch_size = batch_size
+        self.grace_period_sec = grace_period_sec
+        self.num_dropped = 0
+        self.queue = queue.Queue(max_queue_size)
+        self._thread = threading.Thread(
+            target=self._send_batches, name="coco-agent-cloud-logging", daemon=True
+        )
+        self._thread.start()
+
+    def send(self, record, message, labels=None, **kwargs):
+        labels = dict(labels or {})
+        if record.name:
+            labels.setdefault("python_logger", record.name)
+        entry = dict(
+            message=message,
+            severity=record.levelname,
+            timestamp=datetime.fromtimestamp(record.created, timezone.utc),
+            labels=labels,
+            **kwargs,
+        )
+        try:
+            self.queue.put_nowait(entry)
+        except queue.Full:
+            self.num_dropped += 1
+
+    def _send_batches(self):
+        done = False
+        while not done:
+            entries = [self.queue.get()]
+            while len(entries) < self.batch_size:
+                try:
+                    entries.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            batch = self.cloud_logger.batch()
+            for entry in entries:
+                if entry is self._sentinel:
+                    done = True
+                else:
+                    batch.log(**entry)
+            try:
+                if batch.entries:
+                    batch.commit()
+            except Exception as e:
+                # not logged, as that would queue another entry for cloud logging
+                print(
+                    f"Failed to send {len(batch.entries)} log entries: {e}",
+                    file=sys.stderr,
+                )
+            for _ in entries:
+                self.queue.task_done()
+
+    def flush(self):
+        if self._thread.is_alive():
+            self.queue.join()
+
+    def close(self):
+        """Send queued entries, waiting up to the grace period, and stop"""
+        if not self._thread.is_alive():
+            return
+        try:
+            self.queue.put(self._sentinel, timeout=self.grace_period_sec)
+        except queue.Full:
+            return
+        self._thread.join(timeout=self.grace_period_sec)
+
+
+def _gzip_namer(name):
+    return f"{name}.gz"
+
+
+def _gzip_rotator(source, dest):
+    with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+def create_rotating_file_handler(
+    path,
+    max_bytes=DEFAULT_LOG_FILE_MAX_BYTES,
+    backup_count=DEFAULT_LOG_FILE_BACKUP_COUNT,
+):
+    """File handler rotating the log at max_bytes, keeping backups gzipped"""
+    handler = logging.handlers.RotatingFileHandler(
+        path, maxBytes=max_bytes, backupCount=backup_count
+    )
+    handler.namer = _gzip_namer
+    handler.rotator = _gzip_rotator
+    return handler
+
+
+def create_cloud_logging_handler(
     credentials_file_path,
-    module,
     cloud_logging_handler_name=DEFAULT_CLOUD_LOGGING_HANDLER_NAME,
+    max_queue_size=DEFAULT_CLOUD_LOG_QUEUE_SIZE,
 ):
     with open(credentials_file_path) as f:
         sa_info_creds = json.load(f)
@@ -58,9 +229,86 @@ def set_up_cloud_logging(
     credentials = Credentials.from_service_account_info(sa_info_creds)
     client = google.cloud.logging.Client(credentials=credentials)
 
-    handler = CloudLoggingHandler(client, name=cloud_logging_handler_name)
-    logger = logging.getLogger(module)
-    logger.addHandler(handler)
+    return CloudLoggingHandler(
+        client,
+        name=cloud_logging_handler_name,
+        transport=functools.partial(
+            BoundedBackgroundThreadTransport, max_queue_size=max_queue_size
+        ),
+    )
+
+
+def _queue_handlers():
+    return [
+        handler
+        for handler in logging.getLogger().handlers
+        if isinstance(handler, DroppingQueueHandler)
+    ]
+
+
+def _restart_listener_in_child(queue_handler, listener):
+    # the listener thread doesn't survive forking into a worker process, and the
+    # queue may have been forked mid-operation - so start afresh with a new one.
+    # Only the parent rotates the log file, as the processes share it
+    queue_handler.queue = listener.queue = queue.Queue(queue_handler.queue.maxsize)
+    listener._thread = None
+    for handler in listener.handlers:
+        if isinstance(handler, logging.handlers.RotatingFileHandler):
+            handler.maxBytes = 0
+    listener.start()
+    # atexit handlers don't run in multiprocessing workers, its finalizers do
+    multiprocessing.util.Finalize(
+        listener,
+        functools.partial(_stop_listener, queue_handler, listener),
+        exitpriority=0,
+    )
+
+
+def _restart_queued_logging_in_child(_):
+    for queue_handler in _queue_handlers():
+        _restart_listener_in_child(queue_handler, queue_handler.listener)
+
+
+def _stop_listener(queue_handler, listener):
+    if listener._thread is None:
+        return
+
+    num_dropped = queue_handler.num_dropped
+    for handler in listener.handlers:
+        transport = getattr(handler, "transport", None)
+        num_dropped += getattr(transport, "num_dropped", 0)
+    if num_dropped:
+        listener.handle(
+            logging.makeLogRecord(
+                {
+                    "name": coco_agent.__name__,
+                    "levelno": logging.WARNING,
+                    "levelname": logging.getLevelName(logging.WARNING),
+                    "msg": f"Dropped {num_dropped} log record(s) in total",
+                }
+            )
+        )
+    listener.stop()
+    for handler in listener.handlers:
+        # console handlers go back to the root logger
+        if handler not in queue_handler.console_handlers:
+            handler.close()
+
+
+def stop_queued_logging():
+    """
+    Write out queued log records and stop the listener, if logging is queued -
+    console handlers go back to the root logger
+    """
+    root_logger = logging.getLogger()
+    for queue_handler in _queue_handlers():
+        root_logger.removeHandler(queue_handler)
+        _stop_listener(queue_handler, queue_handler.listener)
+        for handler in queue_handler.console_handlers:
+            root_logger.addHandler(handler)
+
+
+_queued_logging_hooks_registered = False
 
 
 def apply_log_config(
@@ -70,7 +318,16 @@ def apply_log_config(
     log_to_cloud=False,
     credentials_file_path=None,
     module=coco_agent.__name__,
+    log_file_max_bytes=DEFAULT_LOG_FILE_MAX_BYTES,
+    log_file_backup_count=DEFAULT_LOG_FILE_BACKUP_COUNT,
+    max_queue_size=DEFAULT_LOG_QUEUE_SIZE,
 ):
+    """
+    Configure logging for module - all output, incl. the console's, is done by a
+    listener thread, fed by a bounded queue on the root logger, so that it never
+    holds up the code logging. Files and cloud logging only get module's records.
+    """
+    global _queued_logging_hooks_registered
     log_level_str = log_level_str.strip().upper()
 
     if not hasattr(logging, log_level_str):
@@ -82,15 +339,50 @@ def apply_log_config(
     log_level = getattr(logging, log_level_str)
     log_formatter = logging.Formatter(LOG_FORMAT, datefmt=LOG_DATE_FORMAT)
 
-    logger = logging.getLogger(module)
-    logger.setLevel(log_level)
+    logging.getLogger(module).setLevel(log_level)
+    stop_queued_logging()
 
+    handlers = []
     if log_to_file:
         log_path = "."
         file_name = log_file_name
-        file_handler = logging.FileHandler(f"{log_path}/{file_name}.log")
+        file_handler = create_rotating_file_handler(
+            f"{log_path}/{file_name}.log",
+            max_bytes=log_file_max_bytes,
+            backup_count=log_file_backup_count,
+        )
         file_handler.setFormatter(log_formatter)
-        logger.addHandler(file_handler)
+        handlers.append(file_handler)
 
     if log_to_cloud:
-        set_up_cloud_logging(credentials_file_path, module)
+        handlers.append(create_cloud_logging_handler(credentials_file_path))
+
+    module_filter = logging.Filter(module)
+    for handler in handlers:
+        handler.addFilter(module_filter)
+
+    # e.g. stderr, from basicConfig - moved behind the listener
+    root_logger = logging.getLogger()
+    console_handlers = list(root_logger.handlers)
+    for handler in console_handlers:
+        root_logger.removeHandler(handler)
+
+    queue_handler = DroppingQueueHandler(queue.Queue(max_queue_size))
+    queue_handler.console_handlers = console_handlers
+    listener = QueueListener(
+        queue_handler.queue,
+        *console_handlers,
+        *handlers,
+        respect_handler_level=True,
+    )
+    queue_handler.listener = listener
+    listener.start()
+    root_logger.addHandler(queue_handler)
+
+    if not _queued_logging_hooks_registered:
+        # once, for whichever listener is running at exit or fork
+        atexit.register(stop_queued_logging)
+        multiprocessing.util.register_after_fork(
+            _restart_queued_logging_in_child, _restart_queued_logging_in_child
+        )
+        _queued_logging_hooks_registered = True
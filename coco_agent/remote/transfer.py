@@ -18,11 +18,14 @@ def _bucket_name_from_customer_id(customer_id):
     return f"cc-upload-{encoded}"
 
 
-def upload_dir_to_cc_gcs(credentials_file_path, dir_, connector_id):
+def upload_dir_to_cc_gcs(credentials_file_path, dir_, connector_id, upload_name=None):
+    """upload_name distinguishes uploads of one extract, e.g. date window shards"""
     customer_id, source_type, source_id = tm_id.split_connector_id(connector_id)
 
     bucket_name = _bucket_name_from_customer_id(customer_id)
     bucket_subpath = f"uploads/{source_type}/{source_id}/{datetime.utcnow().strftime('%y%m%d.%H%M%S')}"
+    if upload_name:
+        bucket_subpath += f"/{upload_name}"
 
     return upload_dir_to_gcs(
         credentials_file_path=credentials_file_path,
@@ -39,12 +42,15 @@ def upload_dir_to_gcs(
     bucket_name,
     bucket_subpath=None,
     write_complete_marker=False,
+    gcs=None,
 ):
+    """gcs is a GCSClient to upload with, rather than one for credentials_file_path"""
     bucket_subpath = (bucket_subpath.strip("/") + "/") if bucket_subpath else ""
 
-    with open(credentials_file_path) as f:
-        sa_info_creds = json.load(f)
-    gcs = GCSClient(sa_info_creds)
+    if gcs is None:
+        with open(credentials_file_path) as f:
+            sa_info_creds = json.load(f)
+        gcs = GCSClient(sa_info_creds)
 
     # files = [f for f in os.listdir(dir_) if os.path.isfile(os.path.join(dir_, f))]
     source_files = [
@@ -0,0 +1,162 @@
+import concurrent.futures
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from coco_agent.remote.transfer import upload_dir_to_gcs
+from coco_agent.services.fake_gcs import FakeGCSServer
+from coco_agent.services.gcs import GCSClient
+
+log = logging.getLogger(__name__)
+
+BENCHMARK_BUCKET_NAME = "cc-upload-benchmark"
+DEFAULT_UPLOAD_BENCHMARK_NUM_FILES = 50
+DEFAULT_UPLOAD_BENCHMARK_FILE_SIZE_KB = 1024
+DEFAULT_UPLOAD_BENCHMARK_MAX_WORKERS = 8
+DEFAULT_UPLOAD_BENCHMARK_CHUNK_SIZE_KB = 1024
+
+# upload flows benchmarked:
+# - sequential: upload_dir_to_gcs, as extracts are uploaded
+# - marker: as sequential, also writing the upload complete marker
+# - concurrent: files uploaded by a pool of threads, each with its own client
+# - resumable: files uploaded one by one in resumable chunks
+FLOW_SEQUENTIAL = "sequential"
+FLOW_MARKER = "marker"
+FLOW_CONCURRENT = "concurrent"
+FLOW_RESUMABLE = "resumable"
+UPLOAD_BENCHMARK_FLOWS = (
+    FLOW_SEQUENTIAL,
+    FLOW_MARKER,
+    FLOW_CONCURRENT,
+    FLOW_RESUMABLE,
+)
+
+
+def write_benchmark_files(dir_, num_files, file_size_bytes):
+    """Files of random bytes to upload, in dir_ - returns their paths"""
+    paths = []
+    for i in range(num_files):
+        path = os.path.join(dir_, f"benchmark-{i:05d}.bin")
+        with open(path, "wb") as f:
+            f.write(os.urandom(file_size_bytes))
+        paths.append(path)
+    return paths
+
+
+def _upload_concurrently(api_endpoint, paths, subpath, max_workers):
+    local = threading.local()
+
+    def upload_file(path):
+        if not hasattr(local, "gcs"):
+            local.gcs = GCSClient(api_endpoint=api_endpoint)
+        local.gcs.write_file(
+            path,
+            BENCHMARK_BUCKET_NAME,
+            bucket_file_name=f"{subpath}/{os.path.basename(path)}",
+            skip_bucket_check=True,
+        )
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(upload_file, paths))
+
+
+def benchmark_upload_flow(
+    flow, api_endpoint, dir_, paths, max_workers, resumable_chunk_size
+):
+    gcs = GCSClient(api_endpoint=api_endpoint)
+    subpath = f"benchmark/{flow}"
+
+    start_time = time.perf_counter()
+    if flow in (FLOW_SEQUENTIAL, FLOW_MARKER):
+        upload_dir_to_gcs(
+            None,
+            dir_,
+            BENCHMARK_BUCKET_NAME,
+            bucket_subpath=subpath,
+            write_complete_marker=flow == FLOW_MARKER,
+            gcs=gcs,
+        )
+    elif flow == FLOW_CONCURRENT:
+        _upload_concurrently(api_endpoint, paths, subpath, max_workers)
+    elif flow == FLOW_RESUMABLE:
+        for path in paths:
+            gcs.write_file(
+                path,
+                BENCHMARK_BUCKET_NAME,
+                bucket_file_name=f"{subpath}/{os.path.basename(path)}",
+                skip_bucket_check=True,
+                resumable_chunk_size=resumable_chunk_size,
+            )
+    else:
+        raise ValueError(f"Unknown upload flow: {flow}")
+    total_sec = time.perf_counter() - start_time
+
+    num_bytes = sum(os.path.getsize(path) for path in paths)
+    return {
+        "flow": flow,
+        "files": len(paths),
+        "bytes": num_bytes,
+        "total_sec": round(total_sec, 3),
+        "files_per_sec": round(len(paths) / max(total_sec, 1e-9), 1),
+        "mb_per_sec": round(num_bytes / 1024 / 1024 / max(total_sec, 1e-9), 1),
+    }
+
+
+def run_upload_benchmark(
+    flows=UPLOAD_BENCHMARK_FLOWS,
+    num_files=DEFAULT_UPLOAD_BENCHMARK_NUM_FILES,
+    file_size_kb=DEFAULT_UPLOAD_BENCHMARK_FILE_SIZE_KB,
+    max_workers=DEFAULT_UPLOAD_BENCHMARK_MAX_WORKERS,
+    resumable_chunk_size_kb=DEFAULT_UPLOAD_BENCHMARK_CHUNK_SIZE_KB,
+    api_endpoint=None,
+):
+    """
+    Benchmark uploading num_files files of file_size_kb in each of flows - to a
+    GCS emulator at api_endpoint, anonymously, or by default to an in-process
+    FakeGCSServer, so that it runs without network
+    """
+    if resumable_chunk_size_kb % 256:
+        raise ValueError("Resumable chunk size must be a multiple of 256 KB")
+    for flow in flows:
+        if flow not in UPLOAD_BENCHMARK_FLOWS:
+            raise ValueError(f"Unknown upload flow: {flow}")
+
+    server = None
+    if not api_endpoint:
+        server = FakeGCSServer().start()
+        api_endpoint = server.url
+
+    try:
+        with tempfile.TemporaryDirectory() as dir_:
+            paths = write_benchmark_files(dir_, num_files, file_size_kb * 1024)
+
+            runs = []
+            for flow in flows:
+                log.info(f"Benchmarking {flow} upload of {num_files} file(s)")
+                run = benchmark_upload_flow(
+                    flow,
+                    api_endpoint,
+                    dir_,
+                    paths,
+                    max_workers=max_workers,
+                    resumable_chunk_size=resumable_chunk_size_kb * 1024,
+                )
+                log.info(
+                    f"{flow} upload: {run['files_per_sec']} files/sec, "
+                    f"{run['mb_per_sec']} MB/sec"
+                )
+                runs.append(run)
+    finally:
+        if server is not None:
+            server.stop()
+
+    return {
+        "api_endpoint": "fake" if server is not None else api_endpoint,
+        "num_files": num_files,
+        "file_size_kb": file_size_kb,
+        "max_workers": max_workers,
+        "resumable_chunk_size_kb": resumable_chunk_size_kb,
+        "runs": runs,
+    }
@@ -0,0 +1,142 @@
+import concurrent.futures
+import logging
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+
+import coco_agent
+import git
+
+from . import sinks
+from .git import (
+    PHASE_COMMITS,
+    PHASE_DIFFS,
+    PHASE_WALK,
+    JsonlFileSink,
+    ingest_repo_to_sink,
+)
+
+log = logging.getLogger(__name__)
+
+BENCHMARK_SINKS = (sinks.NULL_SINK, sinks.FILE_SINK)
+DEFAULT_BENCHMARK_MAX_COMMITS = 1000
+# ids for the records extracted - they're discarded, so needn't be real
+BENCHMARK_CUSTOMER_ID = "benchmark"
+BENCHMARK_SOURCE_ID = "benchmark"
+BENCHMARK_REPO_NAME = "benchmark"
+PHASE_WRITE = "write"
+PHASE_OTHER = "other"
+
+
+def _peak_rss_mb(who=resource.RUSAGE_SELF):
+    max_rss = resource.getrusage(who).ru_maxrss
+    # kB on Linux, bytes on macOS
+    return max_rss / 1024 / (1024 if sys.platform == "darwin" else 1)
+
+
+def benchmark_run(repo_path, branch, sink_name, max_commits, extractor_kwargs):
+    """
+    Extract the most recent max_commits of branch to a null or JSONL file sink, in a
+    temp dir discarded afterwards - returns throughput, memory and phase timings,
+    without any repo content
+    """
+    with tempfile.TemporaryDirectory() as output_dir:
+        if sink_name == sinks.FILE_SINK:
+            sink = JsonlFileSink(
+                BENCHMARK_CUSTOMER_ID,
+                BENCHMARK_SOURCE_ID,
+                output_dir,
+                checkpoint_params={},
+            )
+        else:
+            sink = sinks.create_sink(sink_name)
+
+        start_time = time.perf_counter()
+        stats = ingest_repo_to_sink(
+            BENCHMARK_CUSTOMER_ID,
+            BENCHMARK_SOURCE_ID,
+            repo_path,
+            branch,
+            sink,
+            forced_repo_name=BENCHMARK_REPO_NAME,
+            max_commits=max_commits,
+            **extractor_kwargs,
+        )
+        total_sec = time.perf_counter() - start_time
+
+    # records are written between commits, outside of the extractor's phases
+    phase_sec = {
+        PHASE_WALK: stats["phase_sec"].get(PHASE_WALK, 0.0),
+        PHASE_DIFFS: stats["phase_sec"].get(PHASE_DIFFS, 0.0),
+        PHASE_COMMITS: stats["phase_sec"].get(PHASE_COMMITS, 0.0),
+        PHASE_WRITE: sink.write_sec,
+    }
+    phase_sec[PHASE_OTHER] = max(0.0, total_sec - sum(phase_sec.values()))
+
+    num_commits = stats["commits"]
+    return {
+        "sink": sink_name,
+        "commits": num_commits,
+        "diffs": stats["diffs"],
+        "commits_diffs_skipped": stats["commits_diffs_skipped"],
+        "total_sec": round(total_sec, 3),
+        "commits_per_sec": round(num_commits / max(total_sec, 1e-9), 1),
+        "diffs_per_sec": round(stats["diffs"] / max(total_sec, 1e-9), 1),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "git_peak_rss_mb": round(_peak_rss_mb(resource.RUSAGE_CHILDREN), 1),
+        "output_bytes": sink.num_bytes,
+        "output_bytes_per_commit": round(sink.num_bytes / max(num_commits, 1), 1),
+        "phase_sec": {phase: round(sec, 3) for phase, sec in phase_sec.items()},
+    }
+
+
+def run_benchmark(
+    repo_path,
+    branch,
+    sink_names=BENCHMARK_SINKS,
+    max_commits=DEFAULT_BENCHMARK_MAX_COMMITS,
+    **extractor_kwargs,
+):
+    """
+    Benchmark extraction of a repo - the most recent max_commits of branch, once per
+    sink. extractor_kwargs are engine options for GitRepoExtractor, e.g. backend.
+
+    Each run is in a fresh process, so that its peak RSS is its own. The report
+    only has timings, counts and options, so can be shared without the repo.
+    """
+    runs = []
+    for sink_name in sink_names:
+        if sink_name not in BENCHMARK_SINKS:
+            raise ValueError(f"Unsupported sink for benchmarking: {sink_name}")
+
+        log.info(
+            f"Benchmarking extraction of up to {max_commits} commit(s) to {sink_name} sink"
+        )
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+            run = executor.submit(
+                benchmark_run,
+                repo_path,
+                branch,
+                sink_name,
+                max_commits,
+                extractor_kwargs,
+            ).result()
+        log.info(
+            f"{sink_name} sink: {run['commits']} commit(s) in {run['total_sec']} sec - "
+            f"{run['commits_per_sec']} commits/sec, {run['diffs_per_sec']} diffs/sec"
+        )
+        runs.append(run)
+
+    return {
+        "coco_agent_version": coco_agent.__version__,
+        "python_version": platform.python_version(),
+        "git_version": ".".join(map(str, git.Git().version_info)),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "max_commits": max_commits,
+        "options": dict(extractor_kwargs),
+        "runs": runs,
+    }
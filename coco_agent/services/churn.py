@@ -0,0 +1,108 @@
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timezone
+
+from . import tm_id
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CHURN_PATH_DEPTH = 1
+SECONDS_PER_DAY = 24 * 60 * 60
+_CHURN_FIELDS = ("insertions", "deletions", "files", "commits")
+
+
+def path_prefix(path, depth=DEFAULT_CHURN_PATH_DEPTH):
+    """Leading dirs of a path, up to depth - "" for files at the top level"""
+    return "/".join(path.split("/")[:-1][:depth])
+
+
+class ChurnRollup:
+    """
+    Running daily churn totals per repo, keyed on day x author x path prefix - fed
+    commits with their diffs as they're extracted, so that rollups can be uploaded
+    instead of, or as well as, raw diffs.
+
+    Authors are git_users ids, as with compact users, whether or not commits were
+    extracted with them - of users_repo_id, the physical repo of a monorepo split,
+    defaulting to the commit's repo. Days are UTC dates of the committed date, as
+    extracts are filtered by.
+
+    Rows are ids of their key alone, so a later write of a row replaces it - e.g.
+    when a daily extract from yesterday re-extracts yesterday. For that to hold,
+    only days wholly within the extract's [start_ts, end_ts), as epoch seconds, are
+    emitted - days cut by the date range would replace whole days with partial ones.
+    """
+
+    def __init__(
+        self,
+        connector_id,
+        path_depth=DEFAULT_CHURN_PATH_DEPTH,
+        users_repo_id=None,
+        start_ts=None,
+        end_ts=None,
+    ):
+        self.connector_id = connector_id
+        self.path_depth = path_depth
+        self.users_repo_id = users_repo_id
+        self.start_ts = start_ts
+        self.end_ts = end_ts
+        self.totals = defaultdict(lambda: defaultdict(lambda: [0, 0, 0, 0]))
+
+    def add_commit(self, commit):
+        repo_id = commit["repo_id"]
+        author_id = commit.get("author_id") or tm_id.git_user(
+            self.users_repo_id or repo_id, commit["author.email"].strip().lower()
+        )
+        day = datetime.fromtimestamp(commit["committed_date"], timezone.utc)
+        day = day.date().isoformat()
+
+        repo_totals = self.totals[repo_id]
+        keys = set()
+        for diff in commit["diffs"]:
+            key = (day, author_id, path_prefix(diff["b_path"], self.path_depth))
+            totals = repo_totals[key]
+            totals[0] += diff["insertions"]
+            totals[1] += diff["deletions"]
+            totals[2] += 1
+            keys.add(key)
+
+        for key in keys:
+            repo_totals[key][3] += 1
+
+    def is_whole_day(self, day):
+        day_start = datetime.combine(
+            date.fromisoformat(day), datetime.min.time(), timezone.utc
+        ).timestamp()
+        return (self.start_ts is None or self.start_ts <= day_start) and (
+            self.end_ts is None or day_start + SECONDS_PER_DAY <= self.end_ts
+        )
+
+    def records(self, repo_id):
+        """
+        git_churn_daily records of a repo, of whole days, ordered by day, author and
+        prefix
+        """
+        records, partial_days = [], set()
+        for key, totals in sorted(self.totals.get(repo_id, {}).items()):
+            if not self.is_whole_day(key[0]):
+                partial_days.add(key[0])
+                continue
+
+            records.append(
+                {
+                    "tm_id": tm_id.git_churn_daily(repo_id, *key),
+                    "connector_id": self.connector_id,
+                    "repo_id": repo_id,
+                    "date": key[0],
+                    "author_id": key[1],
+                    "path_prefix": key[2],
+                    **dict(zip(_CHURN_FIELDS, totals)),
+                }
+            )
+
+        if partial_days:
+            log.info(
+                f"Leaving out daily churn of {', '.join(sorted(partial_days))} for "
+                f"repo {repo_id} - only partly in the date range"
+            )
+        return records
@@ -0,0 +1,161 @@
+import hashlib
+import logging
+import sqlite3
+import time
+import zlib
+
+import srsly
+
+log = logging.getLogger(__name__)
+
+# bump when the shape of cached records changes, to ignore older entries
+CACHE_RECORD_VERSION = 1
+DEFAULT_MAX_SIZE_BYTES = 1024 * 1024 * 1024
+# writes between commits - so that a crash loses at most these, and the size cap
+# holds during a run
+DEFAULT_FLUSH_EVERY_WRITES = 100
+EVICT_BATCH_SIZE = 1000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS commits (
+    repo_id TEXT NOT NULL,
+    hexsha TEXT NOT NULL,
+    options_key TEXT NOT NULL,
+    record BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (repo_id, hexsha, options_key)
+)
+"""
+_ACCESSED_AT_INDEX = """
+CREATE INDEX IF NOT EXISTS commits_accessed_at ON commits (accessed_at)
+"""
+
+
+def options_key(options: dict) -> str:
+    """Fingerprint of the extraction options a cached record was built with"""
+    options = dict(options, _version=CACHE_RECORD_VERSION)
+    return hashlib.sha256(
+        srsly.json_dumps(options, sort_keys=True).encode("utf-8")
+    ).hexdigest()[:16]
+
+
+class CommitCache:
+    """
+    On-disk cache of extracted commit records, including their diffs - commits are
+    immutable, so a record only depends on the repo, the commit and the extraction
+    options. Stored in SQLite, compressed.
+
+    Writes are committed every flush_every writes, least recently used entries
+    being evicted first, once the total size of records exceeds max_size_bytes.
+    """
+
+    def __init__(
+        self,
+        path,
+        max_size_bytes=DEFAULT_MAX_SIZE_BYTES,
+        flush_every=DEFAULT_FLUSH_EVERY_WRITES,
+    ):
+        self.path = path
+        self.max_size_bytes = max_size_bytes
+        self.flush_every = flush_every
+        self.hits = 0
+        self.misses = 0
+        self._num_pending_writes = 0
+
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(_SCHEMA)
+        self._conn.execute(_ACCESSED_AT_INDEX)
+        self._conn.commit()
+        (self._size,) = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM commits"
+        ).fetchone()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _written(self):
+        self._num_pending_writes += 1
+        if self._num_pending_writes >= self.flush_every:
+            self.flush()
+
+    def get(self, repo_id, hexsha, options_key):
+        row = self._conn.execute(
+            "SELECT record FROM commits "
+            "WHERE repo_id = ? AND hexsha = ? AND options_key = ?",
+            (repo_id, hexsha, options_key),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._conn.execute(
+            "UPDATE commits SET accessed_at = ? "
+            "WHERE repo_id = ? AND hexsha = ? AND options_key = ?",
+            (time.time(), repo_id, hexsha, options_key),
+        )
+        self._written()
+        return srsly.json_loads(zlib.decompress(row[0]).decode("utf-8"))
+
+    def put(self, repo_id, hexsha, options_key, record):
+        data = zlib.compress(srsly.json_dumps(record).encode("utf-8"))
+        replaced = self._conn.execute(
+            "SELECT size FROM commits "
+            "WHERE repo_id = ? AND hexsha = ? AND options_key = ?",
+            (repo_id, hexsha, options_key),
+        ).fetchone()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO commits "
+            "(repo_id, hexsha, options_key, record, size, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (repo_id, hexsha, options_key, data, len(data), time.time()),
+        )
+        self._size += len(data) - (replaced[0] if replaced else 0)
+        self._written()
+
+    def size(self):
+        return self._size
+
+    def evict(self):
+        """Delete least recently used records until within max_size_bytes"""
+        evicted = 0
+        while self._size > self.max_size_bytes:
+            # the least recently used rows, a batch at a time - enough of them to
+            # get within the cap, if in this batch
+            excess, num_rows, num_bytes = self._size - self.max_size_bytes, 0, 0
+            for (size,) in self._conn.execute(
+                "SELECT size FROM commits ORDER BY accessed_at, rowid LIMIT ?",
+                (EVICT_BATCH_SIZE,),
+            ).fetchall():
+                num_rows += 1
+                num_bytes += size
+                if num_bytes >= excess:
+                    break
+            if not num_rows:
+                break
+
+            self._conn.execute(
+                "DELETE FROM commits WHERE rowid IN "
+                "(SELECT rowid FROM commits ORDER BY accessed_at, rowid LIMIT ?)",
+                (num_rows,),
+            )
+            self._size -= num_bytes
+            evicted += num_rows
+
+        if evicted:
+            log.info(f"Evicted {evicted} record(s) from commit cache {self.path}")
+        return evicted
+
+    def flush(self):
+        self.evict()
+        self._conn.commit()
+        self._num_pending_writes = 0
+
+    def close(self):
+        self.flush()
+        self._conn.close()
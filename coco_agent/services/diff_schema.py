@@ -0,0 +1,133 @@
+import srsly
+
+from . import tm_id
+
+# Compact git_commit_diffs schema - fields constant across a file are hoisted into a
+# header, and derived ids are dropped. Rows are one of:
+#
+#   {"schema": COMPACT_DIFFS_SCHEMA, "connector_id": .., "repo_id": ..} - header,
+#       which may be repeated to change the constants for the rows that follow
+#   {"p": <index>, "path": ..} - path table entry, ahead of its first use
+#   {"c": <commit hexsha>} - commit of the diffs that follow
+#   {"a": <a path index>, "b": <b path index>, "i": insertions, "d": deletions,
+#    "l": lines, "s": size_delta, "t": type} - a diff, with "id" only if its
+#       tm_id can't be derived from the commit and path, and "h" hunks and "ht"
+#       hunks_truncated only for diffs extracted with hunks
+#
+# expand_diffs turns these back into full rows, as written with the default schema.
+COMPACT_DIFFS_SCHEMA = "git_commit_diffs/compact-1"
+
+_DIFF_STATS_KEYS = [("i", "insertions"), ("d", "deletions"), ("l", "lines")]
+
+
+class CompactDiffEncoder:
+    """Encodes diff rows to the compact schema - one encoder per output file"""
+
+    def __init__(self):
+        self.path_indexes = {}
+        self.constants = None
+        self.hexsha = None
+
+    def load(self, rows):
+        """Restore state from compact rows written earlier, e.g. when appending"""
+        for row in rows:
+            if "schema" in row:
+                self.constants = (row["connector_id"], row["repo_id"])
+            elif "p" in row:
+                self.path_indexes[row["path"]] = row["p"]
+            elif "c" in row:
+                self.hexsha = row["c"]
+
+    def _path_index(self, path, rows):
+        if path not in self.path_indexes:
+            self.path_indexes[path] = len(self.path_indexes)
+            rows.append({"p": self.path_indexes[path], "path": path})
+        return self.path_indexes[path]
+
+    def encode(self, diffs, commit_hexshas):
+        """
+        commit_hexshas maps commit tm_ids to hexshas, to derive diff tm_ids from -
+        diffs of other commits keep their ids
+        """
+        rows = []
+        for diff in diffs:
+            constants = (diff["connector_id"], diff["repo_id"])
+            if constants != self.constants:
+                self.constants = constants
+                rows.append(
+                    {
+                        "schema": COMPACT_DIFFS_SCHEMA,
+                        "connector_id": diff["connector_id"],
+                        "repo_id": diff["repo_id"],
+                    }
+                )
+
+            hexsha = commit_hexshas.get(diff["commit_id"])
+            if hexsha != self.hexsha:
+                self.hexsha = hexsha
+                rows.append({"c": hexsha})
+
+            row = {
+                "a": self._path_index(diff["a_path"], rows),
+                "b": self._path_index(diff["b_path"], rows),
+                **{key: diff[name] for key, name in _DIFF_STATS_KEYS},
+                "s": diff["size_delta"],
+                "t": diff["type"],
+            }
+            if "hunks" in diff:
+                row["h"], row["ht"] = diff["hunks"], diff["hunks_truncated"]
+            if (
+                hexsha is None
+                or tm_id.git_commit_diff(hexsha, diff["a_path"]) != diff["tm_id"]
+            ):
+                row["id"] = diff["tm_id"]
+                row["commit_id"] = diff["commit_id"]
+
+            rows.append(row)
+
+        return rows
+
+
+def expand_diffs(rows):
+    """Full diff rows from compact rows - rows of the default schema pass through"""
+    paths = {}
+    connector_id = repo_id = hexsha = None
+    is_compact = None
+
+    for row in rows:
+        if is_compact is None:
+            is_compact = row.get("schema") == COMPACT_DIFFS_SCHEMA
+        if not is_compact:
+            yield row
+            continue
+
+        if "schema" in row:
+            connector_id, repo_id = row["connector_id"], row["repo_id"]
+        elif "p" in row:
+            paths[row["p"]] = row["path"]
+        elif "c" in row:
+            hexsha = row["c"]
+        else:
+            a_path, b_path = paths[row["a"]], paths[row["b"]]
+            # same field order as extracted rows
+            diff = {
+                **{name: row[key] for key, name in _DIFF_STATS_KEYS},
+                "tm_id": row.get("id") or tm_id.git_commit_diff(hexsha, a_path),
+                "connector_id": connector_id,
+                "repo_id": repo_id,
+                "commit_id": row.get("commit_id") or tm_id.git_commit(hexsha),
+                "a_path": a_path,
+                "b_path": b_path,
+                "a_object_id": tm_id.git_path(repo_id, a_path),
+                "b_object_id": tm_id.git_path(repo_id, b_path),
+                "size_delta": row["s"],
+                "type": row["t"],
+            }
+            if "h" in row:
+                diff["hunks"], diff["hunks_truncated"] = row["h"], row["ht"]
+            yield diff
+
+
+def read_diffs(path):
+    """Read a git_commit_diffs JSONL file of either schema, as full rows"""
+    return expand_diffs(srsly.read_jsonl(path))
@@ -0,0 +1,219 @@
+import base64
+import hashlib
+import json
+import logging
+import re
+import socket
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+log = logging.getLogger(__name__)
+
+BUCKET_PATH_REGEX = re.compile(r"^/storage/v1/b/([^/]+)$")
+OBJECT_PATH_REGEX = re.compile(r"^(?:/download)?/storage/v1/b/([^/]+)/o/(.+)$")
+UPLOAD_PATH_REGEX = re.compile(r"^/upload/storage/v1/b/([^/]+)/o$")
+CONTENT_RANGE_REGEX = re.compile(r"^bytes (?:(\d+)-(\d+)|\*)/(\d+|\*)$")
+
+
+def _parse_multipart(content_type, body):
+    """Contents of the parts of a multipart/related body - metadata, then data"""
+    boundary = content_type.split("boundary=")[1].strip('"').encode()
+    parts = body.split(b"--" + boundary)[1:-1]
+    # each part is headers, then a blank line, then its content, then CRLF
+    return [part.split(b"\r\n\r\n", 1)[1][: -len(b"\r\n")] for part in parts]
+
+
+def _md5_base64(data):
+    return base64.b64encode(hashlib.md5(data).digest()).decode()
+
+
+class FakeGCSServer:
+    """
+    In-process stand-in for the GCS JSON API, for testing and benchmarking uploads
+    without network - point a GCSClient at url, with anonymous credentials.
+
+    Supports what GCSClient uses: getting and creating buckets, multipart and
+    resumable uploads, and object downloads. Objects are kept in memory, in
+    buckets[bucket name][object name], and buckets are created on first upload.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.buckets = {}
+        self.num_requests = 0
+        self._uploads = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _handler_class(self))
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="fake-gcs", daemon=True
+        )
+        self._thread.start()
+        log.debug(f"Fake GCS server listening on {self.url}")
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _object_resource(self, bucket_name, name):
+        data = self.buckets[bucket_name][name]
+        return {
+            "kind": "storage#object",
+            "id": f"{bucket_name}/{name}/1",
+            "bucket": bucket_name,
+            "name": name,
+            "size": str(len(data)),
+            "md5Hash": _md5_base64(data),
+            "generation": "1",
+            "metageneration": "1",
+        }
+
+    def _store(self, bucket_name, name, data):
+        with self._lock:
+            self.buckets.setdefault(bucket_name, {})[name] = data
+            return self._object_resource(bucket_name, name)
+
+
+def _handler_class(server):
+    class FakeGCSRequestHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            # responses are written as headers, then body - don't let Nagle's
+            # algorithm hold the body back until the headers are acked
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def log_message(self, format, *args):
+            log.debug(format % args)
+
+        def _body(self):
+            return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+        def _respond(self, status, body=None, headers=None):
+            data = json.dumps(body).encode() if isinstance(body, dict) else body or b""
+            self.send_response(status)
+            if isinstance(body, dict):
+                self.send_header("Content-Type", "application/json")
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _not_found(self):
+            self._respond(404, {"error": {"code": 404, "message": "Not Found"}})
+
+        def _route(self):
+            with server._lock:
+                server.num_requests += 1
+            url = urlparse(self.path)
+            return url.path, {k: v[0] for k, v in parse_qs(url.query).items()}
+
+        def do_GET(self):
+            path, query = self._route()
+
+            match = BUCKET_PATH_REGEX.match(path)
+            if match:
+                if match.group(1) not in server.buckets:
+                    return self._not_found()
+                return self._respond(
+                    200, {"kind": "storage#bucket", "name": match.group(1)}
+                )
+
+            match = OBJECT_PATH_REGEX.match(path)
+            if match:
+                bucket_name, name = match.group(1), unquote(match.group(2))
+                if name not in server.buckets.get(bucket_name, {}):
+                    return self._not_found()
+                if query.get("alt") == "media":
+                    data = server.buckets[bucket_name][name]
+                    return self._respond(
+                        200, data, headers={"X-Goog-Hash": f"md5={_md5_base64(data)}"}
+                    )
+                return self._respond(200, server._object_resource(bucket_name, name))
+
+            self._not_found()
+
+        def do_POST(self):
+            path, query = self._route()
+            body = self._body()
+
+            if path == "/storage/v1/b":
+                bucket_name = json.loads(body)["name"]
+                with server._lock:
+                    server.buckets.setdefault(bucket_name, {})
+                return self._respond(
+                    200, {"kind": "storage#bucket", "name": bucket_name}
+                )
+
+            match = UPLOAD_PATH_REGEX.match(path)
+            if not match:
+                return self._not_found()
+            bucket_name = match.group(1)
+
+            if query.get("uploadType") == "multipart":
+                metadata, data = _parse_multipart(self.headers["Content-Type"], body)
+                name = json.loads(metadata)["name"]
+                return self._respond(200, server._store(bucket_name, name, data))
+
+            if query.get("uploadType") == "resumable":
+                name = json.loads(body or b"{}").get("name") or query["name"]
+                upload_id = uuid.uuid4().hex
+                with server._lock:
+                    server._uploads[upload_id] = (bucket_name, name, bytearray())
+                location = (
+                    f"{server.url}/upload/storage/v1/b/{bucket_name}/o"
+                    f"?uploadType=resumable&upload_id={upload_id}"
+                )
+                return self._respond(200, headers={"Location": location})
+
+            self._respond(400, {"error": {"code": 400, "message": "Bad upload type"}})
+
+        def do_PUT(self):
+            path, query = self._route()
+            body = self._body()
+
+            upload = server._uploads.get(query.get("upload_id"))
+            if not UPLOAD_PATH_REGEX.match(path) or upload is None:
+                return self._not_found()
+            bucket_name, name, data = upload
+
+            match = CONTENT_RANGE_REGEX.match(self.headers.get("Content-Range", ""))
+            if not match:
+                return self._respond(
+                    400, {"error": {"code": 400, "message": "Bad range"}}
+                )
+            start, _, total = match.groups()
+            if start is not None and int(start) != len(data):
+                return self._respond(
+                    400, {"error": {"code": 400, "message": "Unexpected offset"}}
+                )
+            data.extend(body)
+
+            if total == "*" or len(data) < int(total):
+                # more chunks to come
+                return self._respond(308, headers={"Range": f"bytes=0-{len(data) - 1}"})
+
+            with server._lock:
+                del server._uploads[query["upload_id"]]
+            self._respond(200, server._store(bucket_name, name, bytes(data)))
+
+    return FakeGCSRequestHandler
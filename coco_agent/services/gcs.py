@@ -1,5 +1,7 @@
 import logging
+import shutil
 
+from google.auth.credentials import AnonymousCredentials
 from google.cloud import storage
 from google.cloud.exceptions import NotFound
 from google.cloud.storage import Blob, Bucket
@@ -7,10 +9,23 @@ from google.oauth2.service_account import Credentials
 
 log = logging.getLogger(__name__)
 
+# project for anonymous clients, which have none - as the storage library's own
+ANONYMOUS_PROJECT = "<none>"
+
 
 class GCSClient:
-    def __init__(self, sa_info_credentials: dict):
-        self.credentials = Credentials.from_service_account_info(sa_info_credentials)
+    """
+    Without credentials, the client is anonymous - e.g. for a local emulator at
+    api_endpoint, such as fake_gcs.FakeGCSServer
+    """
+
+    def __init__(self, sa_info_credentials: dict = None, api_endpoint: str = None):
+        self.credentials = (
+            Credentials.from_service_account_info(sa_info_credentials)
+            if sa_info_credentials
+            else AnonymousCredentials()
+        )
+        self.api_endpoint = api_endpoint
         self.client = self.get_client()
 
     def read_data(self, bucket_name: str, name: str, skip_bucket_check=False) -> str:
@@ -46,16 +61,28 @@ class GCSClient:
         bucket_file_name: str,
         content_type: str = None,
         skip_bucket_check=False,
+        resumable_chunk_size: int = None,
     ):
+        """
+        With resumable_chunk_size, the file is uploaded resumably in chunks of that
+        size, a multiple of 256 KB - otherwise only files over 8 MB are
+        """
         log.info(f"Writing file to bucket {bucket_name} as {bucket_file_name}")
 
         # if we call client.get_bucket, then we need more than objectCreate role (we need read as well)
         if skip_bucket_check:
-            blob = Blob(bucket_file_name, self.client.bucket(bucket_name.lower()))
+            bucket = self.client.bucket(bucket_name.lower())
         else:
-            blob = Blob(bucket_file_name, self.get_or_create_bucket(bucket_name))
-
-        blob.upload_from_filename(upload_file_name, content_type=content_type)
+            bucket = self.get_or_create_bucket(bucket_name)
+        blob = Blob(bucket_file_name, bucket)
+
+        if resumable_chunk_size:
+            with open(upload_file_name, "rb") as f_in, blob.open(
+                "wb", chunk_size=resumable_chunk_size, content_type=content_type
+            ) as f_out:
+                shutil.copyfileobj(f_in, f_out, resumable_chunk_size)
+        else:
+            blob.upload_from_filename(upload_file_name, content_type=content_type)
 
     def write_static_content(
         self, upload_file_name, bucket_file_name, content_type=None
@@ -91,7 +118,11 @@ class GCSClient:
 
     def get_client(self):
         return storage.Client(
-            project=self.credentials.project_id, credentials=self.credentials
+            project=getattr(self.credentials, "project_id", ANONYMOUS_PROJECT),
+            credentials=self.credentials,
+            client_options=(
+                {"api_endpoint": self.api_endpoint} if self.api_endpoint else None
+            ),
         )
 
     def get_prefixes(self, bucket_name, delimiter="/"):
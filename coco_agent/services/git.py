@@ -1,8 +1,16 @@
+import concurrent.futures
+import contextlib
+import fnmatch
+import json
 import logging
 import os
 import re
 import subprocess
 import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timedelta
 from pathlib import Path
 from urllib.parse import urlparse
 
@@ -10,7 +18,18 @@ import git
 import gitdb
 import srsly
 
-from . import tm_id
+from . import churn, commit_cache, diff_schema, sinks, tm_id
+from .records import DiffRecord, HunkDiffRecord
+from .git_backends import (
+    GIT_BACKENDS,
+    GITPYTHON_BACKEND,
+    RENAME_DETECTION_EXACT,
+    RENAME_DETECTION_MODES,
+    RENAME_DETECTION_OFF,
+    RENAME_DETECTION_ON,
+    create_git_backend,
+)
+from .git_trace import GitTracer
 
 EXPORT_FILE_NAME_REGEX = re.compile(r"^(.+)__(.+)__(.+)__(.+)\.(.+)$")
 GIT_URL_SCHEMES = ("http", "https", "git")
@@ -18,9 +37,41 @@ GIT_SOURCE_TYPE = "git"
 GIT_COMMIT_TYPE = "git_commits"
 GIT_COMMIT_DIFF_TYPE = "git_commit_diffs"
 GIT_REPO_TYPE = "git_repos"
+GIT_USER_TYPE = "git_users"
+GIT_CHURN_DAILY_TYPE = "git_churn_daily"
 DEFAULT_GIT_COMMIT_WRITE_BATCH_SIZE = 100
+CHECKPOINT_FILE_NAME = ".coco-agent-checkpoint.json"
+PARTIAL_FILE_SUFFIX = ".partial"
+WINDOW_DIR_NAME_FORMAT = "window-{:03d}"
+WINDOWS_MANIFEST_FILE_NAME = "manifest.json"
+SUBMODULES_DIR_NAME = "submodules"
 LOG_HEARTBEAT_COMMIT_BATCH_SIZE = 1000
 
+# how to diff merge commits:
+# - first-parent: everything the merge brought in, relative to its first parent
+# - combined: only files that differ from every parent, as git's combined diff -
+#   i.e. conflict resolutions and other changes made in the merge itself
+# - none: emit merge commits without diffs
+MERGE_DIFFS_FIRST_PARENT = "first-parent"
+MERGE_DIFFS_COMBINED = "combined"
+MERGE_DIFFS_NONE = "none"
+MERGE_DIFF_STRATEGIES = (
+    MERGE_DIFFS_FIRST_PARENT,
+    MERGE_DIFFS_COMBINED,
+    MERGE_DIFFS_NONE,
+)
+
+DIFFS_SKIPPED_TIMEOUT = "timeout"
+
+# extraction phases timed by GitRepoExtractor - see phase_sec
+PHASE_WALK = "walk"
+PHASE_DIFFS = "diffs"
+PHASE_COMMITS = "commits"
+
+# caps on changed lines for hunk extraction - see GitRepoExtractor
+DEFAULT_HUNK_MAX_FILE_LINES = 10000
+DEFAULT_HUNK_MAX_COMMIT_LINES = 100000
+
 log = logging.getLogger(__name__)
 
 
@@ -94,6 +145,135 @@ def _diff_type(diff):
         raise
 
 
+def _glob_to_regex(pattern):
+    """
+    Translate a glob to a regex, following git's :(glob) pathspec rules - i.e. * and ?
+    don't match /, while ** matches across directories. As with git, a pattern with no
+    wildcards also matches everything under it, if it's a directory.
+    """
+    if not any(c in pattern for c in "*?["):
+        return re.compile(re.escape(pattern.rstrip("/")) + "(/.*)?$")
+
+    regex, i = "", 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i) and (i == 0 or pattern[i - 1] == "/"):
+            regex += "(.*/)?"
+            i += 3
+        elif pattern.startswith("**", i):
+            regex += ".*"
+            i += 2
+        elif pattern[i] == "*":
+            regex += "[^/]*"
+            i += 1
+        elif pattern[i] == "?":
+            regex += "[^/]"
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 2 :]:
+            end = pattern.index("]", i + 2)
+            char_class = pattern[i + 1 : end]
+            if char_class.startswith("!"):
+                char_class = "^" + char_class[1:]
+            regex += f"[{char_class}]"
+            i = end + 1
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+
+    return re.compile(regex + "$")
+
+
+class PathFilter:
+    """
+    Include / exclude globs for repo paths. They're passed to git as pathspecs, so
+    that excluded paths are never diffed, and also used to match paths directly.
+    """
+
+    def __init__(self, include_paths=None, exclude_paths=None, literal_paths=None):
+        self.include_paths = list(include_paths or [])
+        self.exclude_paths = list(exclude_paths or [])
+        self.literal_paths = list(literal_paths or [])
+        self._include_regexes = [_glob_to_regex(p) for p in self.include_paths]
+        self._exclude_regexes = [_glob_to_regex(p) for p in self.exclude_paths]
+        self._literal_paths = set(self.literal_paths)
+
+    def __bool__(self):
+        return bool(self.include_paths or self.exclude_paths or self.literal_paths)
+
+    @property
+    def pathspecs(self):
+        return (
+            [f":(literal){p}" for p in self.literal_paths]
+            + [f":(glob){p}" for p in self.include_paths]
+            + [f":(glob,exclude){p}" for p in self.exclude_paths]
+        )
+
+    def matches(self, path):
+        return (
+            (not self._literal_paths or path in self._literal_paths)
+            and (
+                not self._include_regexes
+                or any(r.match(path) for r in self._include_regexes)
+            )
+            and not any(r.match(path) for r in self._exclude_regexes)
+        )
+
+
+class CommitTimeoutError(Exception):
+    pass
+
+
+class CommitDeadline:
+    """
+    Time budget for diffing a single commit. One-off git commands are given the time
+    remaining, and killed by GitPython when it runs out. Other git processes, such as
+    persistent cat-file processes used for blob lookups, are interrupted by a watchdog
+    when the budget expires - and the backend reset afterwards.
+
+    With no timeout, this does nothing.
+    """
+
+    def __init__(self, backend, timeout_sec=None):
+        self.backend = backend
+        self.timeout_sec = timeout_sec
+        self._deadline = None
+        self._watchdog = None
+
+    def __enter__(self):
+        if self.timeout_sec is not None:
+            self._deadline = time.monotonic() + self.timeout_sec
+            self._watchdog = threading.Timer(self.timeout_sec, self.backend.interrupt)
+            self._watchdog.daemon = True
+            self._watchdog.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._watchdog:
+            self._watchdog.cancel()
+            if self.expired:
+                self.backend.reset()
+
+    @property
+    def expired(self):
+        return self._deadline is not None and time.monotonic() >= self._deadline
+
+    def remaining(self):
+        """Seconds left, for git commands' kill_after_timeout - None if no time budget"""
+        self.check()
+        return None if self._deadline is None else self._deadline - time.monotonic()
+
+    def check(self):
+        if self.expired:
+            raise CommitTimeoutError(f"Time budget of {self.timeout_sec} sec exceeded")
+
+
+def _date_epoch(date_):
+    return int(date_.strftime("%s"))
+
+
+def is_clone_url(clone_url_or_path):
+    return urlparse(clone_url_or_path).scheme in GIT_URL_SCHEMES
+
+
 def clone_repo(clone_url, to_path, **kwargs):
     git.Repo.clone_from(clone_url, to_path, **kwargs)
     return git.Repo(to_path)
@@ -126,21 +306,39 @@ def get_repo_name_from_remote(repo):
     return repo.remotes.origin.url.split(".git")[0].split("/")[-1]
 
 
-def repo_commits_iter(repo, rev, fallback_rev=None, reverse=True):
+def repo_commits_iter(
+    repo, rev, fallback_rev=None, reverse=True, first_parent=False, backend=None
+):
     """
     :param reverse:  reverse commit order, passed by gitpython to git-rev-list;
                      reverse=False means newest-to-oldest. We default to oldest-
                      to-newest, to facilitate contiguous ingestion of new data
+    :param first_parent: only follow the first parent of merge commits, skipping
+                     commits brought in by merged branches
+    :param backend:  GitBackend to iterate commits with, instead of the repo
     """
-
     try:
-        for commit in repo.iter_commits(rev, reverse=reverse):
+        if backend:
+            commits = backend.iter_commits(
+                rev, reverse=reverse, first_parent=first_parent
+            )
+        else:
+            rev_list_kwargs = dict(first_parent=True) if first_parent else {}
+            commits = repo.iter_commits(rev, reverse=reverse, **rev_list_kwargs)
+
+        for commit in commits:
             yield commit
     except git.GitCommandError:
         repo_name = get_repo_name_from_remote(repo)
         if fallback_rev:
             log.info(f"No rev {rev} for {repo_name} - falling back to {fallback_rev}")
-            yield from repo_commits_iter(repo, fallback_rev)
+            yield from repo_commits_iter(
+                repo,
+                fallback_rev,
+                reverse=reverse,
+                first_parent=first_parent,
+                backend=backend,
+            )
         else:
             log.info(
                 f"Could not fetch '{rev}' for {repo_name} - "
@@ -148,6 +346,88 @@ def repo_commits_iter(repo, rev, fallback_rev=None, reverse=True):
             )
 
 
+def _commits_after(commits_iter, hexsha):
+    for commit in commits_iter:
+        if commit.hexsha == hexsha:
+            yield from commits_iter
+            return
+
+    raise ValueError(f"Commit {hexsha} to resume after not found")
+
+
+def is_branch_glob(branch_spec):
+    return any(c in branch_spec for c in "*?[")
+
+
+def resolve_branch_specs(repo, branch_specs):
+    """
+    Expand a list of branch names and / or globs (e.g. release/*) into existing
+    branch names, in the order given and without duplicates.
+
+    Globs match local branches, as well as remote branches - either by their short
+    name (e.g. release/1.0), for clones without a matching local branch, or by
+    their full name (e.g. origin/release/1.0).
+    """
+    candidates = {head.name: head.name for head in repo.heads}
+    for remote in repo.remotes:
+        for ref in remote.refs:
+            if ref.remote_head == "HEAD":
+                continue
+            candidates.setdefault(ref.remote_head, ref.name)
+            candidates.setdefault(ref.name, ref.name)
+
+    branches = []
+    for spec in branch_specs:
+        if is_branch_glob(spec):
+            matched = [
+                branch
+                for name, branch in sorted(candidates.items())
+                if fnmatch.fnmatchcase(name, spec)
+            ]
+            if not matched:
+                log.info(f"No branches matching '{spec}' - skipping")
+        elif spec in candidates:
+            matched = [candidates[spec]]
+        else:
+            log.info(f"Could not find branch '{spec}' - skipping")
+            matched = []
+
+        branches.extend(b for b in matched if b not in branches)
+
+    return branches
+
+
+def repo_branch_membership(repo, branches, first_parent=False):
+    """
+    Work out which of the given branches contains each commit, in a single history
+    walk over the union of the branches. Returns a dict of commit hexsha to a list
+    of branch names, in the order the branches were given.
+
+    rev-list --topo-order emits children before parents, so membership can be
+    propagated from each branch tip down to its ancestors as we go.
+    """
+    rev_list_kwargs = dict(first_parent=True) if first_parent else {}
+
+    membership = {}
+    for bit, branch in enumerate(branches):
+        tip = repo.rev_parse(branch).hexsha
+        membership[tip] = membership.get(tip, 0) | (1 << bit)
+
+    rev_list = repo.git.rev_list(
+        *branches, "--", topo_order=True, parents=True, **rev_list_kwargs
+    )
+    for line in rev_list.splitlines():
+        hexsha, *parents = line.split()
+        mask = membership.get(hexsha, 0)
+        for parent in parents[:1] if first_parent else parents:
+            membership[parent] = membership.get(parent, 0) | mask
+
+    return {
+        hexsha: [branch for bit, branch in enumerate(branches) if mask & (1 << bit)]
+        for hexsha, mask in membership.items()
+    }
+
+
 def get_repo_url_from_remote(repo, remote="origin"):
     if not repo.remotes:
         return None
@@ -170,10 +450,34 @@ class GitRepoExtractor:
         use_non_native_repo_db=False,
         start_date=None,
         end_date=None,
+        merge_diffs=MERGE_DIFFS_FIRST_PARENT,
+        first_parent=False,
+        include_paths=None,
+        exclude_paths=None,
+        path_repo_names=None,
+        rename_detection=RENAME_DETECTION_ON,
+        rename_limit=None,
+        commit_timeout_sec=None,
+        backend=GITPYTHON_BACKEND,
+        commit_cache=None,
+        compact_users=False,
+        parent_repo_id=None,
+        parent_path=None,
+        hunks=False,
+        hunk_max_file_lines=DEFAULT_HUNK_MAX_FILE_LINES,
+        hunk_max_commit_lines=DEFAULT_HUNK_MAX_COMMIT_LINES,
+        trace_git=False,
+        max_commits=None,
     ) -> None:
         self.clone_url_or_path = clone_url_or_path
         if not repo_tm_id and not autogenerate_repo_id:
             raise ValueError(f"No repo id given or auto-gen requested")
+        if merge_diffs not in MERGE_DIFF_STRATEGIES:
+            raise ValueError(f"Unknown merge diff strategy: {merge_diffs}")
+        if rename_detection not in RENAME_DETECTION_MODES:
+            raise ValueError(f"Unknown rename detection mode: {rename_detection}")
+        if backend not in GIT_BACKENDS:
+            raise ValueError(f"Unknown git backend: {backend}")
 
         self.customer_id = customer_id
         self.source_id = source_id
@@ -187,6 +491,42 @@ class GitRepoExtractor:
         self.use_non_native_repo_db = use_non_native_repo_db
         self.start_date = start_date
         self.end_date = end_date
+        self.merge_diffs = merge_diffs
+        self.first_parent = first_parent
+        self.path_filter = PathFilter(include_paths, exclude_paths)
+        self.rename_detection = rename_detection
+        self.rename_limit = rename_limit
+        self.commit_timeout_sec = commit_timeout_sec
+        self.backend_name = backend
+        self.backend = None
+        self.commit_cache = commit_cache
+        self.compact_users = compact_users
+        self.parent_repo_id = parent_repo_id
+        self.parent_path = parent_path
+        self.hunks = hunks
+        self.hunk_max_file_lines = hunk_max_file_lines
+        self.hunk_max_commit_lines = hunk_max_commit_lines
+        # git commands run per commit, summarized at the end of the extract
+        self.git_tracer = GitTracer() if trace_git else None
+        # a sample of the most recent commits, e.g. for benchmarking
+        self.max_commits = max_commits
+        # time spent walking history, diffing and reading commits, in sec
+        self.phase_sec = defaultdict(float)
+
+        # monorepo split - diffs under each path prefix are attributed to their own
+        # logical repo; longest prefix first, so that nested prefixes win
+        self.path_repos = sorted(
+            [
+                (
+                    prefix.strip("/") + "/",
+                    name,
+                    tm_id.git_repo(customer_id, source_id, name),
+                )
+                for prefix, name in dict(path_repo_names or {}).items()
+            ],
+            key=lambda x: len(x[0]),
+            reverse=True,
+        )
 
     def generate_repo_id_from_remote_name(self, repo):
         repo_name = get_repo_name_from_remote(repo)
@@ -194,49 +534,243 @@ class GitRepoExtractor:
 
         return tm_id.git_repo(self.customer_id, self.source_id, repo_name)
 
+    @property
+    def _commit_cache_options_key(self):
+        # everything a commit record depends on, other than the repo and commit
+        return commit_cache.options_key(
+            dict(
+                connector_id=self.connector_id,
+                merge_diffs=self.merge_diffs,
+                include_paths=self.path_filter.include_paths,
+                exclude_paths=self.path_filter.exclude_paths,
+                path_repos=[prefix for prefix, _, _ in self.path_repos],
+                path_repo_ids=[repo_id for _, _, repo_id in self.path_repos],
+                rename_detection=self.rename_detection,
+                rename_limit=self.rename_limit,
+                hunks=self.hunks,
+                hunk_max_file_lines=self.hunk_max_file_lines,
+                hunk_max_commit_lines=self.hunk_max_commit_lines,
+            )
+        )
+
+    def _build_commit(self, repo_tm_id, commit_obj):
+        diffs_skipped = None
+        start_time = time.perf_counter()
+        try:
+            diffs = list(self.load_commit_diffs(repo_tm_id, commit_obj))
+        except CommitTimeoutError as e:
+            log.warning(f"Skipping diffs for commit {commit_obj.hexsha}: {str(e)}")
+            diffs, diffs_skipped = [], DIFFS_SKIPPED_TIMEOUT
+        diffs_time = time.perf_counter()
+        self.phase_sec[PHASE_DIFFS] += diffs_time - start_time
+
+        commit = {
+            "tm_id": tm_id.git_commit(commit_obj.hexsha),
+            "connector_id": self.connector_id,
+            "repo_id": repo_tm_id,
+            "diffs": diffs,
+            "author.name": commit_obj.author.name,
+            "author.email": commit_obj.author.email,
+            "committer.name": commit_obj.committer.name,
+            "committer.email": commit_obj.committer.email,
+            "parents": [tm_id.git_commit(x.hexsha) for x in commit_obj.parents],
+        }
+
+        for attr in [
+            "hexsha",
+            "authored_date",
+            "committed_date",
+            "message",
+            "summary",
+        ]:
+            commit[attr] = getattr(commit_obj, attr)
+
+        if diffs_skipped:
+            commit["diffs_skipped"] = diffs_skipped
+
+        self.phase_sec[PHASE_COMMITS] += time.perf_counter() - diffs_time
+        return commit
+
+    def _timed_walk(self, commits_iter):
+        commits_iter = iter(commits_iter)
+        while True:
+            start_time = time.perf_counter()
+            try:
+                commit_obj = next(commits_iter)
+            except StopIteration:
+                return
+            finally:
+                self.phase_sec[PHASE_WALK] += time.perf_counter() - start_time
+            yield commit_obj
+
+    def _compact_commit_users(self, repo_tm_id, commit, users):
+        """
+        Replace a commit's author and committer with ids of git_users records, which
+        are deduplicated by email across the repo - users maps ids to records seen so
+        far in the run. Yields the records of users not seen before.
+        """
+        for role in ("author", "committer"):
+            name, email = commit.pop(f"{role}.name"), commit.pop(f"{role}.email")
+            user_tm_id = tm_id.git_user(repo_tm_id, email.strip().lower())
+            commit[f"{role}_id"] = user_tm_id
+
+            if user_tm_id not in users:
+                users[user_tm_id] = {
+                    "tm_id": user_tm_id,
+                    "connector_id": self.connector_id,
+                    "repo_id": repo_tm_id,
+                    "name": name,
+                    "email": email,
+                }
+                yield users[user_tm_id]
+
+    def _path_repo_id(self, path, repo_tm_id):
+        for prefix, _, path_repo_tm_id in self.path_repos:
+            if path.startswith(prefix):
+                return path_repo_tm_id
+        return repo_tm_id
+
+    def _split_commit_by_repo(self, commit):
+        """
+        Monorepo split - one copy of the commit for each logical repo it touches, with
+        just that repo's diffs. Commits without diffs stay with the physical repo.
+        """
+        repo_diffs = {commit["repo_id"]: []} if not commit["diffs"] else {}
+        for diff in commit["diffs"]:
+            repo_diffs.setdefault(diff["repo_id"], []).append(diff)
+
+        for repo_id, diffs in repo_diffs.items():
+            yield {**commit, "repo_id": repo_id, "diffs": diffs}
+
     def load_commit_diffs(self, repo_tm_id, commit):
         """
         Source: https://bbengfort.github.io/snippets/2016/05/06/git-diff-extract.html
         This function returns a generator which iterates through all commits of
         the repository located in the given path for the given branch. It yields
         file diff information to show a timeseries of file changes.
+
+        Merge commits are diffed as per the merge_diffs strategy, and paths are
+        limited to those matching include / exclude paths, if any.
+        With a monorepo split, each diff is attributed to the logical repo owning its path.
+
+        With hunks, each diff also has the changed line ranges of its hunks - from a
+        patch streamed from git, capped at hunk_max_file_lines changed lines per file
+        and hunk_max_commit_lines per commit. Diffs with hunks dropped by the caps
+        have hunks_truncated set, and hunks None if the commit cap was hit first.
+
+        Raises CommitTimeoutError if diffing takes longer than commit_timeout_sec.
         """
-        diffs = commit.parents[0].diff(commit) if commit.parents else commit.diff()
-        diffs = {
-            diff.a_path: diff
-            for diff in diffs
-            # TODO: create_patch=True to get changed lines
-        }
+        with CommitDeadline(self.backend, self.commit_timeout_sec) as deadline:
+            try:
+                yield from self._load_commit_diffs(repo_tm_id, commit, deadline)
+            # a process killed by the watchdog fails its command - or for persistent
+            # ones, breaks the pipe or returns no output
+            except (git.GitCommandError, OSError, ValueError) as e:
+                if deadline.expired:
+                    raise CommitTimeoutError(
+                        f"Time budget of {self.commit_timeout_sec} sec exceeded"
+                    ) from e
+                raise
+
+    def _load_commit_diffs(self, repo_tm_id, commit, deadline):
+        path_filter = self.path_filter
+        if len(commit.parents) > 1:
+            if self.merge_diffs == MERGE_DIFFS_NONE:
+                return
+
+            if self.merge_diffs == MERGE_DIFFS_COMBINED:
+                # limit the (first parent) diff to paths changed relative to all parents,
+                # which are usually few - and skip diffing altogether if there are none
+                combined_paths = self.backend.combined_diff_paths(
+                    commit, path_filter=path_filter, timeout=deadline.remaining()
+                )
+                if not combined_paths:
+                    return
+                path_filter = PathFilter(literal_paths=combined_paths)
+
+        diffs, rename_limit_hit = self.backend.tree_diff(
+            commit,
+            path_filter=path_filter,
+            rename_detection=self.rename_detection,
+            rename_limit=self.rename_limit,
+            timeout=deadline.remaining(),
+        )
+        if rename_limit_hit:
+            log.info(
+                f"Rename limit hit for commit {commit.hexsha} - some renames will be "
+                "reported as deletes and adds"
+            )
+
+        diffs = {diff.a_path: diff for diff in diffs}
 
         # The stats on the commit is a summary of all the changes for this
         # commit, we'll iterate through it to get the information we need.
-        for objpath, stats in commit.stats.files.items():
+        numstat = [
+            (objpath, stats)
+            for objpath, stats in self.backend.numstat(
+                commit, path_filter=path_filter, timeout=deadline.remaining()
+            ).items()
+            if self.path_filter.matches(get_path(objpath))
+        ]
+        record_cls, hunks = DiffRecord, None
+        if self.hunks:
+            record_cls = HunkDiffRecord
+            hunks = self.backend.hunks(
+                commit,
+                path_filter=path_filter,
+                max_file_lines=self.hunk_max_file_lines,
+                max_commit_lines=self.hunk_max_commit_lines,
+                timeout=deadline.remaining(),
+            )
+            if hunks.commit_truncated:
+                log.info(
+                    f"Hunk line cap hit for commit {commit.hexsha} - some diffs will "
+                    "have truncated hunks"
+                )
+
+        # ids in one go, rather than per diff
+        commit_id = tm_id.git_commit(commit.hexsha)
+        diff_tm_ids = tm_id.git_commit_diffs(
+            commit.hexsha, [objpath for objpath, _ in numstat]
+        )
+
+        for (objpath, stats), diff_tm_id in zip(numstat, diff_tm_ids):
             diff = diffs.get(get_path(objpath))
             if diff is None:
                 log.debug("Couldn't find a diff for %s", get_path(objpath))
                 continue
 
-            # Update the stats with the additional information
             size_delta = _diff_size(diff)
             type_ = _diff_type(diff)
-
-            stats.update(
-                {
-                    "tm_id": tm_id.git_commit_diff(commit.hexsha, objpath),
-                    "connector_id": self.connector_id,
-                    "repo_id": repo_tm_id,
-                    "commit_id": tm_id.git_commit(commit.hexsha),
-                    "a_path": diff.a_path,
-                    "b_path": diff.b_path,
-                    "a_object_id": tm_id.git_path(repo_tm_id, diff.a_path),
-                    "b_object_id": tm_id.git_path(repo_tm_id, diff.b_path),
-                    "size_delta": size_delta,
-                    "type": type_,
-                }
+            deadline.check()
+            diff_repo_id = self._path_repo_id(get_path(objpath), repo_tm_id)
+
+            hunk_kwargs = {}
+            if hunks is not None:
+                path = get_path(objpath)
+                hunk_kwargs = dict(
+                    hunks=hunks.hunks.get(path, None if hunks.commit_truncated else []),
+                    hunks_truncated=path in hunks.truncated_paths
+                    or (hunks.commit_truncated and path not in hunks.hunks),
+                )
+
+            yield record_cls(
+                insertions=stats["insertions"],
+                deletions=stats["deletions"],
+                lines=stats["lines"],
+                tm_id=diff_tm_id,
+                connector_id=self.connector_id,
+                repo_id=diff_repo_id,
+                commit_id=commit_id,
+                a_path=diff.a_path,
+                b_path=diff.b_path,
+                a_object_id=tm_id.git_path(diff_repo_id, diff.a_path),
+                b_object_id=tm_id.git_path(diff_repo_id, diff.b_path),
+                size_delta=size_delta,
+                type=type_,
+                **hunk_kwargs,
             )
 
-            yield stats
-
     def _date_filter_predicate(self, commit_obj):
         # Using committed_date over authored_date as in general it may be more recent, e.g if
         # commits came from a different source - https://stackoverflow.com/questions/11856983/why-git-authordate-is-different-from-commitdate
@@ -245,49 +779,100 @@ class GitRepoExtractor:
 
         return (
             self.start_date is None
-            or committed_date_epoch >= int(self.start_date.strftime("%s"))
+            or committed_date_epoch >= _date_epoch(self.start_date)
         ) and (
-            self.end_date is None
-            or committed_date_epoch < int(self.end_date.strftime("%s"))
+            self.end_date is None or committed_date_epoch < _date_epoch(self.end_date)
         )
 
     def extract_commits_and_history(
-        self, repo, repo_tm_id, rev, fallback_rev=None, ignore_errors=False
+        self,
+        repo,
+        repo_tm_id,
+        rev,
+        fallback_rev=None,
+        ignore_errors=False,
+        resume_after=None,
     ):
+        """
+        rev may be a single rev spec, or a list of branch names and / or globs - in
+        which case the union of the branches is traversed once, and each commit is
+        recorded with the branches that contain it
+
+        With resume_after, commits are skipped up to and including that commit hexsha
+        - i.e. extraction continues from where an earlier, interrupted one stopped
+        """
+        branch_membership = None
+        if isinstance(rev, (list, tuple)):
+            rev = resolve_branch_specs(repo, rev)
+            if not rev:
+                log.info(
+                    f"No branches to extract for {get_repo_name_from_remote(repo)}"
+                )
+                return
+
+            log.info(f"Extracting branches: {', '.join(rev)}")
+            branch_membership = repo_branch_membership(
+                repo, rev, first_parent=self.first_parent
+            )
+
+        self.backend = create_git_backend(self.backend_name, repo)
+        commits_iter = self._timed_walk(
+            repo_commits_iter(
+                repo,
+                rev,
+                fallback_rev,
+                first_parent=self.first_parent,
+                backend=self.backend,
+            )
+        )
+        cache_options_key = None
+        if self.commit_cache is not None:
+            cache_options_key = self._commit_cache_options_key
+            cache_hits, cache_misses = self.commit_cache.hits, self.commit_cache.misses
+
+        if resume_after:
+            log.info(f"Resuming after commit {resume_after}")
+            commits_iter = _commits_after(commits_iter, resume_after)
+
         # filter by date as required
-        for idx, commit_obj in filter(
+        commits_iter = filter(
             lambda x: self._date_filter_predicate(x[1]),
-            enumerate(repo_commits_iter(repo, rev, fallback_rev)),
-        ):
+            enumerate(commits_iter),
+        )
+        if self.max_commits is not None:
+            # the walk is oldest first - sample its tail, the most recent commits
+            commits_iter = deque(commits_iter, maxlen=self.max_commits)
+            log.info(f"Extracting the most recent {len(commits_iter)} commit(s)")
+
+        for idx, commit_obj in commits_iter:
             if idx and not (idx % LOG_HEARTBEAT_COMMIT_BATCH_SIZE):
                 log.info(f"{idx} commits done - still working ...")
 
             try:
                 log.debug(f"Processing commit {commit_obj.hexsha}")
-                diffs = self.load_commit_diffs(repo_tm_id, commit_obj)
+                if self.git_tracer is not None:
+                    self.git_tracer.commit = commit_obj.hexsha
+                commit = None
+                if self.commit_cache is not None:
+                    commit = self.commit_cache.get(
+                        repo_tm_id, commit_obj.hexsha, cache_options_key
+                    )
 
-                commit = {
-                    "tm_id": tm_id.git_commit(commit_obj.hexsha),
-                    "connector_id": self.connector_id,
-                    "repo_id": repo_tm_id,
-                    "diffs": list(diffs),
-                    "author.name": commit_obj.author.name,
-                    "author.email": commit_obj.author.email,
-                    "committer.name": commit_obj.committer.name,
-                    "committer.email": commit_obj.committer.email,
-                    "parents": [tm_id.git_commit(x.hexsha) for x in commit_obj.parents],
-                }
+                if commit is None:
+                    commit = self._build_commit(repo_tm_id, commit_obj)
+                    # a commit without diffs due to a timeout may well fit next time
+                    if self.commit_cache is not None and "diffs_skipped" not in commit:
+                        self.commit_cache.put(
+                            repo_tm_id, commit_obj.hexsha, cache_options_key, commit
+                        )
 
-                for attr in [
-                    "hexsha",
-                    "authored_date",
-                    "committed_date",
-                    "message",
-                    "summary",
-                ]:
-                    commit[attr] = getattr(commit_obj, attr)
+                if branch_membership is not None:
+                    commit["branches"] = branch_membership.get(commit_obj.hexsha, [])
 
-                yield commit
+                if self.path_repos:
+                    yield from self._split_commit_by_repo(commit)
+                else:
+                    yield commit
             except Exception as e:
                 if ignore_errors:
                     log.exception(
@@ -296,15 +881,28 @@ class GitRepoExtractor:
                 else:
                     raise
 
-    def __call__(self, rev, fallback_rev=None, ignore_errors=False):
+        if self.git_tracer is not None:
+            self.git_tracer.commit = None
+
+        if self.commit_cache is not None:
+            self.commit_cache.flush()
+            log.info(
+                f"Commit cache: {self.commit_cache.hits - cache_hits} hit(s), "
+                f"{self.commit_cache.misses - cache_misses} miss(es)"
+            )
+
+    def __call__(self, rev, fallback_rev=None, ignore_errors=False, resume_after=None):
         """
         Extractor for commits and diffs for a git repo. Emits 2-tuples of (rec type, record),
-        Repo tuple first, followed by commits
+        Repo tuple first, followed by any logical repos of a monorepo split, then commits
+        - and with compact_users, git users ahead of the first commit referencing them
         """
-        with tempfile.TemporaryDirectory() as tmpdir:
+        with tempfile.TemporaryDirectory() as tmpdir, (
+            self.git_tracer or contextlib.nullcontext()
+        ):
             # see https://github.com/gitpython-developers/GitPython/issues/642
             repo_kwargs = dict(odbt=git.db.GitDB) if self.use_non_native_repo_db else {}
-            if urlparse(self.clone_url_or_path).scheme in GIT_URL_SCHEMES:
+            if is_clone_url(self.clone_url_or_path):
                 log.info(f"Cloning {self.clone_url_or_path}...")
                 repo = clone_repo(self.clone_url_or_path, tmpdir, **repo_kwargs)
             else:
@@ -327,26 +925,54 @@ class GitRepoExtractor:
             repo_link_url = self.repo_link_url
             if not repo_link_url and self.use_repo_link_from_remote:
                 repo_link_url = get_repo_url_from_remote(repo)
-            yield (
-                GIT_REPO_TYPE,
-                {
-                    "tm_id": repo_tm_id,
-                    "connector_id": self.connector_id,
-                    "name": repo_name,
-                    "url": repo_link_url,
-                },
-            )
-
-            # emit commits
+            repo_record = {
+                "tm_id": repo_tm_id,
+                "connector_id": self.connector_id,
+                "name": repo_name,
+                "url": repo_link_url,
+            }
+            if self.parent_repo_id:
+                # a submodule, at parent_path in its parent repo
+                repo_record["parent_repo_id"] = self.parent_repo_id
+                repo_record["parent_path"] = self.parent_path
+            yield GIT_REPO_TYPE, repo_record
+
+            emitted_repo_ids = {repo_tm_id}
+            for prefix, path_repo_name, path_repo_tm_id in self.path_repos:
+                if path_repo_tm_id in emitted_repo_ids:
+                    continue
+                emitted_repo_ids.add(path_repo_tm_id)
+
+                yield (
+                    GIT_REPO_TYPE,
+                    {
+                        "tm_id": path_repo_tm_id,
+                        "connector_id": self.connector_id,
+                        "name": path_repo_name,
+                        "url": repo_link_url,
+                        "path_prefix": prefix,
+                    },
+                )
+
+            # emit commits - with compact users, preceded by any users they introduce
+            users = {}
             for commit in self.extract_commits_and_history(
                 repo,
                 repo_tm_id,
                 rev=rev,
                 fallback_rev=fallback_rev,
                 ignore_errors=ignore_errors,
+                resume_after=resume_after,
             ):
+                if self.compact_users:
+                    for user in self._compact_commit_users(repo_tm_id, commit, users):
+                        yield GIT_USER_TYPE, user
+
                 yield GIT_COMMIT_TYPE, commit
 
+            if self.git_tracer is not None:
+                self.git_tracer.log_summary()
+
 
 def ingest_and_store_repo(
     customer_id,
@@ -361,7 +987,38 @@ def ingest_and_store_repo(
     commits_batch_size=DEFAULT_GIT_COMMIT_WRITE_BATCH_SIZE,
     start_date=None,
     end_date=None,
+    resume_after=None,
+    batch_stored_fn=None,
+    churn_daily=False,
+    churn_path_depth=churn.DEFAULT_CHURN_PATH_DEPTH,
+    store_diffs=True,
+    **extractor_kwargs,
 ):
+    """
+    Extract a repo, storing records in batches via store_fn(type, repo id, records).
+    extractor_kwargs are passed on to GitRepoExtractor - e.g. merge_diffs
+
+    Once a batch of commits is stored, batch_stored_fn(hexsha) is called with the
+    last commit in it - batches always end on a whole commit, so that extraction
+    can be resumed after that commit with resume_after.
+
+    With churn_daily, daily churn rollups are stored once all commits are - see
+    churn.ChurnRollup. Rollups are of whole days of history, so need a branch rather
+    than a range of commits. Without store_diffs, raw diffs aren't stored, e.g. to
+    upload rollups only.
+
+    Returns totals of commits and diffs extracted, and the extractor's phase_sec.
+    """
+    if churn_daily and (
+        extractor_kwargs.get("max_commits")
+        or any(
+            isinstance(rev, str) and (".." in rev or rev.startswith("^"))
+            for rev in _revs(branch)
+        )
+    ):
+        # rows of a day replace earlier ones, so must total all of its commits
+        raise ValueError(f"Daily churn rollups need whole history, not commit ranges")
+
     extractor = GitRepoExtractor(
         customer_id=customer_id,
         source_id=source_id,
@@ -372,52 +1029,121 @@ def ingest_and_store_repo(
         use_non_native_repo_db=use_non_native_repo_db,
         start_date=start_date,
         end_date=end_date,
+        **extractor_kwargs,
     )
 
     items_gen = extractor(
-        rev=branch, fallback_rev=fallback_branch, ignore_errors=ignore_errors
+        rev=branch,
+        fallback_rev=fallback_branch,
+        ignore_errors=ignore_errors,
+        resume_after=resume_after,
     )
 
-    # Consume repo
+    # Consume repo(s) - first item is always the repo, which may be followed by
+    # the logical repos of a monorepo split
     type_, repo = next(items_gen)
     assert (
         type_ == GIT_REPO_TYPE
     ), f"Expected first extracted item to be a repo, but was {type_}"
     store_fn(GIT_REPO_TYPE, repo["tm_id"], [repo])
+    repos = {repo["tm_id"]: repo}
+    churn_rollup = (
+        churn.ChurnRollup(
+            extractor.connector_id,
+            path_depth=churn_path_depth,
+            users_repo_id=repo["tm_id"],
+            start_ts=_date_epoch(start_date) if start_date else None,
+            end_ts=_date_epoch(end_date) if end_date else None,
+        )
+        if churn_daily
+        else None
+    )
 
     # consume commits im batches, and count them for reporting
-    num_commits, num_commit_diffs = 0, 0
+    num_commits, num_commit_diffs = defaultdict(int), defaultdict(int)
+    num_commits_diffs_skipped = defaultdict(int)
+    num_users = defaultdict(int)
+    pending_users = defaultdict(list)
+
+    def store_commits_batch(commits):
+        for repo_id, users in pending_users.items():
+            store_fn(GIT_USER_TYPE, repo_id, users)
+        pending_users.clear()
 
-    def store_commits_batch(repo_id, commits):
-        nonlocal num_commits, num_commit_diffs
         if not len(commits):
             return
 
-        commit_diffs = []
-        num_commits += len(commits)
+        repo_commits, repo_commit_diffs = defaultdict(list), defaultdict(list)
         for commit in commits:
-            commit_diffs.extend(commit["diffs"])
-            num_commit_diffs += len(commit["diffs"])
+            repo_id = commit["repo_id"]
+            repo_commits[repo_id].append(commit)
+            repo_commit_diffs[repo_id].extend(commit["diffs"])
+            num_commits[repo_id] += 1
+            num_commit_diffs[repo_id] += len(commit["diffs"])
+            num_commits_diffs_skipped[repo_id] += bool(commit.get("diffs_skipped"))
+            if churn_rollup is not None:
+                churn_rollup.add_commit(commit)
             del commit["diffs"]
 
-        store_fn(GIT_COMMIT_TYPE, repo_id, commits)
-        store_fn(GIT_COMMIT_DIFF_TYPE, repo_id, commit_diffs)
+        for repo_id, commits_for_repo in repo_commits.items():
+            store_fn(GIT_COMMIT_TYPE, repo_id, commits_for_repo)
+            if store_diffs:
+                store_fn(GIT_COMMIT_DIFF_TYPE, repo_id, repo_commit_diffs[repo_id])
+
+        if batch_stored_fn:
+            batch_stored_fn(commits[-1]["hexsha"])
 
     commits_batch = []
     for type_, item in items_gen:
+        if type_ == GIT_REPO_TYPE and not commits_batch and not num_commits:
+            store_fn(GIT_REPO_TYPE, item["tm_id"], [item])
+            repos[item["tm_id"]] = item
+            continue
+
+        if type_ == GIT_USER_TYPE:
+            pending_users[item["repo_id"]].append(item)
+            num_users[item["repo_id"]] += 1
+            continue
+
         if type_ != GIT_COMMIT_TYPE:
             raise ValueError(f"Expected commit items, got {type_}")
 
-        commits_batch.append(item)
-        if len(commits_batch) >= commits_batch_size:
-            store_commits_batch(repo["tm_id"], commits_batch)
+        # a monorepo split yields a commit for each logical repo - keep them together
+        if (
+            len(commits_batch) >= commits_batch_size
+            and item["hexsha"] != commits_batch[-1]["hexsha"]
+        ):
+            store_commits_batch(commits_batch)
             commits_batch = []
+        commits_batch.append(item)
 
-    store_commits_batch(repo["tm_id"], commits_batch)
+    store_commits_batch(commits_batch)
 
-    log.info(
-        f"Ingested commits for repo {repo['name']}: {num_commits} commit(s), {num_commit_diffs} diff(s)"
-    )
+    if churn_rollup is not None:
+        for repo_id, repo in repos.items():
+            churn_records = churn_rollup.records(repo_id)
+            store_fn(GIT_CHURN_DAILY_TYPE, repo_id, churn_records)
+            log.info(
+                f"Ingested {len(churn_records)} daily churn rollup(s) for repo {repo['name']}"
+            )
+
+    for repo_id, repo in repos.items():
+        log.info(
+            f"Ingested commits for repo {repo['name']}: {num_commits[repo_id]} commit(s), {num_commit_diffs[repo_id]} diff(s)"
+        )
+        if num_users[repo_id]:
+            log.info(f"Ingested {num_users[repo_id]} user(s) for repo {repo['name']}")
+        if num_commits_diffs_skipped[repo_id]:
+            log.warning(
+                f"Diffs skipped for {num_commits_diffs_skipped[repo_id]} commit(s) of repo {repo['name']} - see diffs_skipped"
+            )
+
+    return {
+        "commits": sum(num_commits.values()),
+        "diffs": sum(num_commit_diffs.values()),
+        "commits_diffs_skipped": sum(num_commits_diffs_skipped.values()),
+        "phase_sec": dict(extractor.phase_sec),
+    }
 
 
 def ingest_repo_to_jsonl(
@@ -432,30 +1158,49 @@ def ingest_repo_to_jsonl(
     use_non_native_repo_db=False,
     start_date=None,
     end_date=None,
+    resume=False,
+    compact_diffs=False,
+    **extractor_kwargs,
 ):
-    output_dir = output_dir or os.path.join(".", "out")
-    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    """
+    Extract a repo to JSONL files in output_dir. Files are written with a .partial
+    suffix, and renamed into place once extraction completes.
 
-    # in order to support batched writes, jsonl writer overwrites any existing files
-    # at the beginning of the run, then appends
-    appendable_file_paths = set()
+    With compact_diffs, diffs are written in the compact schema - see diff_schema.
 
-    def jsonl_writer(type_, id_, iter):
-        output_filename = generate_git_export_file_name(
-            "jsonl", customer_id, source_id, id_, type_
-        )
-        path = os.path.join(output_dir, output_filename)
-        is_path_appendable = path in appendable_file_paths
+    Progress is checkpointed after each stored batch of commits - with resume, an
+    interrupted extraction with the same parameters continues from its checkpoint.
+    """
+    if resume and extractor_kwargs.get("churn_daily"):
+        # rollups are stored at the end, so would only cover the resumed part
+        raise ValueError(f"Resume is not supported with daily churn rollups")
 
-        srsly.write_jsonl(path, iter, append=is_path_appendable)
-        appendable_file_paths.add(path)
+    output_dir = output_dir or os.path.join(".", "out")
+    checkpoint_params = _checkpoint_params(
+        customer_id,
+        source_id,
+        repo_path,
+        branch,
+        start_date=start_date,
+        end_date=end_date,
+        compact_diffs=compact_diffs,
+        **extractor_kwargs,
+    )
+    sink = JsonlFileSink(
+        customer_id,
+        source_id,
+        output_dir,
+        checkpoint_params,
+        resume=resume,
+        compact_diffs=compact_diffs,
+    )
 
     ingest_and_store_repo(
         customer_id,
         source_id,
         repo_path,
         branch,
-        store_fn=jsonl_writer,
+        store_fn=sink,
         fallback_branch=(
             "main" if branch == "master" and fall_back_from_master_to_main else None
         ),
@@ -464,26 +1209,506 @@ def ingest_repo_to_jsonl(
         use_non_native_repo_db=use_non_native_repo_db,
         start_date=start_date,
         end_date=end_date,
+        resume_after=sink.checkpoint["last_hexsha"] if sink.checkpoint else None,
+        batch_stored_fn=sink.write_checkpoint,
+        **extractor_kwargs,
     )
+    sink.close()
 
 
-def update_repo(repo_dir, branch):
-    """Do a git pull on given repo clone without local changes"""
+def ingest_repo_to_sink(
+    customer_id,
+    source_id,
+    repo_path,
+    branch,
+    sink,
+    fall_back_from_master_to_main=True,
+    **kwargs,
+):
+    """
+    Extract a repo to a sink - see sinks. kwargs are passed on to
+    ingest_and_store_repo, e.g. start_date, and GitRepoExtractor.
+    """
+    with sink:
+        return ingest_and_store_repo(
+            customer_id,
+            source_id,
+            repo_path,
+            branch,
+            store_fn=sink,
+            fallback_branch=(
+                "main" if branch == "master" and fall_back_from_master_to_main else None
+            ),
+            batch_stored_fn=sink.batch_stored,
+            **kwargs,
+        )
+
+
+class JsonlFileSink(sinks.Sink):
+    """
+    Writes records to a JSONL file per repo and type in output_dir. Files are written
+    with a .partial suffix, and renamed into place on close.
+
+    Checkpoints are written via write_checkpoint - with resume, files are appended to
+    as they were at the checkpoint, if one was written with the same params.
+    """
+
+    name = sinks.FILE_SINK
+
+    def __init__(
+        self,
+        customer_id,
+        source_id,
+        output_dir,
+        checkpoint_params,
+        resume=False,
+        compact_diffs=False,
+    ):
+        super().__init__()
+        self.customer_id = customer_id
+        self.source_id = source_id
+        self.output_dir = output_dir
+        self.checkpoint_params = checkpoint_params
+        self.compact_diffs = compact_diffs
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+        self.checkpoint_path = os.path.join(output_dir, CHECKPOINT_FILE_NAME)
+        self.checkpoint = (
+            _read_checkpoint(self.checkpoint_path, checkpoint_params)
+            if resume
+            else None
+        )
+
+        # in order to support batched writes, files are overwritten at the beginning
+        # of the run, then appended to - or on resume, appended to as they were at
+        # the checkpoint
+        self.appendable_file_paths = set()
+        self.resumed_file_sizes = (
+            self.checkpoint["file_sizes"] if self.checkpoint else {}
+        )
+        for output_filename, size in self.resumed_file_sizes.items():
+            # drop anything written after the checkpoint - whether or not the file
+            # is written to again
+            path = os.path.join(output_dir, output_filename + PARTIAL_FILE_SUFFIX)
+            with open(path, "r+b") as f:
+                f.truncate(size)
+            self.appendable_file_paths.add(path)
+        self.resumed_user_ids = {}
+        # compact diffs - an encoder per file, and hexshas of the latest commits written
+        self.diff_encoders = {}
+        self.commit_hexshas = {}
+
+    def write(self, type_, id_, records):
+        output_filename = generate_git_export_file_name(
+            "jsonl", self.customer_id, self.source_id, id_, type_
+        )
+        path = os.path.join(self.output_dir, output_filename + PARTIAL_FILE_SUFFIX)
+        is_path_appendable = path in self.appendable_file_paths
+
+        if (
+            type_ == GIT_USER_TYPE
+            and output_filename in self.resumed_file_sizes
+            and path not in self.resumed_user_ids
+        ):
+            # users are deduplicated within a run - skip those already written
+            self.resumed_user_ids[path] = {
+                user["tm_id"] for user in srsly.read_jsonl(path)
+            }
+
+        if path in self.resumed_user_ids:
+            records = [
+                user
+                for user in records
+                if user["tm_id"] not in self.resumed_user_ids[path]
+            ]
+            if not records:
+                return 0
+
+        if self.compact_diffs and type_ == GIT_COMMIT_TYPE:
+            self.commit_hexshas.clear()
+            self.commit_hexshas.update(
+                {commit["tm_id"]: commit["hexsha"] for commit in records}
+            )
+        if self.compact_diffs and type_ == GIT_COMMIT_DIFF_TYPE:
+            if path not in self.diff_encoders:
+                self.diff_encoders[path] = diff_schema.CompactDiffEncoder()
+                if is_path_appendable:
+                    self.diff_encoders[path].load(srsly.read_jsonl(path))
+            records = self.diff_encoders[path].encode(records, self.commit_hexshas)
+
+        size = os.path.getsize(path) if is_path_appendable else 0
+        srsly.write_jsonl(path, records, append=is_path_appendable)
+        self.appendable_file_paths.add(path)
+        return os.path.getsize(path) - size
+
+    def write_checkpoint(self, hexsha):
+        file_sizes = {}
+        for path in self.appendable_file_paths:
+            with open(path, "rb") as f:
+                os.fsync(f.fileno())
+            file_sizes[os.path.basename(path)[: -len(PARTIAL_FILE_SUFFIX)]] = (
+                os.path.getsize(path)
+            )
+
+        # repo files are rewritten in full on resume
+        _write_json_atomic(
+            self.checkpoint_path,
+            {
+                "params": self.checkpoint_params,
+                "last_hexsha": hexsha,
+                "file_sizes": {
+                    **self.resumed_file_sizes,
+                    **{
+                        name: size
+                        for name, size in file_sizes.items()
+                        if not name.endswith(f"__{GIT_REPO_TYPE}.jsonl")
+                    },
+                },
+            },
+        )
+
+    def close(self):
+        # finalise - including files resumed from a checkpoint with no new commits
+        for path in self.appendable_file_paths:
+            os.replace(path, path[: -len(PARTIAL_FILE_SUFFIX)])
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+        super().close()
+
+
+def date_windows(start_date, end_date, num_windows, whole_days=False):
+    """
+    Split [start_date, end_date) into up to num_windows contiguous windows, on whole
+    seconds - each window's end is the next one's start, so that with
+    _date_filter_predicate every commit falls in exactly one window. With
+    whole_days, windows start at midnight, bar the first.
+    """
+    start, end = [
+        d if isinstance(d, datetime) else datetime.combine(d, datetime.min.time())
+        for d in (start_date, end_date)
+    ]
+    if end <= start:
+        raise ValueError(f"End date {end_date} must be after start date {start_date}")
+    if num_windows < 1:
+        raise ValueError(f"Number of date windows must be positive: {num_windows}")
+
+    span_sec = int((end - start).total_seconds())
+    boundaries = {
+        start + timedelta(seconds=span_sec * i // num_windows)
+        for i in range(num_windows)
+    }
+    if whole_days:
+        boundaries = {start} | {
+            datetime.combine(b.date(), datetime.min.time())
+            for b in boundaries
+            if b.date() > start.date()
+        }
+    boundaries = sorted(boundaries) + [end]
+
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
 
-    def run_cmd(cmd):
-        assert isinstance(cmd, (list, tuple)), "command must be a list or tuple"
-        log.info(f"Running command {' ' .join(cmd)} in {repo_dir}")
+def _revs(branch):
+    return branch if isinstance(branch, (list, tuple)) else [branch]
 
-        result = subprocess.run(
-            cmd, cwd=repo_dir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+
+def _ingest_to_jsonl(kwargs):
+    # module level, so it can be run in a worker process
+    ingest_repo_to_jsonl(**kwargs)
+    return kwargs["output_dir"]
+
+
+def ingest_repo_to_jsonl_in_windows(
+    customer_id,
+    source_id,
+    repo_path,
+    branch,
+    output_dir,
+    start_date,
+    end_date,
+    num_windows,
+    max_workers=None,
+    **kwargs,
+):
+    """
+    Backfill a repo by splitting [start_date, end_date) into date windows, extracting
+    each concurrently in its own process, into its own output subdir. A manifest of
+    the windows is written to output_dir once all are done. Returns the window dirs.
+
+    kwargs are passed on to ingest_repo_to_jsonl - e.g. merge_diffs, or resume to
+    resume each window from its own checkpoint.
+    """
+    if kwargs.get("commit_cache") is not None:
+        # a SQLite cache can't be shared across processes' long write transactions
+        raise ValueError("Commit cache is not supported with date windows")
+
+    # daily churn rollups are only of days wholly in a window
+    windows = date_windows(
+        start_date,
+        end_date,
+        num_windows,
+        whole_days=bool(kwargs.get("churn_daily")),
+    )
+    window_kwargs = [
+        dict(
+            customer_id=customer_id,
+            source_id=source_id,
+            repo_path=repo_path,
+            branch=branch,
+            output_dir=os.path.join(output_dir, WINDOW_DIR_NAME_FORMAT.format(idx)),
+            start_date=window_start,
+            end_date=window_end,
+            **kwargs,
         )
-        output = result.stdout.decode("utf-8")
-        log.debug(f"Command output:\n{output}")
+        for idx, (window_start, window_end) in enumerate(windows)
+    ]
 
-        if result.returncode != 0:
-            raise RuntimeError(
-                f"Command exited with non-zero status code {result.returncode} - output was:\n{output}"
+    log.info(
+        f"Extracting {len(windows)} date window(s) from {start_date} to {end_date}"
+    )
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # raises the first window error, if any
+        window_dirs = list(executor.map(_ingest_to_jsonl, window_kwargs))
+
+    _write_json_atomic(
+        os.path.join(output_dir, WINDOWS_MANIFEST_FILE_NAME),
+        {
+            "start_date": str(start_date),
+            "end_date": str(end_date),
+            "windows": [
+                {
+                    "dir": os.path.basename(window["output_dir"]),
+                    "start_date": str(window["start_date"]),
+                    "end_date": str(window["end_date"]),
+                }
+                for window in window_kwargs
+            ],
+        },
+    )
+    return window_dirs
+
+
+def _repo_name_from_url(url):
+    name = re.split(r"[/:]", url.rstrip("/"))[-1]
+    return name[: -len(".git")] if name.endswith(".git") else name
+
+
+def discover_submodules(repo, rev):
+    """
+    Submodules of a repo at rev, from its .gitmodules and the gitlinks in its tree -
+    as (path, url, pinned commit hexsha) tuples, ordered by path. Entries of
+    .gitmodules without a gitlink at rev are left out.
+    """
+    try:
+        if not repo.git.ls_tree("--name-only", rev, "--", ".gitmodules"):
+            return []
+        config = repo.git.config("-z", "--blob", f"{rev}:.gitmodules", "--list")
+    except git.GitCommandError as e:
+        log.warning(f"Could not read submodules at {rev}: {e}")
+        return []
+
+    # with -z, entries end with a NUL, and keys end with a newline
+    submodules = defaultdict(dict)
+    for entry in config.split("\x00"):
+        key, _, value = entry.partition("\n")
+        if not key.startswith("submodule."):
+            continue
+        name, _, attr = key[len("submodule.") :].rpartition(".")
+        submodules[name][attr] = value
+
+    urls = {sub["path"]: sub.get("url") for sub in submodules.values() if "path" in sub}
+    if not urls:
+        return []
+
+    gitlinks = {}
+    for entry in repo.git.ls_tree("-z", rev, "--", *urls).split("\x00"):
+        if not entry:
+            continue
+        meta, path = entry.split("\t", 1)
+        _, type_, hexsha = meta.split()
+        if type_ == "commit" and path in urls:
+            gitlinks[path] = hexsha
+
+    return [(path, urls[path], gitlinks[path]) for path in sorted(gitlinks)]
+
+
+def ingest_repo_to_jsonl_with_submodules(
+    customer_id,
+    source_id,
+    repo_path,
+    branch,
+    output_dir,
+    max_workers=None,
+    forced_repo_name=None,
+    fall_back_from_master_to_main=True,
+    **kwargs,
+):
+    """
+    Extract a repo and its submodules concurrently, each in its own process - the
+    repo into output_dir, and submodules into subdirs of its submodules dir.
+    Returns the output dirs.
+
+    Submodules are those at branch, recursively, each extracted up to its pinned
+    commit. Each gets its own repo id, and is linked to its parent by the
+    parent_repo_id and parent_path of its repo record. Submodules that aren't
+    checked out are skipped, as are repeats of a submodule.
+
+    kwargs are passed on to ingest_repo_to_jsonl - e.g. merge_diffs, or resume to
+    resume each repo from its own checkpoint. The repo must be a local checkout,
+    with its submodules checked out, and branch a single branch.
+    """
+    if kwargs.get("commit_cache") is not None:
+        # a SQLite cache can't be shared across processes' long write transactions
+        raise ValueError("Commit cache is not supported with submodules")
+    if is_clone_url(repo_path):
+        raise ValueError("Submodules need a local checkout of the repo, not a URL")
+    if not isinstance(branch, str) or is_branch_glob(branch):
+        raise ValueError("Submodules are only supported for a single branch")
+
+    repo = git.Repo(repo_path)
+    rev = branch
+    if fall_back_from_master_to_main and branch == "master":
+        try:
+            repo.rev_parse(branch)
+        except git.BadName:
+            rev = "main"
+
+    repo_name = forced_repo_name or get_repo_name_from_remote(repo)
+    # as the extractor generates it
+    repo_id = tm_id.git_repo(customer_id, source_id, get_repo_name_from_remote(repo))
+    jobs = [
+        dict(
+            customer_id=customer_id,
+            source_id=source_id,
+            repo_path=repo_path,
+            branch=branch,
+            output_dir=output_dir,
+            forced_repo_name=forced_repo_name,
+            fall_back_from_master_to_main=fall_back_from_master_to_main,
+            **kwargs,
+        )
+    ]
+
+    # breadth first, through submodules of submodules
+    seen_names = {repo_name}
+    parents = [(repo, rev, repo_name, repo_id)]
+    while parents:
+        parent, parent_rev, parent_name, parent_repo_id = parents.pop(0)
+        for path, url, hexsha in discover_submodules(parent, parent_rev):
+            submodule_path = os.path.join(parent.working_tree_dir, path)
+            try:
+                submodule = git.Repo(submodule_path)
+            except (git.InvalidGitRepositoryError, git.NoSuchPathError):
+                log.warning(
+                    f"Skipping submodule {path} of {parent_name} - not checked out"
+                )
+                continue
+
+            name = get_repo_name_from_remote(submodule) or _repo_name_from_url(
+                url or path
+            )
+            if name in seen_names:
+                log.info(f"Skipping submodule {path} of {parent_name} - seen already")
+                continue
+            seen_names.add(name)
+
+            log.info(f"Found submodule {name} at {path} of {parent_name}")
+            # explicit, as submodules cloned from local paths have no name in their
+            # remote to generate it from
+            submodule_repo_id = tm_id.git_repo(
+                customer_id, source_id, get_repo_name_from_remote(submodule) or name
+            )
+            jobs.append(
+                dict(
+                    customer_id=customer_id,
+                    source_id=source_id,
+                    repo_path=submodule_path,
+                    branch=hexsha,
+                    output_dir=os.path.join(output_dir, SUBMODULES_DIR_NAME, name),
+                    forced_repo_name=name,
+                    fall_back_from_master_to_main=False,
+                    repo_tm_id=submodule_repo_id,
+                    parent_repo_id=parent_repo_id,
+                    parent_path=path,
+                    **kwargs,
+                )
             )
+            parents.append((submodule, hexsha, name, submodule_repo_id))
+
+    log.info(f"Extracting {repo_name} and {len(jobs) - 1} submodule(s)")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # raises the first error, if any
+        return list(executor.map(_ingest_to_jsonl, jobs))
+
+
+def _checkpoint_params(*args, **kwargs):
+    # commit_cache has no bearing on output
+    kwargs.pop("commit_cache", None)
+    return json.loads(json.dumps([args, kwargs], sort_keys=True, default=str))
+
+
+def _read_checkpoint(checkpoint_path, checkpoint_params):
+    if not os.path.exists(checkpoint_path):
+        log.info("No checkpoint to resume from - starting from scratch")
+        return None
+
+    with open(checkpoint_path) as f:
+        checkpoint = json.load(f)
+
+    if checkpoint["params"] != checkpoint_params:
+        raise ValueError(
+            f"Checkpoint {checkpoint_path} is for an extraction with different "
+            "parameters - remove it to start from scratch"
+        )
+
+    log.info(f"Resuming from checkpoint {checkpoint_path}")
+    return checkpoint
+
+
+def _write_json_atomic(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _run_cmd(cmd, repo_dir):
+    assert isinstance(cmd, (list, tuple)), "command must be a list or tuple"
+    log.info(f"Running command {' ' .join(cmd)} in {repo_dir}")
+
+    result = subprocess.run(
+        cmd, cwd=repo_dir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+    )
+    output = result.stdout.decode("utf-8")
+    log.debug(f"Command output:\n{output}")
+
+    if result.returncode != 0:
+        raise RuntimeError(
+            f"Command exited with non-zero status code {result.returncode} - output was:\n{output}"
+        )
+
+
+def update_repo(repo_dir, branch):
+    """Do a git pull on given repo clone without local changes"""
+    _run_cmd(["git", "checkout", branch], repo_dir)
+    _run_cmd(["git", "pull"], repo_dir)
+
+
+def write_commit_graph(repo_dir, changed_paths=True):
+    """
+    Write or refresh the commit-graph of a repo clone, for all reachable commits.
+    History walks then read commit parents and dates from the graph, rather than
+    parsing commit objects.
+
+    With changed_paths, changed-path Bloom filters are also written - these let git
+    skip diffing trees of commits that can't touch a path, for path-limited history.
+    Filters already in the graph are reused, so refreshing after a pull is cheap.
+    """
+    cmd = ["git", "commit-graph", "write", "--reachable"]
+    if changed_paths:
+        cmd.append("--changed-paths")
 
-    run_cmd(["git", "checkout", branch])
-    run_cmd(["git", "pull"])
+    _run_cmd(cmd, repo_dir)
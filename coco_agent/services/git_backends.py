@@ -0,0 +1,687 @@
+import abc
+import logging
+import re
+from collections import defaultdict
+
+import git
+from git.diff import decode_path
+from gitdb.util import hex_to_bin
+
+log = logging.getLogger(__name__)
+
+GITPYTHON_BACKEND = "gitpython"
+PYGIT2_BACKEND = "pygit2"
+
+# rename detection is quadratic in the number of added x deleted files - it can be
+# turned off, or limited to exact (i.e. content-identical) renames, which are cheap
+RENAME_DETECTION_ON = "on"
+RENAME_DETECTION_EXACT = "exact"
+RENAME_DETECTION_OFF = "off"
+RENAME_DETECTION_MODES = (
+    RENAME_DETECTION_ON,
+    RENAME_DETECTION_EXACT,
+    RENAME_DETECTION_OFF,
+)
+RENAME_LIMIT_WARNING_REGEX = re.compile(r"rename detection was skipped")
+DEFAULT_RENAME_LIMIT = 1000
+HUNK_HEADER_REGEX = re.compile(rb"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+class HunkCollector:
+    """
+    Changed line ranges of a commit's files, as [old start, old lines, new start,
+    new lines] per hunk - with caps on changed lines, so that e.g. huge generated
+    files don't blow up runtime or record sizes.
+
+    Past max_file_lines, all of a file's hunks are dropped, and the file marked
+    truncated. Past max_commit_lines in all, the file being collected is marked
+    truncated, keeping its hunks so far, and add returns False - collection should
+    stop.
+    """
+
+    def __init__(self, max_file_lines=None, max_commit_lines=None):
+        self.max_file_lines = max_file_lines
+        self.max_commit_lines = max_commit_lines
+        self.hunks = {}
+        self.truncated_paths = set()
+        self.commit_truncated = False
+        self._file_lines = {}
+        self._commit_lines = 0
+
+    def add_file(self, path):
+        self.hunks.setdefault(path, [])
+        self._file_lines.setdefault(path, 0)
+
+    def add(self, path, old_start, old_lines, new_start, new_lines):
+        self.add_file(path)
+        changed_lines = old_lines + new_lines
+        self._file_lines[path] += changed_lines
+        self._commit_lines += changed_lines
+
+        if (
+            self.max_commit_lines is not None
+            and self._commit_lines > self.max_commit_lines
+        ):
+            self.truncated_paths.add(path)
+            self.commit_truncated = True
+            return False
+
+        if (
+            self.max_file_lines is not None
+            and self._file_lines[path] > self.max_file_lines
+        ):
+            self.truncated_paths.add(path)
+            self.hunks[path] = []
+        elif path not in self.truncated_paths:
+            self.hunks[path].append([old_start, old_lines, new_start, new_lines])
+        return True
+
+
+def _patch_path(line):
+    # "--- a/path" / "+++ b/path", with a tab after paths containing spaces
+    path = line[4:].rstrip(b"\n")
+    if path.endswith(b"\t"):
+        path = path[:-1]
+    path = decode_path(path)
+    return path.decode("utf-8", "replace") if path is not None else None
+
+
+def collect_patch_hunks(lines, collector):
+    """
+    Collect hunks from the lines (bytes) of a patch generated with -U0, consuming
+    them one at a time - so that patch text is never held in memory. Stops early
+    once the collector's commit cap is hit.
+    """
+    a_path = path = None
+    remaining = 0
+    for line in lines:
+        if remaining:
+            # hunk body - "\ No newline at end of file" markers aren't counted
+            if line[:1] in (b"-", b"+"):
+                remaining -= 1
+            continue
+
+        if line.startswith(b"diff "):
+            a_path = path = None
+        elif line.startswith(b"--- "):
+            a_path = _patch_path(line)
+        elif line.startswith(b"+++ "):
+            path = _patch_path(line) or a_path
+            collector.add_file(path)
+        elif line.startswith(b"@@ ") and path is not None:
+            old_start, old_lines, new_start, new_lines = (
+                1 if group is None else int(group)
+                for group in HUNK_HEADER_REGEX.match(line).groups()
+            )
+            remaining = old_lines + new_lines
+            if not collector.add(path, old_start, old_lines, new_start, new_lines):
+                return collector
+
+    return collector
+
+
+class GitBackend(abc.ABC):
+    """
+    Hot path git operations for extraction: commit iteration, tree diffs, numstat and
+    blob sizes. Opening / cloning, refs and remotes stay with the GitPython repo.
+
+    Commits and diffs are GitPython objects, or objects with the same attributes, so
+    that records built from them are the same whichever backend is used.
+
+    Paths are limited with a PathFilter, when given. timeout is the time left for the
+    operation, in seconds - backends that run git processes kill them when it's up.
+    """
+
+    name = None
+
+    def __init__(self, repo):
+        self.repo = repo
+
+    @abc.abstractmethod
+    def iter_commits(self, rev, reverse=True, first_parent=False):
+        """
+        Commits reachable from rev - a rev spec or a list of them. Raises
+        git.GitCommandError for unknown revs, as GitPython does.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def tree_diff(
+        self,
+        commit,
+        path_filter=None,
+        rename_detection=RENAME_DETECTION_ON,
+        rename_limit=None,
+        timeout=None,
+    ):
+        """
+        Diffs of a commit against its first parent - or against the index for root
+        commits, as commit.diff(). Returns a 2-tuple of (diffs, rename limit hit).
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def numstat(self, commit, path_filter=None, timeout=None):
+        """
+        Per-file insertions / deletions of a commit against its first parent, or the
+        empty tree for root commits - as commit.stats.files, without rename detection
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def hunks(
+        self,
+        commit,
+        path_filter=None,
+        max_file_lines=None,
+        max_commit_lines=None,
+        timeout=None,
+    ):
+        """
+        Changed line ranges per file of a commit against its first parent, or the
+        empty tree for root commits - without rename detection, as numstat. Returns
+        a HunkCollector.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def combined_diff_paths(self, commit, path_filter=None, timeout=None):
+        """Paths of a merge commit that differ from all of its parents"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def blob_size(self, hexsha):
+        raise NotImplementedError
+
+    def interrupt(self):
+        """Kill any running git processes - may be called from another thread"""
+        pass
+
+    def reset(self):
+        """Recover after interrupt()"""
+        pass
+
+
+class GitPythonBackend(GitBackend):
+    """Runs git commands via GitPython, as the default git command line"""
+
+    name = GITPYTHON_BACKEND
+
+    def __init__(self, repo):
+        super().__init__(repo)
+        # streaming patch process of hunks(), if running
+        self._hunks_proc = None
+
+    @staticmethod
+    def _pathspecs(path_filter):
+        return path_filter.pathspecs if path_filter else []
+
+    def iter_commits(self, rev, reverse=True, first_parent=False):
+        rev_list_kwargs = dict(first_parent=True) if first_parent else {}
+        return self.repo.iter_commits(rev, reverse=reverse, **rev_list_kwargs)
+
+    def tree_diff(
+        self,
+        commit,
+        path_filter=None,
+        rename_detection=RENAME_DETECTION_ON,
+        rename_limit=None,
+        timeout=None,
+    ):
+        # as commit.parents[0].diff(commit) - but run directly, so that git's stderr
+        # (i.e. rename limit warnings) is available
+        if commit.parents:
+            diff_cmd = self.repo.git.diff_tree
+            revs = [commit.parents[0].hexsha, "-r", commit.hexsha]
+        else:
+            # as commit.diff(), i.e. against the index
+            diff_cmd = self.repo.git.diff
+            revs = [commit.hexsha, "--cached"]
+
+        if rename_detection == RENAME_DETECTION_OFF:
+            rename_args = ["--no-renames"]
+        else:
+            rename_args = (
+                ["--find-renames=100%"]
+                if rename_detection == RENAME_DETECTION_EXACT
+                else ["-M"]
+            )
+            if rename_limit is not None:
+                rename_args.append(f"-l{rename_limit}")
+
+        pathspecs = self._pathspecs(path_filter)
+        _, stdout, stderr = diff_cmd(
+            *revs,
+            "--abbrev=40",
+            "--full-index",
+            *rename_args,
+            "--raw",
+            "-z",
+            "--no-color",
+            *(["--", *pathspecs] if pathspecs else []),
+            with_extended_output=True,
+            stdout_as_string=False,
+            kill_after_timeout=timeout,
+        )
+
+        index = git.DiffIndex()
+        git.diff.Diff._handle_diff_line(stdout, self.repo, index)
+        return index, bool(RENAME_LIMIT_WARNING_REGEX.search(stderr))
+
+    def numstat(self, commit, path_filter=None, timeout=None):
+        pathspecs = self._pathspecs(path_filter)
+        if not commit.parents:
+            text = self.repo.git.diff_tree(
+                commit.hexsha,
+                "--",
+                *pathspecs,
+                numstat=True,
+                no_renames=True,
+                root=True,
+                kill_after_timeout=timeout,
+            )
+            # first line is the commit sha
+            text = "\n".join(text.splitlines()[1:])
+        else:
+            text = self.repo.git.diff(
+                commit.parents[0].hexsha,
+                commit.hexsha,
+                "--",
+                *pathspecs,
+                numstat=True,
+                no_renames=True,
+                kill_after_timeout=timeout,
+            )
+        return git.Stats._list_from_string(self.repo, text).files
+
+    def hunks(
+        self,
+        commit,
+        path_filter=None,
+        max_file_lines=None,
+        max_commit_lines=None,
+        timeout=None,
+    ):
+        # streamed from a single git process, which the deadline watchdog kills via
+        # interrupt() - GitPython can't time out a process it doesn't wait for
+        revs = (
+            [commit.parents[0].hexsha, commit.hexsha]
+            if commit.parents
+            else ["--root", commit.hexsha]
+        )
+        pathspecs = self._pathspecs(path_filter)
+        cmd = self.repo.git.diff_tree(
+            "-r",
+            "-p",
+            "-U0",
+            "--no-renames",
+            "--no-color",
+            "--no-ext-diff",
+            "--no-textconv",
+            "--no-commit-id",
+            *revs,
+            *(["--", *pathspecs] if pathspecs else []),
+            as_process=True,
+        )
+        self._hunks_proc = cmd.proc
+        try:
+            collector = collect_patch_hunks(
+                cmd.proc.stdout, HunkCollector(max_file_lines, max_commit_lines)
+            )
+        finally:
+            self._hunks_proc = None
+
+        if collector.commit_truncated:
+            cmd.proc.kill()
+            cmd.proc.wait()
+        else:
+            # raises GitCommandError if git failed, or was killed
+            cmd.wait()
+        return collector
+
+    def combined_diff_paths(self, commit, path_filter=None, timeout=None):
+        text = self.repo.git.diff_tree(
+            "-c",
+            "-r",
+            "-z",
+            commit.hexsha,
+            "--",
+            *self._pathspecs(path_filter),
+            name_only=True,
+            no_commit_id=True,
+            kill_after_timeout=timeout,
+        )
+        return [path for path in text.split("\x00") if path]
+
+    def blob_size(self, hexsha):
+        return self.repo.odb.info(hex_to_bin(hexsha)).size
+
+    def interrupt(self):
+        # persistent cat-file processes, used for blob lookups
+        for name in ("cat_file_header", "cat_file_all"):
+            cmd = getattr(self.repo.git, name, None)
+            if cmd is not None and cmd.proc is not None:
+                cmd.proc.kill()
+
+        hunks_proc = self._hunks_proc
+        if hunks_proc is not None:
+            hunks_proc.kill()
+
+    def reset(self):
+        for name in ("cat_file_header", "cat_file_all"):
+            cmd = getattr(self.repo.git, name, None)
+            if cmd is None:
+                continue
+            try:
+                cmd.__del__()
+            except BrokenPipeError:
+                # a killed process can't take input still buffered for it - it's
+                # gone regardless
+                pass
+        self.repo.git.clear_cache()
+
+
+class _Pygit2Actor:
+    __slots__ = ("name", "email")
+
+    def __init__(self, signature):
+        # decoded as GitPython does
+        self.name = signature.raw_name.decode("utf-8", "replace")
+        self.email = signature.raw_email.decode("utf-8", "replace")
+
+
+class _Pygit2Commit:
+    """pygit2 commit, with the GitPython commit attributes used for extraction"""
+
+    def __init__(self, commit):
+        self._commit = commit
+        self.hexsha = str(commit.id)
+
+    @property
+    def parents(self):
+        return [_Pygit2Commit(parent) for parent in self._commit.parents]
+
+    @property
+    def author(self):
+        return _Pygit2Actor(self._commit.author)
+
+    @property
+    def committer(self):
+        return _Pygit2Actor(self._commit.committer)
+
+    @property
+    def authored_date(self):
+        return self._commit.author.time
+
+    @property
+    def committed_date(self):
+        return self._commit.commit_time
+
+    @property
+    def message(self):
+        encoding = self._commit.message_encoding or "utf-8"
+        return self._commit.raw_message.decode(encoding, "replace")
+
+    @property
+    def summary(self):
+        return self.message.split("\n", 1)[0]
+
+
+class _Pygit2Blob:
+    __slots__ = ("_backend", "hexsha")
+
+    def __init__(self, backend, hexsha):
+        self._backend = backend
+        self.hexsha = hexsha
+
+    @property
+    def size(self):
+        return self._backend.blob_size(self.hexsha)
+
+
+class _Pygit2Diff:
+    """pygit2 diff delta, with the GitPython diff attributes used for extraction"""
+
+    def __init__(self, backend, delta, status=None):
+        pygit2 = backend._pygit2
+        status = delta.status if status is None else status
+        self.a_path = delta.old_file.path
+        self.b_path = delta.new_file.path
+        self.new_file = status == pygit2.GIT_DELTA_ADDED
+        self.deleted_file = status == pygit2.GIT_DELTA_DELETED
+        self.renamed = status == pygit2.GIT_DELTA_RENAMED
+
+        if self.new_file:
+            # as GitPython, a_path is set for new files - to the new path
+            self.a_path = self.b_path
+        if self.deleted_file:
+            self.b_path = self.a_path
+
+        self.a_blob = (
+            None if self.new_file else _Pygit2Blob(backend, str(delta.old_file.id))
+        )
+        self.b_blob = (
+            None if self.deleted_file else _Pygit2Blob(backend, str(delta.new_file.id))
+        )
+
+
+def _rename_limit_exceeded(pygit2, deltas, rename_limit):
+    """
+    Whether git would skip inexact rename detection for deltas - when the adds x
+    deletes left after exact renames are more than rename_limit squared
+    """
+    limit = DEFAULT_RENAME_LIMIT if rename_limit is None else rename_limit
+    if limit <= 0:
+        # unlimited, as for git
+        return False
+
+    added, deleted = defaultdict(int), defaultdict(int)
+    for delta in deltas:
+        if delta.status == pygit2.GIT_DELTA_ADDED:
+            added[delta.new_file.id] += 1
+        elif delta.status == pygit2.GIT_DELTA_DELETED:
+            deleted[delta.old_file.id] += 1
+    num_exact = sum(min(count, deleted[id_]) for id_, count in added.items())
+    num_added = sum(added.values()) - num_exact
+    num_deleted = sum(deleted.values()) - num_exact
+
+    return not (
+        (num_added <= limit or num_deleted <= limit)
+        and num_added * num_deleted <= limit * limit
+    )
+
+
+class Pygit2Backend(GitBackend):
+    """
+    In-process libgit2 backend - no git processes, so timeouts are only checked
+    between operations. Requires pygit2 (pip install pygit2).
+
+    Paths are filtered after diffing, as pygit2 doesn't take pathspecs - renames
+    across a filter boundary are reported as an add or delete, as by git.
+    """
+
+    name = PYGIT2_BACKEND
+
+    def __init__(self, repo):
+        super().__init__(repo)
+        try:
+            import pygit2
+        except ImportError as e:
+            raise ImportError(
+                f"pygit2 is required for the {PYGIT2_BACKEND} backend - pip install pygit2"
+            ) from e
+
+        self._pygit2 = pygit2
+        self._repo = pygit2.Repository(repo.git_dir)
+
+    def _resolve(self, rev):
+        try:
+            return self._repo.revparse_single(rev).peel(self._pygit2.Commit)
+        except (KeyError, ValueError, self._pygit2.GitError):
+            raise git.GitCommandError(
+                ["rev-list", rev], 128, f"fatal: bad revision '{rev}'"
+            )
+
+    def _walk_revs(self, revs):
+        """Commits to walk from and to hide, for revs and old..new or ^rev ranges"""
+        tips, hidden = [], []
+        for rev in revs:
+            if "..." in rev:
+                raise ValueError(
+                    f"Symmetric difference ranges aren't supported by the "
+                    f"{PYGIT2_BACKEND} backend: {rev}"
+                )
+            if ".." in rev:
+                old, new = rev.split("..", 1)
+                hidden.append(self._resolve(old or "HEAD"))
+                tips.append(self._resolve(new or "HEAD"))
+            elif rev.startswith("^"):
+                hidden.append(self._resolve(rev[1:]))
+            else:
+                tips.append(self._resolve(rev))
+        return tips, hidden
+
+    def iter_commits(self, rev, reverse=True, first_parent=False):
+        tips, hidden = self._walk_revs(rev if isinstance(rev, (list, tuple)) else [rev])
+
+        sort_mode = self._pygit2.GIT_SORT_TIME
+        if reverse:
+            sort_mode |= self._pygit2.GIT_SORT_REVERSE
+
+        walker = self._repo.walk(None, sort_mode)
+        for tip in tips:
+            walker.push(tip.id)
+        for commit in hidden:
+            walker.hide(commit.id)
+        if first_parent:
+            walker.simplify_first_parent()
+
+        for commit in walker:
+            yield _Pygit2Commit(commit)
+
+    def _diff(self, commit, against_index=True, **diff_kwargs):
+        pygit2_commit = self._repo[commit.hexsha]
+        if pygit2_commit.parents:
+            return self._repo.diff(
+                pygit2_commit.parents[0], pygit2_commit, **diff_kwargs
+            )
+        if against_index:
+            # as commit.diff(), i.e. against the index
+            return pygit2_commit.tree.diff_to_index(self._repo.index, **diff_kwargs)
+        return pygit2_commit.tree.diff_to_tree(swap=True, **diff_kwargs)
+
+    def tree_diff(
+        self,
+        commit,
+        path_filter=None,
+        rename_detection=RENAME_DETECTION_ON,
+        rename_limit=None,
+        timeout=None,
+    ):
+        pygit2 = self._pygit2
+        diff = self._diff(commit)
+
+        rename_limit_hit = False
+        if rename_detection != RENAME_DETECTION_OFF:
+            flags = pygit2.GIT_DIFF_FIND_RENAMES
+            if rename_detection == RENAME_DETECTION_ON:
+                rename_limit_hit = _rename_limit_exceeded(
+                    pygit2, diff.deltas, rename_limit
+                )
+            if rename_detection == RENAME_DETECTION_EXACT or rename_limit_hit:
+                # as git, which only finds exact renames past the limit -
+                # libgit2's own rename_limit caps candidate pairs examined instead
+                flags |= pygit2.GIT_DIFF_FIND_EXACT_MATCH_ONLY
+            diff.find_similar(flags=flags)
+
+        diffs = []
+        for delta in diff.deltas:
+            if not path_filter:
+                diffs.append(_Pygit2Diff(self, delta))
+                continue
+
+            a_matches = path_filter.matches(delta.old_file.path)
+            b_matches = path_filter.matches(delta.new_file.path)
+            if delta.status == pygit2.GIT_DELTA_RENAMED and a_matches != b_matches:
+                # git filters paths before rename detection, so would see one side only
+                status = (
+                    pygit2.GIT_DELTA_DELETED if a_matches else pygit2.GIT_DELTA_ADDED
+                )
+                diffs.append(_Pygit2Diff(self, delta, status=status))
+            elif a_matches or b_matches:
+                diffs.append(_Pygit2Diff(self, delta))
+
+        return diffs, rename_limit_hit
+
+    def numstat(self, commit, path_filter=None, timeout=None):
+        files = {}
+        for patch in self._diff(commit, against_index=False):
+            path = patch.delta.new_file.path
+            if path_filter and not path_filter.matches(path):
+                continue
+
+            _, insertions, deletions = patch.line_stats
+            files[path] = {
+                "insertions": insertions,
+                "deletions": deletions,
+                "lines": insertions + deletions,
+            }
+        return files
+
+    def hunks(
+        self,
+        commit,
+        path_filter=None,
+        max_file_lines=None,
+        max_commit_lines=None,
+        timeout=None,
+    ):
+        # libgit2 builds each file's patch in memory, one file at a time
+        collector = HunkCollector(max_file_lines, max_commit_lines)
+        for patch in self._diff(commit, against_index=False, context_lines=0):
+            path = patch.delta.new_file.path
+            if path_filter and not path_filter.matches(path):
+                continue
+
+            collector.add_file(path)
+            for hunk in patch.hunks:
+                if not collector.add(
+                    path, hunk.old_start, hunk.old_lines, hunk.new_start, hunk.new_lines
+                ):
+                    return collector
+        return collector
+
+    def combined_diff_paths(self, commit, path_filter=None, timeout=None):
+        pygit2_commit = self._repo[commit.hexsha]
+
+        paths = None
+        for parent in pygit2_commit.parents:
+            parent_paths = {
+                delta.new_file.path
+                for delta in self._repo.diff(parent, pygit2_commit).deltas
+            }
+            paths = parent_paths if paths is None else paths & parent_paths
+
+        return sorted(
+            path for path in paths or [] if not path_filter or path_filter.matches(path)
+        )
+
+    def blob_size(self, hexsha):
+        try:
+            _, size = self._repo.odb.read_header(hexsha)
+        except KeyError:
+            # as GitPython, for e.g. submodule commits or missing objects
+            raise ValueError(f"SHA {hexsha} could not be resolved")
+        return size
+
+
+GIT_BACKENDS = {
+    GITPYTHON_BACKEND: GitPythonBackend,
+    PYGIT2_BACKEND: Pygit2Backend,
+}
+
+
+def create_git_backend(name, repo):
+    if name not in GIT_BACKENDS:
+        raise ValueError(f"Unknown git backend: {name}")
+    return GIT_BACKENDS[name](repo)
@@ -0,0 +1,280 @@
+import functools
+import logging
+import time
+from collections import defaultdict
+
+import git
+
+log = logging.getLogger(__name__)
+
+DEFAULT_TRACE_SLOWEST_CALLS = 10
+# commit of a call not given - i.e. the one being processed when it's recorded
+_CURRENT_COMMIT = object()
+# traced Git methods, by the command they run, and whether they read object data
+# - get_object_data goes via stream_object_data, so isn't traced separately
+CAT_FILE_METHODS = {
+    "get_object_header": ("cat-file --batch-check", False),
+    "stream_object_data": ("cat-file --batch", True),
+}
+
+
+def _command_name(command):
+    """git subcommand of a command line, e.g. diff-tree for git -c x=y diff-tree ..."""
+    if isinstance(command, str):
+        command = command.split()
+    args = iter(command[1:])
+    for arg in args:
+        if arg == "-c":
+            next(args, None)
+        elif not arg.startswith("-"):
+            return arg
+    return "git"
+
+
+def _output_size(output):
+    if isinstance(output, tuple):
+        # with extended output: (status, stdout, stderr)
+        output = output[1]
+    return len(output) if isinstance(output, (str, bytes)) else None
+
+
+class _CountingStream:
+    """
+    Process output stream, counting bytes read and the time blocked reading, and
+    calling on_eof at its end
+    """
+
+    def __init__(self, stream, on_eof):
+        self._stream = stream
+        self._on_eof = on_eof
+        self.num_bytes = 0
+        self.read_sec = 0.0
+
+    def _read(self, read, *args):
+        start_time = time.perf_counter()
+        data = read(*args)
+        self.read_sec += time.perf_counter() - start_time
+        self.num_bytes += len(data)
+        if not data:
+            self._on_eof()
+        return data
+
+    def read(self, *args):
+        return self._read(self._stream.read, *args)
+
+    def readline(self, *args):
+        return self._read(self._stream.readline, *args)
+
+    def __iter__(self):
+        return iter(self.readline, b"")
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class GitCall:
+    __slots__ = ("command", "name", "duration_sec", "num_bytes", "commit")
+
+    def __init__(self, command, name, duration_sec, num_bytes, commit):
+        self.command = command
+        self.name = name
+        self.duration_sec = duration_sec
+        self.num_bytes = num_bytes
+        self.commit = commit
+
+
+class GitTracer:
+    """
+    Records the git commands GitPython runs while installed, as a context manager -
+    each with its duration, bytes of output and the commit being processed, which
+    the extractor sets as commit.
+
+    Commands run as processes (streamed output, e.g. rev-list) are recorded once
+    their output is read to the end or they're waited on, with the bytes read by
+    then - and with the time spent starting, reading from and waiting on them,
+    not the time in between, and the commit being processed when they started,
+    if any. Object lookups through the persistent cat-file processes are recorded as
+    round trips of their own, with object data counted as read once looked up.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.commit = None
+        self._originals = {}
+
+    def __enter__(self):
+        self._originals["execute"] = git.cmd.Git.execute
+        git.cmd.Git.execute = self._traced_execute(git.cmd.Git.execute)
+        for method_name, (name, reads_data) in CAT_FILE_METHODS.items():
+            original = getattr(git.cmd.Git, method_name)
+            self._originals[method_name] = original
+            setattr(
+                git.cmd.Git,
+                method_name,
+                self._traced_cat_file(original, name, reads_data),
+            )
+        return self
+
+    def __exit__(self, *exc_info):
+        for method_name, original in self._originals.items():
+            setattr(git.cmd.Git, method_name, original)
+        self._originals = {}
+
+    def _record(self, command, name, duration_sec, num_bytes, commit=_CURRENT_COMMIT):
+        self.calls.append(
+            GitCall(
+                command,
+                name,
+                duration_sec,
+                num_bytes,
+                self.commit if commit is _CURRENT_COMMIT else commit,
+            )
+        )
+
+    def _trace_process(self, cmd, command_line, name, start_sec):
+        """Record a process once its output is read, or it's waited on"""
+        proc = cmd.proc
+        commit = self.commit
+        wait_sec = 0.0
+        recorded = False
+
+        def record():
+            nonlocal recorded
+            if not recorded:
+                recorded = True
+                self._record(
+                    command_line,
+                    name,
+                    start_sec + stdout.read_sec + wait_sec,
+                    stdout.num_bytes,
+                    commit,
+                )
+
+        stdout = _CountingStream(proc.stdout, record)
+        proc.stdout = stdout
+        wait = proc.wait
+
+        @functools.wraps(wait)
+        def traced_wait(*args, **kwargs):
+            nonlocal wait_sec
+            start_time = time.perf_counter()
+            try:
+                return wait(*args, **kwargs)
+            finally:
+                wait_sec += time.perf_counter() - start_time
+                record()
+
+        proc.wait = traced_wait
+
+    def _traced_execute(self, execute):
+        tracer = self
+
+        @functools.wraps(execute)
+        def traced_execute(git_self, command, *args, **kwargs):
+            start_time = time.perf_counter()
+            command_line = (
+                command if isinstance(command, str) else " ".join(map(str, command))
+            )
+            output = None
+            try:
+                output = execute(git_self, command, *args, **kwargs)
+                return output
+            finally:
+                duration_sec = time.perf_counter() - start_time
+                if kwargs.get("as_process") and output is not None:
+                    tracer._trace_process(
+                        output, command_line, _command_name(command), duration_sec
+                    )
+                else:
+                    tracer._record(
+                        command_line,
+                        _command_name(command),
+                        duration_sec,
+                        _output_size(output),
+                    )
+
+        return traced_execute
+
+    def _traced_cat_file(self, method, name, reads_data):
+        tracer = self
+
+        @functools.wraps(method)
+        def traced_cat_file(git_self, ref):
+            start_time = time.perf_counter()
+            result = None
+            try:
+                result = method(git_self, ref)
+                return result
+            finally:
+                # the object size, for the data read - headers are negligible
+                num_bytes = result[2] if result and reads_data else None
+                tracer._record(
+                    f"{name} {ref}",
+                    name,
+                    time.perf_counter() - start_time,
+                    num_bytes,
+                )
+
+        return traced_cat_file
+
+    def summary(self, num_slowest=DEFAULT_TRACE_SLOWEST_CALLS):
+        """Totals per command, calls per commit and the slowest calls, as a dict"""
+        commands = defaultdict(lambda: {"calls": 0, "duration_sec": 0.0, "bytes": 0})
+        commit_calls = defaultdict(int)
+        for call in self.calls:
+            totals = commands[call.name]
+            totals["calls"] += 1
+            totals["duration_sec"] += call.duration_sec
+            totals["bytes"] += call.num_bytes or 0
+            if call.commit:
+                commit_calls[call.commit] += 1
+
+        busiest_commit = max(commit_calls, key=commit_calls.get, default=None)
+        return {
+            "calls": len(self.calls),
+            "duration_sec": sum(call.duration_sec for call in self.calls),
+            "bytes": sum(call.num_bytes or 0 for call in self.calls),
+            "commands": dict(commands),
+            "commits": len(commit_calls),
+            "calls_per_commit": (
+                sum(commit_calls.values()) / len(commit_calls) if commit_calls else 0.0
+            ),
+            "max_calls_per_commit": commit_calls.get(busiest_commit, 0),
+            "max_calls_commit": busiest_commit,
+            "slowest": [
+                {
+                    "command": call.command,
+                    "duration_sec": call.duration_sec,
+                    "bytes": call.num_bytes,
+                    "commit": call.commit,
+                }
+                for call in sorted(
+                    self.calls, key=lambda call: call.duration_sec, reverse=True
+                )[:num_slowest]
+            ],
+        }
+
+    def log_summary(self, num_slowest=DEFAULT_TRACE_SLOWEST_CALLS):
+        summary = self.summary(num_slowest=num_slowest)
+        log.info(
+            f"Git trace: {summary['calls']} call(s) in {summary['duration_sec']:.2f} sec, "
+            f"{summary['bytes'] / 1024 / 1024:.1f} MB read - "
+            f"{summary['calls_per_commit']:.1f} call(s) per commit over "
+            f"{summary['commits']} commit(s), max {summary['max_calls_per_commit']} "
+            f"for {summary['max_calls_commit']}"
+        )
+        for name, totals in sorted(
+            summary["commands"].items(),
+            key=lambda item: item[1]["duration_sec"],
+            reverse=True,
+        ):
+            log.info(
+                f"Git trace: {name} - {totals['calls']} call(s), "
+                f"{totals['duration_sec']:.2f} sec, {totals['bytes']} bytes"
+            )
+        for call in summary["slowest"]:
+            log.info(
+                f"Git trace: slow call {call['duration_sec']:.3f} sec "
+                f"for commit {call['commit']}: {call['command'][:200]}"
+            )
+        return summary
@@ -0,0 +1,93 @@
+from collections.abc import Mapping
+
+
+class DiffRecord(Mapping):
+    """
+    A git_commit_diffs record - slotted, as there are many, but read-only mapping
+    of its fields as for dict records. Serialized by srsly / ujson via toDict.
+    """
+
+    FIELDS = (
+        "insertions",
+        "deletions",
+        "lines",
+        "tm_id",
+        "connector_id",
+        "repo_id",
+        "commit_id",
+        "a_path",
+        "b_path",
+        "a_object_id",
+        "b_object_id",
+        "size_delta",
+        "type",
+    )
+    __slots__ = FIELDS
+
+    def __init__(
+        self,
+        insertions,
+        deletions,
+        lines,
+        tm_id,
+        connector_id,
+        repo_id,
+        commit_id,
+        a_path,
+        b_path,
+        a_object_id,
+        b_object_id,
+        size_delta,
+        type,
+    ):
+        self.insertions = insertions
+        self.deletions = deletions
+        self.lines = lines
+        self.tm_id = tm_id
+        self.connector_id = connector_id
+        self.repo_id = repo_id
+        self.commit_id = commit_id
+        self.a_path = a_path
+        self.b_path = b_path
+        self.a_object_id = a_object_id
+        self.b_object_id = b_object_id
+        self.size_delta = size_delta
+        self.type = type
+
+    def __getitem__(self, key):
+        if key not in self._FIELD_SET:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(self.FIELDS)
+
+    def __len__(self):
+        return len(self.FIELDS)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.toDict()!r})"
+
+    def toDict(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+
+DiffRecord._FIELD_SET = frozenset(DiffRecord.FIELDS)
+
+
+class HunkDiffRecord(DiffRecord):
+    """
+    A diff record with its changed line ranges - hunks are [old start, old lines,
+    new start, new lines], and hunks_truncated is set if some were dropped by caps
+    """
+
+    FIELDS = DiffRecord.FIELDS + ("hunks", "hunks_truncated")
+    __slots__ = ("hunks", "hunks_truncated")
+
+    def __init__(self, *args, hunks=None, hunks_truncated=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.hunks = hunks
+        self.hunks_truncated = hunks_truncated
+
+
+HunkDiffRecord._FIELD_SET = frozenset(HunkDiffRecord.FIELDS)
@@ -0,0 +1,277 @@
+import abc
+import logging
+import sqlite3
+import sys
+import time
+
+import srsly
+
+log = logging.getLogger(__name__)
+
+FILE_SINK = "file"
+NULL_SINK = "null"
+SQLITE_SINK = "sqlite"
+STDOUT_SINK = "stdout"
+
+
+class Sink(abc.ABC):
+    """
+    Destination for extracted records - called as store_fn(type, repo id, records)
+    by ingest_and_store_repo. Keeps track of its write throughput, reported on close.
+    """
+
+    name = None
+
+    def __init__(self):
+        self.num_records = 0
+        self.num_bytes = 0
+        self.write_sec = 0.0
+
+    def __call__(self, type_, id_, records):
+        records = list(records)
+        start_time = time.perf_counter()
+        num_bytes = self.write(type_, id_, records)
+        self.write_sec += time.perf_counter() - start_time
+        self.num_records += len(records)
+        self.num_bytes += num_bytes or 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @abc.abstractmethod
+    def write(self, type_, id_, records):
+        """Write records - returns the number of bytes written, if known"""
+        raise NotImplementedError
+
+    def batch_stored(self, last_hexsha):
+        """Called once all records of a batch of commits have been written"""
+
+    def close(self):
+        self.report()
+
+    def report(self):
+        write_sec = max(self.write_sec, 1e-9)
+        log.info(
+            f"{self.name} sink: {self.num_records} record(s), "
+            f"{self.num_bytes / 1024 / 1024:.1f} MB written in {self.write_sec:.2f} sec - "
+            f"{self.num_records / write_sec:.0f} records/sec, "
+            f"{self.num_bytes / 1024 / 1024 / write_sec:.1f} MB/sec"
+        )
+
+
+class NullSink(Sink):
+    """Discards records - for measuring extraction throughput alone"""
+
+    name = NULL_SINK
+
+    def write(self, type_, id_, records):
+        return 0
+
+
+class StdoutSink(Sink):
+    """
+    Writes records as NDJSON to stdout, for piping into a loader - one
+    {"type": .., "record": ..} object per line, in the order extracted
+    """
+
+    name = STDOUT_SINK
+
+    def __init__(self, stream=None):
+        super().__init__()
+        self.stream = stream or sys.stdout
+
+    def write(self, type_, id_, records):
+        text = "".join(
+            srsly.json_dumps({"type": type_, "record": record}) + "\n"
+            for record in records
+        )
+        self.stream.write(text)
+        self.stream.flush()
+        return len(text)
+
+
+# table columns per record type - the first columns are the primary key. Dotted
+# fields are stored with underscores, and list fields as JSON
+SQLITE_TABLES = {
+    # submodules have the repo they're in, and their path there
+    "git_repos": (
+        "tm_id",
+        "connector_id",
+        "name",
+        "url",
+        "path_prefix",
+        "parent_repo_id",
+        "parent_path",
+    ),
+    "git_users": ("tm_id", "connector_id", "repo_id", "name", "email"),
+    # a monorepo split has a commit per logical repo, with the same hexsha
+    "git_commits": (
+        "repo_id",
+        "hexsha",
+        "tm_id",
+        "connector_id",
+        "author.name",
+        "author.email",
+        "author_id",
+        "committer.name",
+        "committer.email",
+        "committer_id",
+        "authored_date",
+        "committed_date",
+        "message",
+        "summary",
+        "parents",
+        "branches",
+        "diffs_skipped",
+    ),
+    "git_commit_diffs": (
+        "tm_id",
+        "connector_id",
+        "repo_id",
+        "commit_id",
+        "a_path",
+        "b_path",
+        "a_object_id",
+        "b_object_id",
+        "insertions",
+        "deletions",
+        "lines",
+        "size_delta",
+        "type",
+        "hunks",
+        "hunks_truncated",
+    ),
+    "git_churn_daily": (
+        "tm_id",
+        "connector_id",
+        "repo_id",
+        "date",
+        "author_id",
+        "path_prefix",
+        "insertions",
+        "deletions",
+        "files",
+        "commits",
+    ),
+}
+SQLITE_PRIMARY_KEYS = {
+    "git_repos": ("tm_id",),
+    "git_users": ("tm_id",),
+    "git_commits": ("repo_id", "hexsha"),
+    "git_commit_diffs": ("tm_id",),
+    "git_churn_daily": ("tm_id",),
+}
+# created on close, rather than maintained through the bulk inserts
+SQLITE_INDEXES = {
+    "git_commits": [("repo_id", "committed_date"), ("tm_id",)],
+    "git_commit_diffs": [("commit_id",), ("repo_id", "b_path")],
+}
+
+
+def _sqlite_column(field):
+    return field.replace(".", "_")
+
+
+class SqliteSink(Sink):
+    """
+    Writes records to tables of a SQLite database, for local analysis or staging -
+    records are upserted by primary key, so repeated and incremental runs into the
+    same database don't duplicate them.
+
+    Each batch of commits is written in a single transaction, committed once the
+    batch is stored. Secondary indexes are created on close.
+    """
+
+    name = SQLITE_SINK
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        for table, fields in SQLITE_TABLES.items():
+            columns = ", ".join(_sqlite_column(field) for field in fields)
+            primary_key = ", ".join(SQLITE_PRIMARY_KEYS[table])
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} "
+                f"({columns}, PRIMARY KEY ({primary_key}))"
+            )
+            # databases from before columns were added
+            existing_columns = {
+                row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")
+            }
+            for field in fields:
+                if _sqlite_column(field) not in existing_columns:
+                    self._conn.execute(
+                        f"ALTER TABLE {table} ADD COLUMN {_sqlite_column(field)}"
+                    )
+        self._conn.commit()
+
+        self._upserts = {}
+        for table, fields in SQLITE_TABLES.items():
+            columns = [_sqlite_column(field) for field in fields]
+            updates = ", ".join(
+                f"{column} = excluded.{column}"
+                for column in columns
+                if column not in SQLITE_PRIMARY_KEYS[table]
+            )
+            self._upserts[table] = (
+                f"INSERT INTO {table} ({', '.join(columns)}) "
+                f"VALUES ({', '.join('?' * len(columns))}) "
+                f"ON CONFLICT ({', '.join(SQLITE_PRIMARY_KEYS[table])}) "
+                f"DO UPDATE SET {updates}"
+            )
+
+    def write(self, type_, id_, records):
+        if type_ not in SQLITE_TABLES:
+            raise ValueError(f"Unsupported record type for {self.name} sink: {type_}")
+
+        fields = SQLITE_TABLES[type_]
+        rows = [
+            tuple(
+                srsly.json_dumps(value) if isinstance(value, list) else value
+                for value in (record.get(field) for field in fields)
+            )
+            for record in records
+        ]
+        # the transaction is implicitly begun here, and committed per batch
+        self._conn.executemany(self._upserts[type_], rows)
+        return None
+
+    def batch_stored(self, last_hexsha):
+        self._conn.commit()
+
+    def create_indexes(self):
+        for table, indexes in SQLITE_INDEXES.items():
+            for columns in indexes:
+                self._conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS {table}_{'_'.join(columns)} "
+                    f"ON {table} ({', '.join(columns)})"
+                )
+        self._conn.commit()
+
+    def close(self):
+        self._conn.commit()
+        self.create_indexes()
+        self._conn.close()
+        super().close()
+
+
+# sinks created by name - not the file sink, which writes to an output dir with
+# checkpoints, so is created by ingest_repo_to_jsonl
+SINKS = {
+    NULL_SINK: NullSink,
+    SQLITE_SINK: SqliteSink,
+    STDOUT_SINK: StdoutSink,
+}
+
+
+def create_sink(name, **kwargs):
+    if name not in SINKS:
+        raise ValueError(f"Unknown sink: {name}")
+    return SINKS[name](**kwargs)
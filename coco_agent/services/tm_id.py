@@ -1,3 +1,4 @@
+import functools
 import hashlib
 import re
 
@@ -20,17 +21,55 @@ GIT_COMMIT_DIFF_ID_PREFIX = "gdf"
 GIT_PATH_ID_PREFIX = "gip"
 GIT_REPO_ID_PREFIX = "gir"
 GIT_USER_ID_PREFIX = "giu"
+GIT_CHURN_DAILY_ID_PREFIX = "gcd"
 
 CC_AGENT_SOURCE_TYPES = ["git", "github"]
 
 
+# bound on memoized ids for hot id types, e.g. paths touched by many commits
+ID_CACHE_SIZE = 64 * 1024
+
+
+# base62 digit pairs, to encode two digits per division
+_BASE62_PAIRS = [a + b for a in base62.CHARSET_DEFAULT for b in base62.CHARSET_DEFAULT]
+
+
+def _base62_encode(n: int) -> str:
+    """As base62.encode, with half the divisions"""
+    if not n:
+        return "0"
+
+    pairs = []
+    while n:
+        n, r = divmod(n, len(_BASE62_PAIRS))
+        pairs.append(_BASE62_PAIRS[r])
+    # the leading pair may start with a zero digit
+    return "".join(reversed(pairs)).lstrip("0")
+
+
+def _encode_digest(digest: bytes) -> str:
+    # same as truncating the int of the hex digest, without the hex round trip
+    truncated = int.from_bytes(digest, "big") >> (
+        HASH_LENGTH_BITS - IDENTIFIER_LENGTH_BITS
+    )
+    return _base62_encode(truncated)
+
+
 def encode(id_: str) -> str:
     if not id_:
         raise ValueError("Empty id for a tm_id")
-    cleartext = id_
-    hashed = hashlib.sha256(cleartext.encode("utf-8")).hexdigest()
-    truncated = int(hashed, base=16) >> (HASH_LENGTH_BITS - IDENTIFIER_LENGTH_BITS)
-    return base62.encode(truncated)
+    return _encode_digest(hashlib.sha256(id_.encode("utf-8")).digest())
+
+
+def encode_many(ids) -> list:
+    """encode for a batch of ids"""
+    sha256 = hashlib.sha256
+    encoded = []
+    for id_ in ids:
+        if not id_:
+            raise ValueError("Empty id for a tm_id")
+        encoded.append(_encode_digest(sha256(id_.encode("utf-8")).digest()))
+    return encoded
 
 
 def split_connector_id(connector_id):
@@ -56,6 +95,7 @@ def connector(customer_id, source_type, source_id):
     return f"{CONNECTOR_ID_PREFIX}{SEP}{encode(id_)}"
 
 
+@functools.lru_cache(maxsize=ID_CACHE_SIZE)
 def git_commit(hexsha: str):
     return f"{GIT_COMMIT_ID_PREFIX}{SEP}{encode(hexsha)}"
 
@@ -65,6 +105,15 @@ def git_commit_diff(hexsha: str, object_path: str):
     return f"{GIT_COMMIT_DIFF_ID_PREFIX}{SEP}{encode(id_)}"
 
 
+def git_commit_diffs(hexsha: str, object_paths) -> list:
+    """git_commit_diff for all diffs of a commit"""
+    return [
+        f"{GIT_COMMIT_DIFF_ID_PREFIX}{SEP}{encoded}"
+        for encoded in encode_many(f"{hexsha}::{path}" for path in object_paths)
+    ]
+
+
+@functools.lru_cache(maxsize=ID_CACHE_SIZE)
 def git_path(repo_id, objpath):
     id_ = f"{repo_id}::{objpath}"
     return f"{GIT_PATH_ID_PREFIX}{SEP}{encode(id_)}"
@@ -103,6 +152,11 @@ def git_user(repo_id: str, email: str):
     return f"{GIT_USER_ID_PREFIX}{SEP}{encode(id_)}"
 
 
+def git_churn_daily(repo_id: str, day: str, author_id: str, path_prefix: str):
+    id_ = f"{repo_id}|{day}|{author_id}|{path_prefix}"
+    return f"{GIT_CHURN_DAILY_ID_PREFIX}{SEP}{encode(id_)}"
+
+
 def git_repo(customer_id: str, source_id: str, git_repo_id: str):
     id_ = f"{customer_id}::{source_id}::{str(git_repo_id)}"
     return f"{GIT_REPO_ID_PREFIX}{SEP}{encode(id_)}"
@@ -31,6 +31,9 @@ config = {
         "srsly>=2.4.1",
         "urllib3>=1.26.6",
     ],
+    "extras_require": {
+        "pygit2": ["pygit2>=1.14"],
+    },
     "python_requires": ">=3.7",
     "packages": find_packages(),
     "scripts": ["coco-agent"],
@@ -37,3 +37,20 @@ def test_date_parameter(value, expected):
 def test_date_parameter_bad_format(value, match):
     with pytest.raises(ValueError, match=match):
         params.date_parameter(value)
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("services/billing=billing", ("services/billing", "billing")),
+        (" web/ = web-app ", ("web/", "web-app")),
+    ],
+)
+def test_path_mapping_parameter(value, expected):
+    assert params.path_mapping_parameter(value) == expected
+
+
+@pytest.mark.parametrize("value", ["billing", "=billing", "services=", "/=x"])
+def test_path_mapping_parameter_bad_format(value):
+    with pytest.raises(ValueError, match="PREFIX=NAME"):
+        params.path_mapping_parameter(value)
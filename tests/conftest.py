@@ -0,0 +1,175 @@
+import os
+import subprocess
+
+import pytest
+
+TEST_REPO_REMOTE_URL = "https://example.com/test-org/test-repo.git"
+
+
+def _git(repo_dir, *args, date=None):
+    env = dict(
+        os.environ,
+        GIT_AUTHOR_NAME="Test Author",
+        GIT_AUTHOR_EMAIL="author@example.com",
+        GIT_COMMITTER_NAME="Test Committer",
+        GIT_COMMITTER_EMAIL="committer@example.com",
+    )
+    if date:
+        env.update(GIT_AUTHOR_DATE=date, GIT_COMMITTER_DATE=date)
+
+    subprocess.run(
+        ["git", *args],
+        cwd=repo_dir,
+        env=env,
+        check=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+    )
+
+
+def _write(repo_dir, path, content):
+    full_path = os.path.join(repo_dir, path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    with open(full_path, "w") as f:
+        f.write(content)
+
+
+def _commit(repo_dir, message, date, files=None, removed=None):
+    for path, content in (files or {}).items():
+        _write(repo_dir, path, content)
+    for path in removed or []:
+        _git(repo_dir, "rm", "-q", path)
+    _git(repo_dir, "add", "-A")
+    _git(repo_dir, "commit", "-q", "-m", message, date=date)
+
+
+@pytest.fixture
+def test_repo_path(tmp_path):
+    """
+    Small repo with known history, roughly:
+
+        master:       c1 - c2 - c4 ------- m1 - c7
+                             \\            /
+        release/1.0:          c3 ---- c5
+                                \\
+        release/2.0:             c6
+
+    Commits span 2021-01-01 to 2021-07-01, one per month, and touch a few
+    top-level dirs (src/, docs/, vendor/) to exercise path handling. The m1 merge
+    also changes README.md, which neither parent did.
+    """
+    repo_dir = str(tmp_path / "test-repo")
+    os.mkdir(repo_dir)
+
+    _git(repo_dir, "init", "-q", "-b", "master")
+    _git(repo_dir, "remote", "add", "origin", TEST_REPO_REMOTE_URL)
+
+    _commit(
+        repo_dir,
+        "c1: initial",
+        "2021-01-01T12:00:00+00:00",
+        files={"README.md": "hello\n", "src/app.py": "print('hi')\n"},
+    )
+    _commit(
+        repo_dir,
+        "c2: app and vendored lib",
+        "2021-02-01T12:00:00+00:00",
+        files={
+            "src/app.py": "print('hi')\nprint('there')\n",
+            "vendor/lib.js": "var x = 1;\n" * 20,
+        },
+    )
+
+    _git(repo_dir, "checkout", "-q", "-b", "release/1.0")
+    _commit(
+        repo_dir,
+        "c3: release fix",
+        "2021-03-01T12:00:00+00:00",
+        files={"src/util.py": "def util():\n    return 1\n"},
+    )
+
+    _git(repo_dir, "checkout", "-q", "master")
+    _commit(
+        repo_dir,
+        "c4: docs",
+        "2021-04-01T12:00:00+00:00",
+        files={"docs/index.md": "# Docs\n"},
+    )
+
+    _git(repo_dir, "checkout", "-q", "release/1.0")
+    _git(repo_dir, "checkout", "-q", "-b", "release/2.0")
+    _commit(
+        repo_dir,
+        "c6: next release",
+        "2021-06-01T12:00:00+00:00",
+        files={"src/next.py": "NEXT = True\n"},
+    )
+
+    _git(repo_dir, "checkout", "-q", "release/1.0")
+    _commit(
+        repo_dir,
+        "c5: another release fix",
+        "2021-05-01T12:00:00+00:00",
+        files={"src/util.py": "def util():\n    return 2\n"},
+    )
+
+    _git(repo_dir, "checkout", "-q", "master")
+    # merge also changes README.md itself, i.e. shows up in a combined diff
+    _git(repo_dir, "merge", "-q", "--no-ff", "--no-commit", "release/1.0")
+    _commit(
+        repo_dir,
+        "m1: merge release/1.0",
+        "2021-05-15T12:00:00+00:00",
+        files={"README.md": "hello again\n"},
+    )
+    _git(repo_dir, "mv", "docs/index.md", "docs/home.md")
+    _commit(
+        repo_dir,
+        "c7: rename docs, drop vendored lib",
+        "2021-07-01T12:00:00+00:00",
+        removed=["vendor/lib.js"],
+    )
+
+    return repo_dir
+
+
+@pytest.fixture
+def test_repo_with_submodule_path(tmp_path):
+    """
+    Repo app with a submodule lib at vendor/lib, pinned to the second of lib's three
+    commits, and an uninitialized submodule at vendor/other
+    """
+    lib_dir = str(tmp_path / "lib")
+    os.mkdir(lib_dir)
+    _git(lib_dir, "init", "-q", "-b", "master")
+    for idx in range(3):
+        _commit(
+            lib_dir,
+            f"lib{idx}",
+            f"2021-0{idx + 1}-01T12:00:00+00:00",
+            files={"lib.py": f"VERSION = {idx}\n"},
+        )
+    _git(lib_dir, "checkout", "-q", "HEAD~1")
+
+    repo_dir = str(tmp_path / "app")
+    os.mkdir(repo_dir)
+    _git(repo_dir, "init", "-q", "-b", "master")
+    _git(repo_dir, "remote", "add", "origin", "https://example.com/org/app.git")
+    _commit(repo_dir, "a1", "2021-01-15T12:00:00+00:00", files={"app.py": "1\n"})
+    for path, url in [("vendor/lib", lib_dir), ("vendor/other", lib_dir)]:
+        _git(
+            repo_dir,
+            "-c",
+            "protocol.file.allow=always",
+            "submodule",
+            "add",
+            "-q",
+            url,
+            path,
+        )
+    _git(
+        repo_dir, "commit", "-q", "-m", "a2: add lib", date="2021-02-15T12:00:00+00:00"
+    )
+    _git(repo_dir, "submodule", "deinit", "-q", "-f", "vendor/other")
+
+    return repo_dir
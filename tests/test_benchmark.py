@@ -0,0 +1,37 @@
+import pytest
+from coco_agent.services.benchmark import run_benchmark
+
+
+def test_run_benchmark(test_repo_path):
+    report = run_benchmark(test_repo_path, "master", max_commits=3)
+
+    assert report["max_commits"] == 3
+    assert [run["sink"] for run in report["runs"]] == ["null", "file"]
+    null_run, file_run = report["runs"]
+    assert null_run["commits"] == file_run["commits"] == 3
+    assert null_run["diffs"] == file_run["diffs"] > 0
+    assert null_run["output_bytes"] == 0
+    assert file_run["output_bytes_per_commit"] > 0
+    assert file_run["peak_rss_mb"] > 0
+    assert set(file_run["phase_sec"]) == {
+        "walk",
+        "diffs",
+        "commits",
+        "write",
+        "other",
+    }
+
+    # nothing from the repo itself
+    assert test_repo_path not in str(report)
+    assert "c1" not in str(report)
+
+
+def test_run_benchmark_options(test_repo_path):
+    report = run_benchmark(
+        test_repo_path, "master", sink_names=["null"], max_commits=10, hunks=True
+    )
+    assert report["options"] == {"hunks": True}
+    assert report["runs"][0]["commits"] == 7
+
+    with pytest.raises(ValueError, match="Unsupported sink"):
+        run_benchmark(test_repo_path, "master", sink_names=["sqlite"])
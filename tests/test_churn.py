@@ -0,0 +1,100 @@
+from coco_agent.services import tm_id
+from coco_agent.services.churn import ChurnRollup, path_prefix
+
+
+def _commit(hexsha, committed_date, email, paths, repo_id="gir-1"):
+    return {
+        "repo_id": repo_id,
+        "hexsha": hexsha,
+        # authored the day before - days are of the committed date
+        "authored_date": committed_date - 24 * 60 * 60,
+        "committed_date": committed_date,
+        "author.email": email,
+        "diffs": [{"b_path": path, "insertions": 2, "deletions": 1} for path in paths],
+    }
+
+
+def test_path_prefix():
+    assert path_prefix("src/app/main.py") == "src"
+    assert path_prefix("src/app/main.py", depth=2) == "src/app"
+    assert path_prefix("src/main.py", depth=2) == "src"
+    assert path_prefix("README.md") == ""
+
+
+def test_churn_rollup():
+    rollup = ChurnRollup("con-1")
+    # 2021-01-01 10:00 and 23:00 UTC, then 2021-01-02
+    rollup.add_commit(
+        _commit("a", 1609495200, "Dev@Example.com", ["src/a.py", "src/b.py"])
+    )
+    rollup.add_commit(_commit("b", 1609542000, "dev@example.com", ["src/a.py", "x.md"]))
+    rollup.add_commit(_commit("c", 1609581600, "dev@example.com", ["docs/x.md"]))
+
+    author_id = tm_id.git_user("gir-1", "dev@example.com")
+    records = rollup.records("gir-1")
+    assert [
+        (
+            r["date"],
+            r["path_prefix"],
+            r["insertions"],
+            r["deletions"],
+            r["files"],
+            r["commits"],
+        )
+        for r in records
+    ] == [
+        ("2021-01-01", "", 2, 1, 1, 1),
+        ("2021-01-01", "src", 6, 3, 3, 2),
+        ("2021-01-02", "docs", 2, 1, 1, 1),
+    ]
+    assert all(r["author_id"] == author_id for r in records)
+    assert records[0]["tm_id"] == tm_id.git_churn_daily(
+        "gir-1", "2021-01-01", author_id, ""
+    )
+    assert rollup.records("gir-other") == []
+
+
+def test_churn_rollup_compact_users():
+    rollup = ChurnRollup("con-1")
+    commit = _commit("a", 1609495200, "dev@example.com", ["src/a.py"])
+    del commit["author.email"]
+    commit["author_id"] = "giu-1"
+    rollup.add_commit(commit)
+
+    assert [r["author_id"] for r in rollup.records("gir-1")] == ["giu-1"]
+
+
+def test_churn_rollup_whole_days():
+    # 2021-01-01 10:00 UTC, then 2021-01-02 and 2021-01-03 10:00 UTC
+    day_sec = 24 * 60 * 60
+    commits = [
+        _commit(hexsha, 1609495200 + i * day_sec, "dev@example.com", ["x.md"])
+        for i, hexsha in enumerate("abc")
+    ]
+
+    # from 2021-01-01 12:00 to 2021-01-03 00:00 UTC - only 2021-01-02 is whole
+    rollup = ChurnRollup("con-1", start_ts=1609502400, end_ts=1609632000)
+    for commit in commits:
+        rollup.add_commit(commit)
+    (record,) = rollup.records("gir-1")
+    assert record["date"] == "2021-01-02"
+
+    # a later extract of the same day has the same row id, so replaces it
+    later = ChurnRollup("con-1", start_ts=1609459200)
+    for commit in commits:
+        later.add_commit(commit)
+    records = later.records("gir-1")
+    assert [r["date"] for r in records] == ["2021-01-01", "2021-01-02", "2021-01-03"]
+    assert records[1]["tm_id"] == record["tm_id"]
+
+
+def test_churn_rollup_split_repo_authors():
+    rollup = ChurnRollup("con-1", users_repo_id="gir-physical")
+    rollup.add_commit(
+        _commit("a", 1609495200, "dev@example.com", ["x.md"], repo_id="gir-split")
+    )
+
+    records = rollup.records("gir-split")
+    assert [r["author_id"] for r in records] == [
+        tm_id.git_user("gir-physical", "dev@example.com")
+    ]
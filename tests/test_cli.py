@@ -321,3 +321,115 @@ def test_encode():
     result = runner.invoke(cli, ["encode", "short", "--lower", "text"])
     assert result.exit_code == 0, result.output
     assert result.output.strip() == "3akjqjwfteydzh"
+
+
+def test_git_extract_multiple_branches(test_repo_path):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        runner = CliRunner()
+        result = runner.invoke(
+            cli,
+            [
+                "extract",
+                "git-repo",
+                "--connector-id=test/git/test",
+                "--output-dir=" + tmpdir,
+                "--branch=master",
+                "--branch=release/*",
+                "--no-log-to-file",
+                test_repo_path,
+            ],
+            catch_exceptions=False,
+        )
+        assert result.exit_code == 0, result.output
+
+        commits_file = [f for f in os.listdir(tmpdir) if "git_commits" in f][0]
+        stored_commits = list(srsly.read_jsonl(os.path.join(tmpdir, commits_file)))
+        assert len(stored_commits) == 8
+        assert all(commit["branches"] for commit in stored_commits)
+
+
+def test_maintain_git_repo(test_repo_path):
+    runner = CliRunner()
+    result = runner.invoke(
+        cli,
+        ["maintain", "git-repo", test_repo_path],
+        catch_exceptions=False,
+    )
+    assert result.exit_code == 0, result.output
+    assert os.path.exists(
+        os.path.join(test_repo_path, ".git", "objects", "info", "commit-graph")
+    )
+
+    # refreshing an existing graph is fine too
+    result = runner.invoke(
+        cli,
+        ["maintain", "git-repo", "--no-changed-paths", test_repo_path],
+        catch_exceptions=False,
+    )
+    assert result.exit_code == 0, result.output
+
+
+def test_git_extract_to_stdout_sink(test_repo_path):
+    runner = CliRunner()
+    result = runner.invoke(
+        cli,
+        [
+            "extract",
+            "git-repo",
+            "--connector-id=test/git/test",
+            "--sink=stdout",
+            "--no-log-to-file",
+            test_repo_path,
+        ],
+        catch_exceptions=False,
+    )
+    assert result.exit_code == 0, result.output
+
+    # skip any log lines mixed into the output
+    rows = [
+        srsly.json_loads(line)
+        for line in result.stdout.splitlines()
+        if line.startswith('{"type"')
+    ]
+    types = {row["type"] for row in rows}
+    assert types == {"git_repos", "git_commits", "git_commit_diffs"}
+    assert len([row for row in rows if row["type"] == "git_commits"]) == 7
+
+
+def test_git_extract_non_file_sink_rejects_resume(test_repo_path):
+    runner = CliRunner()
+    with pytest.raises(ValueError):
+        runner.invoke(
+            cli,
+            [
+                "extract",
+                "git-repo",
+                "--connector-id=test/git/test",
+                "--sink=null",
+                "--resume",
+                "--no-log-to-file",
+                test_repo_path,
+            ],
+            catch_exceptions=False,
+        )
+
+
+def test_benchmark(test_repo_path):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        report_path = os.path.join(tmpdir, "report.json")
+        runner = CliRunner()
+        result = runner.invoke(
+            cli,
+            [
+                "benchmark",
+                "--max-commits=2",
+                "--sink=null",
+                f"--report-file={report_path}",
+                test_repo_path,
+            ],
+        )
+        assert result.exit_code == 0, result.output
+
+        report = srsly.read_json(report_path)
+        assert report["options"]["backend"] == "gitpython"
+        assert [run["commits"] for run in report["runs"]] == [2]
@@ -0,0 +1,62 @@
+import sqlite3
+
+from coco_agent.services.commit_cache import CommitCache, options_key
+
+
+def test_options_key():
+    assert options_key(dict(a=1, b=[2])) == options_key(dict(b=[2], a=1))
+    assert options_key(dict(a=1)) != options_key(dict(a=2))
+
+
+def test_commit_cache_get_put(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    record = {"hexsha": "abc", "diffs": [{"a_path": "x", "insertions": 1}]}
+
+    with CommitCache(path) as cache:
+        assert cache.get("repo", "abc", "opts") is None
+        cache.put("repo", "abc", "opts", record)
+
+        assert cache.get("repo", "abc", "opts") == record
+        assert cache.get("other-repo", "abc", "opts") is None
+        assert cache.get("repo", "abc", "other-opts") is None
+        assert (cache.hits, cache.misses) == (1, 3)
+
+    # persisted
+    with CommitCache(path) as cache:
+        assert cache.get("repo", "abc", "opts") == record
+
+
+def test_commit_cache_evicts_least_recently_used(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+
+    with CommitCache(path) as cache:
+        for i in range(3):
+            cache.put("repo", f"sha{i}", "opts", {"message": f"commit {i}"})
+        record_size = cache.size() // 3
+        cache.max_size_bytes = record_size * 2
+
+        # sha0 is now the most recently used
+        cache.get("repo", "sha0", "opts")
+        assert cache.evict() == 1
+
+        assert cache.get("repo", "sha1", "opts") is None
+        assert cache.get("repo", "sha0", "opts") is not None
+        assert cache.get("repo", "sha2", "opts") is not None
+
+
+def test_commit_cache_flushes_during_run(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+
+    cache = CommitCache(path, flush_every=2)
+    cache.put("repo", "sha0", "opts", {"message": "commit 0"})
+    record_size = cache.size()
+    cache.max_size_bytes = record_size * 2
+    for i in range(1, 4):
+        cache.put("repo", f"sha{i}", "opts", {"message": f"commit {i}"})
+
+    # committed, and within the cap, without closing - as if killed mid-run
+    with sqlite3.connect(path) as conn:
+        hexshas = [row[0] for row in conn.execute("SELECT hexsha FROM commits")]
+    assert sorted(hexshas) == ["sha2", "sha3"]
+    assert cache.size() == record_size * 2
+    cache.close()
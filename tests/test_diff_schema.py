@@ -0,0 +1,77 @@
+from coco_agent.services import diff_schema, git, tm_id
+
+
+def _extracted_diffs(repo_path, **extractor_kwargs):
+    extractor = git.GitRepoExtractor(
+        repo_path,
+        customer_id="test-cust-id",
+        source_id="test-source-id",
+        repo_tm_id="gir-test",
+        **extractor_kwargs,
+    )
+    commits = [
+        item for type_, item in extractor(rev="master") if type_ == "git_commits"
+    ]
+    return commits, [diff for commit in commits for diff in commit["diffs"]]
+
+
+def test_compact_diffs_round_trip(test_repo_path):
+    commits, diffs = _extracted_diffs(test_repo_path)
+    commit_hexshas = {commit["tm_id"]: commit["hexsha"] for commit in commits}
+
+    encoder = diff_schema.CompactDiffEncoder()
+    rows = encoder.encode(diffs[:5], commit_hexshas)
+    rows += encoder.encode(diffs[5:], commit_hexshas)
+
+    assert rows[0] == {
+        "schema": diff_schema.COMPACT_DIFFS_SCHEMA,
+        "connector_id": diffs[0]["connector_id"],
+        "repo_id": "gir-test",
+    }
+    assert sum("schema" in row for row in rows) == 1
+    assert sum("c" in row for row in rows) == len(commits)
+    # ids are derived, not stored
+    assert not any("id" in row for row in rows)
+
+    assert list(diff_schema.expand_diffs(rows)) == diffs
+
+
+def test_compact_diffs_round_trip_hunks(test_repo_path):
+    commits, diffs = _extracted_diffs(test_repo_path, hunks=True)
+    commit_hexshas = {commit["tm_id"]: commit["hexsha"] for commit in commits}
+
+    rows = diff_schema.CompactDiffEncoder().encode(diffs, commit_hexshas)
+    assert all("h" in row for row in rows if "a" in row)
+    assert list(diff_schema.expand_diffs(rows)) == diffs
+
+
+def test_compact_diffs_keep_underivable_ids(test_repo_path):
+    commits, diffs = _extracted_diffs(test_repo_path)
+    diffs[0] = dict(diffs[0], tm_id="gdf-custom")
+
+    # diffs of commits without a known hexsha keep their ids
+    rows = diff_schema.CompactDiffEncoder().encode(
+        diffs, {commits[-1]["tm_id"]: commits[-1]["hexsha"]}
+    )
+    assert list(diff_schema.expand_diffs(rows)) == diffs
+    assert rows[-1].keys() == {"a", "b", "i", "d", "l", "s", "t"}
+
+
+def test_compact_diffs_append(test_repo_path):
+    commits, diffs = _extracted_diffs(test_repo_path)
+    commit_hexshas = {commit["tm_id"]: commit["hexsha"] for commit in commits}
+    expected_rows = diff_schema.CompactDiffEncoder().encode(diffs, commit_hexshas)
+
+    rows = diff_schema.CompactDiffEncoder().encode(diffs[:3], commit_hexshas)
+
+    # e.g. on resume - continues with the same header and path table
+    encoder = diff_schema.CompactDiffEncoder()
+    encoder.load(rows)
+    rows += encoder.encode(diffs[3:], commit_hexshas)
+
+    assert rows == expected_rows
+
+
+def test_expand_diffs_passes_default_schema_through():
+    rows = [{"tm_id": tm_id.git_commit_diff("abc", "x"), "a_path": "x"}]
+    assert list(diff_schema.expand_diffs(rows)) == rows
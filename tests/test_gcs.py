@@ -0,0 +1,70 @@
+import os
+
+import pytest
+from coco_agent.remote import transfer
+from coco_agent.services.fake_gcs import FakeGCSServer
+from coco_agent.services.gcs import GCSClient
+
+
+@pytest.fixture
+def fake_gcs():
+    with FakeGCSServer() as server:
+        yield server
+
+
+def test_gcs_client_fake_server(fake_gcs):
+    gcs = GCSClient(api_endpoint=fake_gcs.url)
+
+    gcs.write_data("some data", "My-Bucket", "dir/data.txt")
+    assert fake_gcs.buckets == {"my-bucket": {"dir/data.txt": b"some data"}}
+    assert gcs.read_data("my-bucket", "dir/data.txt") == "some data"
+    assert gcs.read_data("my-bucket", "dir/data.txt", skip_bucket_check=True) == (
+        "some data"
+    )
+
+
+def test_gcs_client_write_file_resumable(fake_gcs, tmp_path):
+    data = os.urandom(600 * 1024)
+    (tmp_path / "data.bin").write_bytes(data)
+    gcs = GCSClient(api_endpoint=fake_gcs.url)
+
+    gcs.write_file(
+        str(tmp_path / "data.bin"),
+        "bucket",
+        "multipart.bin",
+        skip_bucket_check=True,
+    )
+    num_requests = fake_gcs.num_requests
+    gcs.write_file(
+        str(tmp_path / "data.bin"),
+        "bucket",
+        "resumable.bin",
+        skip_bucket_check=True,
+        resumable_chunk_size=256 * 1024,
+    )
+
+    assert fake_gcs.buckets["bucket"]["multipart.bin"] == data
+    assert fake_gcs.buckets["bucket"]["resumable.bin"] == data
+    # one request to start the upload, then one per chunk
+    assert fake_gcs.num_requests - num_requests == 4
+
+
+def test_upload_dir_to_gcs_fake_server(fake_gcs, tmp_path):
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "a.jsonl").write_text("a")
+    (tmp_path / "sub" / "b.jsonl").write_text("b")
+
+    transfer.upload_dir_to_gcs(
+        None,
+        str(tmp_path),
+        "bucket",
+        bucket_subpath="data",
+        write_complete_marker=True,
+        gcs=GCSClient(api_endpoint=fake_gcs.url),
+    )
+
+    assert fake_gcs.buckets["bucket"] == {
+        "data/a.jsonl": b"a",
+        "data/b.jsonl": b"b",
+        f"data/{transfer.UPLOAD_COMPLETE_MARKER_FILENAME}": b".",
+    }
@@ -1,7 +1,8 @@
 import os
 import tempfile
+import time
 from collections import defaultdict
-from datetime import date
+from datetime import date, datetime
 from unittest.mock import MagicMock, PropertyMock, patch
 
 import git as gitpython
@@ -10,7 +11,12 @@ import pytest
 import srsly
 from pytest import raises
 
-from coco_agent.services import git
+from coco_agent.services import git, tm_id
+from coco_agent.services.git_backends import (
+    GITPYTHON_BACKEND,
+    PYGIT2_BACKEND,
+    GitPythonBackend,
+)
 
 
 def test_generate_git_export_file_name():
@@ -345,3 +351,835 @@ def test_update_repo():
         git.update_repo(repo_dir=os.path.join(tmpdir, repo_name), branch=branch)
 
     # no exception from error status implies success
+
+
+# ---- tests against a small generated repo - see conftest.py ----
+
+
+def _extract(repo_path, rev="master", **extractor_kwargs):
+    extractor = git.GitRepoExtractor(
+        repo_path,
+        customer_id="test-cust-id",
+        source_id="test-source-id",
+        repo_tm_id=REPO_TM_ID,
+        **extractor_kwargs,
+    )
+
+    extracted = defaultdict(list)
+    for type_, item in extractor(rev=rev):
+        extracted[type_].append(item)
+    return extracted
+
+
+def test_resolve_branch_specs(test_repo_path):
+    repo = gitpython.Repo(test_repo_path)
+
+    assert git.resolve_branch_specs(repo, ["master"]) == ["master"]
+    assert git.resolve_branch_specs(repo, ["release/*"]) == [
+        "release/1.0",
+        "release/2.0",
+    ]
+    assert git.resolve_branch_specs(
+        repo, ["release/2.0", "master", "release/*", "nonexistent", "x*"]
+    ) == ["release/2.0", "master", "release/1.0"]
+
+
+def test_repo_extractor_multiple_branches(test_repo_path):
+    single = {
+        branch: [c["hexsha"] for c in _extract(test_repo_path, branch)["git_commits"]]
+        for branch in ["master", "release/1.0", "release/2.0"]
+    }
+
+    extracted = _extract(test_repo_path, ["master", "release/*"])
+    commits = extracted[git.GIT_COMMIT_TYPE]
+    hexshas = [c["hexsha"] for c in commits]
+
+    # union of all branches, each commit once
+    assert len(hexshas) == len(set(hexshas))
+    assert set(hexshas) == set().union(*single.values())
+
+    for commit in commits:
+        assert commit["branches"] == [
+            branch
+            for branch in ["master", "release/1.0", "release/2.0"]
+            if commit["hexsha"] in single[branch]
+        ]
+
+    # all commits' diffs extracted as for single branch runs
+    assert all(len(c["diffs"]) for c in commits)
+
+
+def test_repo_extractor_single_branch_has_no_branches(test_repo_path):
+    commits = _extract(test_repo_path, "master")[git.GIT_COMMIT_TYPE]
+
+    assert len(commits) == 7
+    assert all("branches" not in c for c in commits)
+
+
+def _merge_commit_diff_paths(extracted):
+    (merge,) = [c for c in extracted[git.GIT_COMMIT_TYPE] if len(c["parents"]) > 1]
+    return sorted(d["b_path"] for d in merge["diffs"])
+
+
+def test_repo_extractor_merge_diffs(test_repo_path):
+    assert _merge_commit_diff_paths(_extract(test_repo_path)) == [
+        "README.md",
+        "src/util.py",
+    ]
+    assert _merge_commit_diff_paths(
+        _extract(test_repo_path, merge_diffs=git.MERGE_DIFFS_FIRST_PARENT)
+    ) == ["README.md", "src/util.py"]
+    assert _merge_commit_diff_paths(
+        _extract(test_repo_path, merge_diffs=git.MERGE_DIFFS_COMBINED)
+    ) == ["README.md"]
+    assert (
+        _merge_commit_diff_paths(
+            _extract(test_repo_path, merge_diffs=git.MERGE_DIFFS_NONE)
+        )
+        == []
+    )
+
+    with pytest.raises(ValueError, match="merge diff strategy"):
+        _extract(test_repo_path, merge_diffs="whatever")
+
+
+def test_repo_extractor_max_commits(test_repo_path):
+    # the most recent commits, not the first of the walk
+    commits = _extract(test_repo_path, first_parent=True, max_commits=2)[
+        git.GIT_COMMIT_TYPE
+    ]
+    assert [c["summary"].split(":")[0] for c in commits] == ["m1", "c7"]
+
+    commits = _extract(test_repo_path, max_commits=100)[git.GIT_COMMIT_TYPE]
+    assert len(commits) == 7
+
+
+def test_repo_extractor_first_parent(test_repo_path):
+    commits = _extract(test_repo_path, first_parent=True)[git.GIT_COMMIT_TYPE]
+
+    assert [c["summary"].split(":")[0] for c in commits] == [
+        "c1",
+        "c2",
+        "c4",
+        "m1",
+        "c7",
+    ]
+
+    commits = _extract(test_repo_path, ["master", "release/1.0"], first_parent=True)[
+        git.GIT_COMMIT_TYPE
+    ]
+    branches = {c["summary"].split(":")[0]: c["branches"] for c in commits}
+    assert branches["c2"] == ["master", "release/1.0"]
+    assert branches["c3"] == ["release/1.0"]  # not reachable via master first parents
+
+
+@pytest.mark.parametrize(
+    "pattern, path, expected",
+    [
+        ("vendor", "vendor/lib.js", True),
+        ("vendor/", "vendor/lib.js", True),
+        ("vendor", "vendors/lib.js", False),
+        ("vendor/**", "vendor/a/lib.js", True),
+        ("*.lock", "yarn.lock", True),
+        ("*.lock", "web/yarn.lock", False),
+        ("**/*.lock", "web/yarn.lock", True),
+        ("**/*.lock", "yarn.lock", True),
+        ("src/*", "src/app.py", True),
+        ("src/*", "src/sub/app.py", False),
+        ("*/generated", "a/generated/x.py", False),
+        ("a/**/y.py", "a/generated/sub/y.py", True),
+        ("a/g?nerated/*", "a/generated/x.py", True),
+        ("[!x]*.py", "app.py", True),
+        ("[!x]*.py", "x.py", False),
+    ],
+)
+def test_path_filter_glob_matching(test_repo_path, pattern, path, expected):
+    assert git.PathFilter(include_paths=[pattern]).matches(path) == expected
+    assert git.PathFilter(exclude_paths=[pattern]).matches(path) != expected
+
+
+def test_repo_extractor_path_filters(test_repo_path):
+    def diff_paths(**kwargs):
+        extracted = _extract(test_repo_path, **kwargs)
+        return {d["a_path"] for c in extracted["git_commits"] for d in c["diffs"]}
+
+    all_paths = diff_paths()
+    assert "vendor/lib.js" in all_paths and "README.md" in all_paths
+
+    assert diff_paths(exclude_paths=["vendor/**"]) == all_paths - {"vendor/lib.js"}
+    assert diff_paths(include_paths=["src"]) == {
+        p for p in all_paths if p.startswith("src/")
+    }
+    assert diff_paths(include_paths=["src/**"], exclude_paths=["**/util.py"]) == {
+        "src/app.py",
+        "src/next.py",
+    } & all_paths
+    assert diff_paths(
+        include_paths=["*.md"], merge_diffs=git.MERGE_DIFFS_COMBINED
+    ) == {"README.md"}
+
+
+@patch(git.__name__ + "." + git.get_repo_name_from_remote.__name__)
+def test_ingest_repo_to_jsonl_monorepo_split(mock_name_getter, test_repo_path):
+    mock_name_getter.return_value = "mono"
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        git.ingest_repo_to_jsonl(
+            "customer-id",
+            "source-id",
+            test_repo_path,
+            branch="master",
+            output_dir=tmpdir,
+            path_repo_names={"src": "app", "docs/": "docs", "vendor": "app"},
+        )
+
+        repo_ids = {
+            name: tm_id.git_repo("customer-id", "source-id", name)
+            for name in ["mono", "app", "docs"]
+        }
+        read = lambda repo_id, type_: list(
+            srsly.read_jsonl(
+                os.path.join(
+                    tmpdir,
+                    git.generate_git_export_file_name(
+                        "jsonl", "customer-id", "source-id", repo_id, type_
+                    ),
+                )
+            )
+        )
+
+        # one repo record per repo, each in its own file
+        assert len(os.listdir(tmpdir)) == 9
+        for name, repo_id in repo_ids.items():
+            assert [r["name"] for r in read(repo_id, git.GIT_REPO_TYPE)] == [name]
+
+        diff_paths = {
+            name: {d["a_path"] for d in read(repo_id, git.GIT_COMMIT_DIFF_TYPE)}
+            for name, repo_id in repo_ids.items()
+        }
+        assert diff_paths["mono"] == {"README.md"}
+        assert diff_paths["app"] == {"src/app.py", "src/util.py", "vendor/lib.js"}
+        assert diff_paths["docs"] == {"docs/index.md"}
+
+        for name, repo_id in repo_ids.items():
+            commits = read(repo_id, git.GIT_COMMIT_TYPE)
+            commit_ids = {c["tm_id"] for c in commits}
+            assert all(c["repo_id"] == repo_id for c in commits)
+            for diff in read(repo_id, git.GIT_COMMIT_DIFF_TYPE):
+                assert diff["repo_id"] == repo_id
+                assert diff["commit_id"] in commit_ids
+                assert diff["a_object_id"] == tm_id.git_path(repo_id, diff["a_path"])
+
+        # c2 touched both src/ and vendor/ - one commit for app, with both diffs
+        app_commits = read(repo_ids["app"], git.GIT_COMMIT_TYPE)
+        assert len([c for c in app_commits if c["summary"].startswith("c2")]) == 1
+
+
+def _commit_diff_types(extracted, summary_prefix):
+    (commit,) = [
+        c
+        for c in extracted[git.GIT_COMMIT_TYPE]
+        if c["summary"].startswith(summary_prefix)
+    ]
+    return {d["a_path"]: d["type"] for d in commit["diffs"]}
+
+
+def test_repo_extractor_rename_detection(test_repo_path):
+    # c7 renames docs/index.md -> docs/home.md without changes
+    assert _commit_diff_types(_extract(test_repo_path), "c7")["docs/index.md"] == "R"
+    assert (
+        _commit_diff_types(
+            _extract(test_repo_path, rename_detection=git.RENAME_DETECTION_EXACT), "c7"
+        )["docs/index.md"]
+        == "R"
+    )
+    assert _commit_diff_types(
+        _extract(test_repo_path, rename_detection=git.RENAME_DETECTION_OFF), "c7"
+    ) == {"docs/index.md": "D", "docs/home.md": "A", "vendor/lib.js": "D"}
+
+    with pytest.raises(ValueError, match="rename detection mode"):
+        _extract(test_repo_path, rename_detection="whatever")
+
+
+@pytest.mark.parametrize("backend", [GITPYTHON_BACKEND, PYGIT2_BACKEND])
+def test_repo_extractor_rename_limit(test_repo_path, caplog, backend):
+    if backend == PYGIT2_BACKEND:
+        pytest.importorskip("pygit2")
+
+    # rename and change two files, so only inexact rename detection picks them up
+    repo = gitpython.Repo(test_repo_path)
+    os.mkdir(os.path.join(test_repo_path, "lib"))
+    for old_path, new_path in [("src/app.py", "lib/main.py"), ("src/util.py", "x.py")]:
+        repo.git.mv(old_path, new_path)
+        with open(os.path.join(test_repo_path, new_path), "a") as f:
+            f.write("# changed\n")
+    repo.git.add(A=True)
+    actor = gitpython.Actor("Test Author", "author@example.com")
+    repo.index.commit("c8: move and change", author=actor, committer=actor)
+
+    types = _commit_diff_types(_extract(test_repo_path, backend=backend), "c8")
+    assert types == {"src/app.py": "R", "src/util.py": "R"}
+
+    with caplog.at_level("INFO"):
+        types = _commit_diff_types(
+            _extract(test_repo_path, backend=backend, rename_limit=1), "c8"
+        )
+    assert set(types.values()) == {"A", "D"}
+    assert f"Rename limit hit for commit {repo.head.commit.hexsha}" in caplog.text
+
+    types = _commit_diff_types(
+        _extract(
+            test_repo_path, backend=backend, rename_detection=git.RENAME_DETECTION_EXACT
+        ),
+        "c8",
+    )
+    assert set(types.values()) == {"A", "D"}
+
+
+def test_commit_deadline(test_repo_path):
+    repo = gitpython.Repo(test_repo_path)
+    backend = GitPythonBackend(repo)
+
+    with git.CommitDeadline(backend) as deadline:
+        assert deadline.remaining() is None
+        deadline.check()
+
+    # start a persistent cat-file process, as used for blob size lookups
+    repo.git.get_object_header(repo.head.commit.hexsha)
+    cat_file_proc = repo.git.cat_file_header.proc
+
+    with git.CommitDeadline(backend, timeout_sec=0.1) as deadline:
+        assert 0 < deadline.remaining() <= 0.1
+        time.sleep(0.3)
+
+        assert deadline.expired
+        with pytest.raises(git.CommitTimeoutError):
+            deadline.check()
+        assert cat_file_proc.poll() is not None  # killed by the watchdog
+
+    # and restarted on demand
+    assert repo.git.cat_file_header is None
+    repo.git.get_object_header(repo.head.commit.hexsha)
+
+
+def test_repo_extractor_commit_timeout(test_repo_path, caplog):
+    numstat = GitPythonBackend.numstat
+
+    def hanging_numstat(self, commit, path_filter=None, timeout=None):
+        if commit.summary.startswith("c4"):
+            self.repo.git.execute(["sleep", "10"], kill_after_timeout=timeout)
+        return numstat(self, commit, path_filter=path_filter, timeout=timeout)
+
+    start_time = time.time()
+    with patch.object(GitPythonBackend, "numstat", hanging_numstat):
+        with caplog.at_level("INFO"):
+            with tempfile.TemporaryDirectory() as tmpdir:
+                git.ingest_repo_to_jsonl(
+                    "customer-id",
+                    "source-id",
+                    test_repo_path,
+                    branch="master",
+                    output_dir=tmpdir,
+                    commit_timeout_sec=1,
+                )
+                (commits_file,) = [f for f in os.listdir(tmpdir) if "commits." in f]
+                commits = list(srsly.read_jsonl(os.path.join(tmpdir, commits_file)))
+
+    assert time.time() - start_time < 5
+
+    assert len(commits) == 7
+    for commit in commits:
+        if commit["summary"].startswith("c4"):
+            assert commit["diffs_skipped"] == git.DIFFS_SKIPPED_TIMEOUT
+        else:
+            assert "diffs_skipped" not in commit
+
+    assert "Diffs skipped for 1 commit(s)" in caplog.text
+
+
+def test_write_commit_graph(test_repo_path):
+    git.write_commit_graph(test_repo_path)
+
+    graph_path = os.path.join(test_repo_path, ".git", "objects", "info", "commit-graph")
+    assert os.path.exists(graph_path)
+    # changed-path Bloom filter chunks
+    with open(graph_path, "rb") as f:
+        assert b"BIDX" in f.read()
+
+    # extraction reads the same history with the graph in place
+    assert len(_extract(test_repo_path)["git_commits"]) == 7
+
+
+def test_repo_extractor_commit_cache(test_repo_path, tmp_path):
+    from coco_agent.services.commit_cache import CommitCache
+
+    expected = _extract(test_repo_path)
+
+    with CommitCache(str(tmp_path / "cache.sqlite")) as cache:
+        assert _extract(test_repo_path, commit_cache=cache) == expected
+        assert cache.misses == 7
+
+        # cached commits aren't diffed again
+        with patch.object(
+            git.GitRepoExtractor, "load_commit_diffs", side_effect=AssertionError
+        ):
+            assert _extract(test_repo_path, commit_cache=cache) == expected
+        assert cache.hits == 7
+
+        # other options make for other records
+        _extract(test_repo_path, commit_cache=cache, exclude_paths=["vendor/**"])
+        assert cache.misses == 14
+
+        # overlapping date ranges only extract new commits
+        _extract(test_repo_path, commit_cache=cache, start_date=date(2021, 6, 1))
+        assert cache.hits == 8
+
+
+def _read_output_files(output_dir):
+    contents = {}
+    for file_name in os.listdir(output_dir):
+        with open(os.path.join(output_dir, file_name)) as f:
+            contents[file_name] = f.read()
+    return contents
+
+
+@pytest.mark.parametrize(
+    "extractor_kwargs",
+    [
+        {},
+        dict(path_repo_names={"src": "app"}),
+        dict(compact_users=True),
+        dict(compact_diffs=True),
+    ],
+)
+def test_ingest_repo_to_jsonl_resume(test_repo_path, tmp_path, extractor_kwargs):
+    ingest_kwargs = dict(
+        customer_id="customer-id",
+        source_id="source-id",
+        repo_path=test_repo_path,
+        branch="master",
+        commits_batch_size=2,
+        **extractor_kwargs,
+    )
+
+    expected_dir, resumed_dir = str(tmp_path / "expected"), str(tmp_path / "resumed")
+    git.ingest_repo_to_jsonl(output_dir=expected_dir, **ingest_kwargs)
+    expected = _read_output_files(expected_dir)
+    assert not any(f.endswith(git.PARTIAL_FILE_SUFFIX) for f in expected)
+
+    build_commit = git.GitRepoExtractor._build_commit
+
+    def crashing_build_commit(self, repo_tm_id, commit_obj):
+        if commit_obj.summary.startswith("m1"):
+            raise RuntimeError("crash")
+        return build_commit(self, repo_tm_id, commit_obj)
+
+    with patch.object(git.GitRepoExtractor, "_build_commit", crashing_build_commit):
+        with pytest.raises(RuntimeError, match="crash"):
+            git.ingest_repo_to_jsonl(output_dir=resumed_dir, **ingest_kwargs)
+
+    # nothing finalised - just partial files, and a checkpoint after c4 (2nd batch)
+    interrupted = _read_output_files(resumed_dir)
+    assert git.CHECKPOINT_FILE_NAME in interrupted
+    assert not any(
+        f.endswith(".jsonl") for f in interrupted if f != git.CHECKPOINT_FILE_NAME
+    )
+
+    with pytest.raises(ValueError, match="different parameters"):
+        git.ingest_repo_to_jsonl(
+            output_dir=resumed_dir, resume=True, **{**ingest_kwargs, "branch": "main"}
+        )
+
+    built_summaries = []
+
+    def recording_build_commit(self, repo_tm_id, commit_obj):
+        built_summaries.append(commit_obj.summary[:2])
+        return build_commit(self, repo_tm_id, commit_obj)
+
+    with patch.object(git.GitRepoExtractor, "_build_commit", recording_build_commit):
+        git.ingest_repo_to_jsonl(output_dir=resumed_dir, resume=True, **ingest_kwargs)
+
+    assert built_summaries == ["c5", "m1", "c7"]
+    assert _read_output_files(resumed_dir) == expected
+
+
+def test_jsonl_file_sink_resume_drops_writes_after_checkpoint(tmp_path):
+    def create_sink(resume):
+        return git.JsonlFileSink(
+            "customer-id", "source-id", str(tmp_path), ["params"], resume=resume
+        )
+
+    sink = create_sink(resume=False)
+    sink.write(git.GIT_COMMIT_TYPE, "repo-id", [{"tm_id": "c1"}])
+    sink.write(git.GIT_COMMIT_DIFF_TYPE, "repo-id", [{"tm_id": "d1"}])
+    sink.write_checkpoint("c1")
+    # crash part way through the next batch - after its commits were written
+    sink.write(git.GIT_COMMIT_TYPE, "repo-id", [{"tm_id": "c2"}])
+
+    # no new commits to write on resume - files still drop the partial batch
+    create_sink(resume=True).close()
+
+    file_name = "customer-id__source-id__repo-id__{}.jsonl".format
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        file_name(type_) for type_ in (git.GIT_COMMIT_TYPE, git.GIT_COMMIT_DIFF_TYPE)
+    )
+    assert list(srsly.read_jsonl(tmp_path / file_name(git.GIT_COMMIT_TYPE))) == [
+        {"tm_id": "c1"}
+    ]
+    assert list(srsly.read_jsonl(tmp_path / file_name(git.GIT_COMMIT_DIFF_TYPE))) == [
+        {"tm_id": "d1"}
+    ]
+
+
+def test_date_windows():
+    windows = git.date_windows(date(2021, 1, 1), date(2021, 1, 4), 3)
+    assert windows == [
+        (datetime(2021, 1, 1), datetime(2021, 1, 2)),
+        (datetime(2021, 1, 2), datetime(2021, 1, 3)),
+        (datetime(2021, 1, 3), datetime(2021, 1, 4)),
+    ]
+
+    # contiguous, and covering the whole range
+    windows = git.date_windows(datetime(2021, 1, 1, 6), datetime(2021, 2, 1), 7)
+    assert len(windows) == 7
+    assert windows[0][0] == datetime(2021, 1, 1, 6)
+    assert windows[-1][1] == datetime(2021, 2, 1)
+    for (_, end), (start, _) in zip(windows, windows[1:]):
+        assert end == start
+
+    # no empty windows
+    assert (
+        len(git.date_windows(datetime(2021, 1, 1), datetime(2021, 1, 1, 0, 0, 2), 5))
+        == 2
+    )
+
+    with pytest.raises(ValueError, match="must be after"):
+        git.date_windows(date(2021, 1, 2), date(2021, 1, 1), 2)
+
+
+def test_date_windows_whole_days():
+    windows = git.date_windows(
+        datetime(2021, 1, 1, 6), datetime(2021, 1, 4, 6), 3, whole_days=True
+    )
+    assert windows == [
+        (datetime(2021, 1, 1, 6), datetime(2021, 1, 2)),
+        (datetime(2021, 1, 2), datetime(2021, 1, 3)),
+        (datetime(2021, 1, 3), datetime(2021, 1, 4, 6)),
+    ]
+
+    # no more windows than days
+    assert len(git.date_windows(date(2021, 1, 1), date(2021, 1, 2), 5, True)) == 1
+
+
+def test_ingest_repo_to_jsonl_in_windows(test_repo_path, tmp_path):
+    ingest_kwargs = dict(
+        customer_id="customer-id",
+        source_id="source-id",
+        repo_path=test_repo_path,
+        branch="master",
+        start_date=date(2021, 1, 1),
+        end_date=date(2021, 7, 2),
+    )
+
+    git.ingest_repo_to_jsonl(output_dir=str(tmp_path / "single"), **ingest_kwargs)
+    window_dirs = git.ingest_repo_to_jsonl_in_windows(
+        output_dir=str(tmp_path / "windows"),
+        num_windows=3,
+        max_workers=2,
+        **ingest_kwargs,
+    )
+    assert [os.path.basename(d) for d in window_dirs] == [
+        "window-000",
+        "window-001",
+        "window-002",
+    ]
+
+    def read_records(output_dir, entity_name):
+        (file_name,) = [f for f in os.listdir(output_dir) if entity_name in f]
+        return list(srsly.read_jsonl(os.path.join(output_dir, file_name)))
+
+    expected_commits = read_records(str(tmp_path / "single"), "git_commits.")
+    window_commits = [
+        commit
+        for window_dir in window_dirs
+        for commit in read_records(window_dir, "git_commits.")
+    ]
+    assert sorted(window_commits, key=lambda c: c["committed_date"]) == sorted(
+        expected_commits, key=lambda c: c["committed_date"]
+    )
+    assert sum(
+        len(read_records(window_dir, "git_commit_diffs.")) for window_dir in window_dirs
+    ) == len(read_records(str(tmp_path / "single"), "git_commit_diffs."))
+
+    manifest = srsly.read_json(
+        str(tmp_path / "windows" / git.WINDOWS_MANIFEST_FILE_NAME)
+    )
+    assert [w["dir"] for w in manifest["windows"]] == [
+        "window-000",
+        "window-001",
+        "window-002",
+    ]
+    assert manifest["windows"][0]["start_date"] == "2021-01-01 00:00:00"
+    assert manifest["windows"][1]["start_date"] == manifest["windows"][0]["end_date"]
+
+
+def test_discover_submodules(test_repo_with_submodule_path, test_repo_path):
+    repo = gitpython.Repo(test_repo_with_submodule_path)
+    lib_hexsha = gitpython.Repo(
+        os.path.join(test_repo_with_submodule_path, "vendor", "lib")
+    ).head.commit.hexsha
+
+    submodules = git.discover_submodules(repo, "master")
+    assert [(path, hexsha) for path, _, hexsha in submodules] == [
+        ("vendor/lib", lib_hexsha),
+        ("vendor/other", lib_hexsha),
+    ]
+    # none before they were added
+    assert git.discover_submodules(repo, "master~1") == []
+    assert git.discover_submodules(gitpython.Repo(test_repo_path), "master") == []
+
+
+def test_ingest_repo_to_jsonl_with_submodules(test_repo_with_submodule_path, tmp_path):
+    output_dirs = git.ingest_repo_to_jsonl_with_submodules(
+        "cust-1",
+        "src-1",
+        test_repo_with_submodule_path,
+        "master",
+        output_dir=str(tmp_path),
+        max_workers=2,
+    )
+    # the uninitialized submodule is skipped
+    assert output_dirs == [
+        str(tmp_path),
+        os.path.join(str(tmp_path), git.SUBMODULES_DIR_NAME, "lib"),
+    ]
+
+    def read_records(output_dir, entity_name):
+        (file_name,) = [f for f in os.listdir(output_dir) if entity_name in f]
+        return list(srsly.read_jsonl(os.path.join(output_dir, file_name)))
+
+    (app_repo,) = read_records(output_dirs[0], "git_repos.")
+    (lib_repo,) = read_records(output_dirs[1], "git_repos.")
+    assert app_repo["tm_id"] == tm_id.git_repo("cust-1", "src-1", "app")
+    assert "parent_repo_id" not in app_repo
+    assert lib_repo["tm_id"] == tm_id.git_repo("cust-1", "src-1", "lib")
+    assert lib_repo["parent_repo_id"] == app_repo["tm_id"]
+    assert lib_repo["parent_path"] == "vendor/lib"
+
+    # up to the pinned commit
+    lib_commits = read_records(output_dirs[1], "git_commits.")
+    assert [c["summary"] for c in lib_commits] == ["lib0", "lib1"]
+    assert all(c["repo_id"] == lib_repo["tm_id"] for c in lib_commits)
+
+
+def test_repo_id_without_remote_name(test_repo_path):
+    # repo ids are from the remote alone, even with a forced name
+    gitpython.Repo(test_repo_path).remotes.origin.set_url("https://example.com/app")
+    extractor = git.GitRepoExtractor(
+        test_repo_path,
+        customer_id="cust-1",
+        source_id="src-1",
+        forced_repo_name="app",
+        autogenerate_repo_id=True,
+    )
+    (repo,) = [item for type_, item in extractor("master") if type_ == "git_repos"]
+    assert repo["tm_id"] == tm_id.git_repo("cust-1", "src-1", None)
+
+
+def test_ingest_repo_to_jsonl_with_submodules_unsupported(
+    test_repo_with_submodule_path, tmp_path
+):
+    for repo_path, branch in [
+        ("https://github.com/example/app.git", "master"),
+        (test_repo_with_submodule_path, ["master", "release/*"]),
+        (test_repo_with_submodule_path, "release/*"),
+    ]:
+        with pytest.raises(ValueError, match="Submodules"):
+            git.ingest_repo_to_jsonl_with_submodules(
+                "cust-1", "src-1", repo_path, branch, output_dir=str(tmp_path)
+            )
+
+
+def test_discover_submodules_bad_rev(test_repo_with_submodule_path, caplog):
+    repo = gitpython.Repo(test_repo_with_submodule_path)
+    with caplog.at_level("WARNING"):
+        assert git.discover_submodules(repo, "nonexistent") == []
+    assert "Could not read submodules at nonexistent" in caplog.text
+
+
+def test_repo_extractor_compact_users(test_repo_path):
+    expected = _extract(test_repo_path)
+    extracted = _extract(test_repo_path, compact_users=True)
+
+    author_id = tm_id.git_user(REPO_TM_ID, "author@example.com")
+    committer_id = tm_id.git_user(REPO_TM_ID, "committer@example.com")
+    assert extracted[git.GIT_USER_TYPE] == [
+        {
+            "tm_id": author_id,
+            "connector_id": tm_id.connector("test-cust-id", "git", "test-source-id"),
+            "repo_id": REPO_TM_ID,
+            "name": "Test Author",
+            "email": "author@example.com",
+        },
+        {
+            "tm_id": committer_id,
+            "connector_id": tm_id.connector("test-cust-id", "git", "test-source-id"),
+            "repo_id": REPO_TM_ID,
+            "name": "Test Committer",
+            "email": "committer@example.com",
+        },
+    ]
+
+    assert len(extracted[git.GIT_COMMIT_TYPE]) == len(expected[git.GIT_COMMIT_TYPE])
+    for commit, expected_commit in zip(
+        extracted[git.GIT_COMMIT_TYPE], expected[git.GIT_COMMIT_TYPE]
+    ):
+        assert commit["author_id"] == author_id
+        assert commit["committer_id"] == committer_id
+        for attr in [
+            "author.name",
+            "author.email",
+            "committer.name",
+            "committer.email",
+        ]:
+            assert attr not in commit
+            del expected_commit[attr]
+        del commit["author_id"], commit["committer_id"]
+        assert commit == expected_commit
+
+
+def _diff_hunks(extracted):
+    return {
+        (c["summary"].split(":")[0], d["b_path"]): (d["hunks"], d["hunks_truncated"])
+        for c in extracted[git.GIT_COMMIT_TYPE]
+        for d in c["diffs"]
+    }
+
+
+def test_repo_extractor_hunks(test_repo_path):
+    expected = _extract(test_repo_path)
+    extracted = _extract(test_repo_path, hunks=True)
+
+    hunks = _diff_hunks(extracted)
+    assert hunks[("c2", "src/app.py")] == ([[1, 0, 2, 1]], False)
+    assert hunks[("c2", "vendor/lib.js")] == ([[0, 0, 1, 20]], False)
+    assert hunks[("c5", "src/util.py")] == ([[2, 1, 2, 1]], False)
+    assert hunks[("m1", "README.md")] == ([[1, 1, 1, 1]], False)
+    assert hunks[("c7", "vendor/lib.js")] == ([[1, 20, 0, 0]], False)
+
+    # other fields as without hunks
+    for commit, expected_commit in zip(
+        extracted[git.GIT_COMMIT_TYPE], expected[git.GIT_COMMIT_TYPE]
+    ):
+        assert [
+            {k: v for k, v in d.items() if not k.startswith("hunks")}
+            for d in commit["diffs"]
+        ] == [dict(d) for d in expected_commit["diffs"]]
+
+
+def test_repo_extractor_hunk_caps(test_repo_path):
+    hunks = _diff_hunks(_extract(test_repo_path, hunks=True, hunk_max_file_lines=10))
+    assert hunks[("c2", "src/app.py")] == ([[1, 0, 2, 1]], False)
+    assert hunks[("c2", "vendor/lib.js")] == ([], True)
+
+    hunks = _diff_hunks(_extract(test_repo_path, hunks=True, hunk_max_commit_lines=5))
+    assert hunks[("c2", "src/app.py")] == ([[1, 0, 2, 1]], False)
+    assert hunks[("c2", "vendor/lib.js")] == ([], True)
+    assert hunks[("m1", "README.md")] == ([[1, 1, 1, 1]], False)
+
+
+def test_ingest_and_store_repo_churn_daily(test_repo_path):
+    stored = defaultdict(list)
+
+    def store_fn(type_, id_, records):
+        stored[type_].extend(records)
+
+    git.ingest_and_store_repo(
+        "cust-1",
+        "src-1",
+        test_repo_path,
+        "master",
+        store_fn=store_fn,
+        churn_daily=True,
+        store_diffs=False,
+    )
+
+    assert git.GIT_COMMIT_DIFF_TYPE not in stored
+    assert len(stored[git.GIT_COMMIT_TYPE]) == 7
+
+    churn = stored[git.GIT_CHURN_DAILY_TYPE]
+    # one commit a day, by one author
+    assert {(r["date"], r["path_prefix"]) for r in churn} >= {
+        ("2021-01-01", ""),
+        ("2021-01-01", "src"),
+        ("2021-02-01", "vendor"),
+        ("2021-07-01", "docs"),
+    }
+    vendor = [r for r in churn if r["path_prefix"] == "vendor"]
+    assert [(r["insertions"], r["deletions"], r["files"]) for r in vendor] == [
+        (20, 0, 1),
+        (0, 20, 1),
+    ]
+    assert all(r["commits"] == 1 for r in churn)
+
+    expected_diffs = [
+        d for c in _extract(test_repo_path)["git_commits"] for d in c["diffs"]
+    ]
+    assert sum(r["files"] for r in churn) == len(expected_diffs)
+    assert sum(r["insertions"] for r in churn) == sum(
+        d["insertions"] for d in expected_diffs
+    )
+
+
+def test_ingest_and_store_repo_churn_daily_whole_history(test_repo_path):
+    for branch, kwargs in [("c4..master", {}), ("master", dict(max_commits=2))]:
+        with raises(ValueError, match="whole history"):
+            git.ingest_and_store_repo(
+                "cust-1",
+                "src-1",
+                test_repo_path,
+                branch,
+                store_fn=lambda *args: None,
+                churn_daily=True,
+                **kwargs,
+            )
+
+
+def test_ingest_repo_to_jsonl_churn_daily_not_resumable(test_repo_path, tmp_path):
+    with raises(ValueError):
+        git.ingest_repo_to_jsonl(
+            "cust-1",
+            "src-1",
+            test_repo_path,
+            "master",
+            output_dir=str(tmp_path),
+            resume=True,
+            churn_daily=True,
+        )
+
+
+def test_ingest_repo_to_jsonl_compact_diffs(test_repo_path, tmp_path):
+    from coco_agent.services.diff_schema import read_diffs
+
+    ingest_kwargs = dict(
+        customer_id="customer-id",
+        source_id="source-id",
+        repo_path=test_repo_path,
+        branch="master",
+        commits_batch_size=2,
+    )
+    git.ingest_repo_to_jsonl(output_dir=str(tmp_path / "default"), **ingest_kwargs)
+    git.ingest_repo_to_jsonl(
+        output_dir=str(tmp_path / "compact"), compact_diffs=True, **ingest_kwargs
+    )
+
+    def diffs_path(output_dir):
+        (file_name,) = [f for f in os.listdir(output_dir) if "git_commit_diffs" in f]
+        return os.path.join(output_dir, file_name)
+
+    default_path = diffs_path(str(tmp_path / "default"))
+    compact_path = diffs_path(str(tmp_path / "compact"))
+
+    assert list(read_diffs(compact_path)) == list(read_diffs(default_path))
+    assert list(read_diffs(default_path)) == list(srsly.read_jsonl(default_path))
+    assert os.path.getsize(compact_path) < os.path.getsize(default_path) / 2
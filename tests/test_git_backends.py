@@ -0,0 +1,121 @@
+import git as gitpython
+import pytest
+
+from coco_agent.services import git
+from coco_agent.services.git_backends import (
+    GITPYTHON_BACKEND,
+    PYGIT2_BACKEND,
+    GitBackend,
+    GitPythonBackend,
+    HunkCollector,
+    create_git_backend,
+)
+from test_git import _extract
+
+
+def test_create_git_backend(test_repo_path):
+    repo = gitpython.Repo(test_repo_path)
+
+    assert isinstance(create_git_backend(GITPYTHON_BACKEND, repo), GitPythonBackend)
+    with pytest.raises(ValueError, match="Unknown git backend"):
+        create_git_backend("nope", repo)
+    with pytest.raises(ValueError, match="Unknown git backend"):
+        git.GitRepoExtractor(
+            test_repo_path, "cust-id", "source-id", repo_tm_id="x", backend="nope"
+        )
+
+
+def test_git_backend_missing_methods(test_repo_path):
+    class IncompleteBackend(GitBackend):
+        def iter_commits(self, rev, reverse=True, first_parent=False):
+            return []
+
+    with pytest.raises(TypeError, match="abstract"):
+        IncompleteBackend(gitpython.Repo(test_repo_path))
+
+
+@pytest.mark.parametrize(
+    "rev,extractor_kwargs",
+    [
+        ("master", {}),
+        ("master", dict(merge_diffs=git.MERGE_DIFFS_COMBINED)),
+        ("master", dict(merge_diffs=git.MERGE_DIFFS_NONE)),
+        ("master", dict(first_parent=True)),
+        ("master", dict(include_paths=["src/**", "docs"])),
+        ("master", dict(exclude_paths=["vendor/**"])),
+        ("master", dict(include_paths=["docs/home.md"])),
+        ("master", dict(rename_detection=git.RENAME_DETECTION_OFF)),
+        ("master", dict(rename_detection=git.RENAME_DETECTION_EXACT)),
+        ("master", dict(rename_limit=1)),
+        ("master", dict(path_repo_names={"src": "app"})),
+        ("master", dict(hunks=True)),
+        ("master", dict(hunks=True, include_paths=["src/**"])),
+        ("master", dict(hunks=True, hunk_max_file_lines=10, hunk_max_commit_lines=15)),
+        (["master", "release/*"], {}),
+        ("master~3..master", {}),
+        ("release/1.0..master", dict(first_parent=True)),
+        ("nonexistent", {}),
+    ],
+)
+def test_backends_extract_same_records(test_repo_path, rev, extractor_kwargs):
+    pytest.importorskip("pygit2")
+
+    expected = _extract(
+        test_repo_path, rev=rev, backend=GITPYTHON_BACKEND, **extractor_kwargs
+    )
+    actual = _extract(
+        test_repo_path, rev=rev, backend=PYGIT2_BACKEND, **extractor_kwargs
+    )
+
+    assert actual == expected
+
+
+def test_pygit2_backend_blob_size(test_repo_path):
+    pytest.importorskip("pygit2")
+    repo = gitpython.Repo(test_repo_path)
+    blob = repo.head.commit.tree["README.md"]
+
+    backend = create_git_backend(PYGIT2_BACKEND, repo)
+    assert backend.blob_size(blob.hexsha) == blob.size
+    with pytest.raises(ValueError, match="could not be resolved"):
+        backend.blob_size("0" * 40)
+
+
+def test_gitpython_backend_reset_after_interrupt(test_repo_path):
+    repo = gitpython.Repo(test_repo_path)
+    backend = GitPythonBackend(repo)
+    backend.blob_size(repo.head.commit.tree["README.md"].hexsha)
+
+    # killing a persistent process can leave input buffered for it, which fails to
+    # flush when it's cleaned up
+    backend.interrupt()
+    repo.git.cat_file_header.proc.wait()
+    repo.git.cat_file_header.proc.stdin.write(b"x\n")
+    backend.reset()
+
+    assert repo.git.cat_file_header is None
+    assert backend.blob_size(repo.head.commit.tree["README.md"].hexsha) == 12
+
+
+def test_hunk_collector_caps():
+    collector = HunkCollector(max_file_lines=5, max_commit_lines=20)
+    assert collector.add("a.py", 1, 1, 1, 1)
+    assert collector.add("big.js", 1, 2, 1, 2)
+    # going over the file cap drops the hunks collected so far, and any later ones
+    assert collector.add("big.js", 10, 1, 10, 1)
+    assert collector.add("big.js", 20, 0, 20, 1)
+    assert collector.add("b.py", 3, 0, 3, 2)
+
+    assert collector.hunks == {
+        "a.py": [[1, 1, 1, 1]],
+        "big.js": [],
+        "b.py": [[3, 0, 3, 2]],
+    }
+    assert collector.truncated_paths == {"big.js"}
+    assert not collector.commit_truncated
+
+    # going over the commit cap keeps what's been collected, and stops collection
+    assert collector.add("b.py", 5, 6, 5, 6) is False
+    assert collector.hunks["b.py"] == [[3, 0, 3, 2]]
+    assert collector.truncated_paths == {"big.js", "b.py"}
+    assert collector.commit_truncated
@@ -0,0 +1,90 @@
+import time
+
+import git
+from coco_agent.services.git import GitRepoExtractor
+from coco_agent.services.git_trace import GitTracer, _command_name
+
+
+def test_command_name():
+    assert _command_name(["git", "diff-tree", "-r", "abc"]) == "diff-tree"
+    assert _command_name(["git", "-c", "core.quotepath=off", "log"]) == "log"
+    assert _command_name("git --no-pager show HEAD") == "show"
+
+
+def test_git_tracer(test_repo_path):
+    repo = git.Repo(test_repo_path)
+    original_execute = git.cmd.Git.execute
+
+    with GitTracer() as tracer:
+        tracer.commit = repo.head.commit.hexsha
+        repo.git.diff_tree("-r", "--numstat", "HEAD")
+        repo.odb.stream(repo.head.commit.binsha).read()
+        tracer.commit = None
+        repo.git.rev_parse("HEAD")
+
+    assert git.cmd.Git.execute is original_execute
+
+    summary = tracer.summary()
+    assert summary["commands"]["diff-tree"]["calls"] == 1
+    assert summary["commands"]["diff-tree"]["bytes"] > 0
+    assert summary["commands"]["cat-file --batch"]["calls"] == 1
+    assert summary["commands"]["rev-parse"]["calls"] == 1
+    assert summary["commits"] == 1
+    assert summary["max_calls_commit"] == repo.head.commit.hexsha
+    assert (
+        summary["slowest"][0]["duration_sec"] >= summary["slowest"][-1]["duration_sec"]
+    )
+
+
+def test_git_tracer_process(test_repo_path):
+    repo = git.Repo(test_repo_path)
+
+    with GitTracer() as tracer:
+        tracer.commit = "c1"
+        commits = list(repo.iter_commits("master"))
+        tracer.commit = "c2"
+        cmd = repo.git.log("--format=%H", as_process=True)
+        # recorded once read to the end
+        assert len(tracer.calls) == 1
+        output = b"".join(cmd.proc.stdout)
+        cmd.wait()
+
+    assert len(commits) == 7
+    rev_list, log = tracer.calls
+    assert (rev_list.name, rev_list.commit) == ("rev-list", "c1")
+    assert rev_list.num_bytes == 7 * 41
+    assert (log.name, log.num_bytes, log.commit) == ("log", len(output), "c2")
+
+
+def test_git_tracer_process_outside_commits(test_repo_path):
+    repo = git.Repo(test_repo_path)
+
+    with GitTracer() as tracer:
+        # as the history walk - started before any commit, read between commits
+        cmd = repo.git.rev_list("master", as_process=True)
+        for line in iter(cmd.proc.stdout.readline, b""):
+            tracer.commit = line.strip().decode()
+            time.sleep(0.05)
+        cmd.wait()
+
+    (rev_list,) = tracer.calls
+    assert rev_list.commit is None
+    # only the time blocked on git, not processing in between
+    assert rev_list.duration_sec < 0.2
+
+
+def test_extractor_trace_git(test_repo_path):
+    extractor = GitRepoExtractor(
+        test_repo_path,
+        customer_id="a",
+        source_id="b",
+        forced_repo_name="test",
+        autogenerate_repo_id=True,
+        trace_git=True,
+    )
+    commits = [r for t, r in extractor("master") if t == "git_commits"]
+
+    summary = extractor.git_tracer.summary()
+    assert summary["commits"] == len(commits)
+    assert summary["calls_per_commit"] > 1
+    assert "diff-tree" in summary["commands"]
@@ -0,0 +1,126 @@
+import os
+
+import git as gitpython
+import pytest
+import srsly
+from click.testing import CliRunner
+from coco_agent.remote import hook
+from coco_agent.remote.cli import cli
+
+
+def _hexshas(repo_path):
+    repo = gitpython.Repo(repo_path)
+    return {
+        c.summary.split(":")[0]: c.hexsha
+        for c in repo.iter_commits(["master", "release/2.0"])
+    }
+
+
+def _extracted_summaries(output_dir):
+    summaries = {}
+    for job_dir in sorted(os.listdir(output_dir)):
+        commits_file = [
+            f
+            for f in os.listdir(os.path.join(output_dir, job_dir))
+            if "git_commits" in f
+        ][0]
+        summaries[job_dir] = sorted(
+            c["summary"].split(":")[0]
+            for c in srsly.read_jsonl(os.path.join(output_dir, job_dir, commits_file))
+        )
+    return list(summaries.values())
+
+
+def test_parse_post_receive_lines():
+    assert hook.parse_post_receive_lines(
+        [
+            f"{'a' * 40} {'b' * 40} refs/heads/master\n",
+            "\n",
+            f"{'c' * 40} {hook.ZERO_HEXSHA} refs/heads/gone\n",
+        ]
+    ) == [("a" * 40, "b" * 40, "refs/heads/master")]
+
+
+def test_default_repo_name():
+    assert hook.default_repo_name("/srv/git/project.git") == "project"
+    assert hook.default_repo_name("/srv/git/project/") == "project"
+
+
+def test_push_rev_range(test_repo_path):
+    repo = gitpython.Repo(test_repo_path)
+    hexshas = _hexshas(test_repo_path)
+
+    assert (
+        hook.push_rev_range(repo, hexshas["c4"], hexshas["c7"], "refs/heads/master")
+        == f"{hexshas['c4']}..{hexshas['c7']}"
+    )
+    # a new branch, from its merge base with HEAD
+    assert (
+        hook.push_rev_range(repo, hook.ZERO_HEXSHA, hexshas["c6"], "refs/heads/x")
+        == f"{hexshas['c3']}..{hexshas['c6']}"
+    )
+    # HEAD's branch, pushed for the first time
+    assert (
+        hook.push_rev_range(repo, hook.ZERO_HEXSHA, hexshas["c7"], "refs/heads/master")
+        == hexshas["c7"]
+    )
+
+
+def test_hook_post_receive(test_repo_path, tmp_path):
+    hexshas = _hexshas(test_repo_path)
+    output_dir = str(tmp_path / "out")
+
+    runner = CliRunner()
+    result = runner.invoke(
+        cli,
+        [
+            "hook",
+            "post-receive",
+            "--connector-id=test/git/test",
+            "--output-dir=" + output_dir,
+            "--repo-path=" + test_repo_path,
+            "--foreground",
+        ],
+        input=(
+            f"{hexshas['c4']} {hexshas['m1']} refs/heads/master\n"
+            f"{hook.ZERO_HEXSHA} {hexshas['c6']} refs/heads/release/2.0\n"
+        ),
+        catch_exceptions=False,
+    )
+    assert result.exit_code == 0, result.output
+
+    # one extract per push, in the order received
+    assert _extracted_summaries(output_dir) == [["c3", "c5", "m1"], ["c6"]]
+    queue_dir = os.path.join(test_repo_path, hook.DEFAULT_QUEUE_DIR_NAME)
+    assert not os.listdir(os.path.join(queue_dir, hook.PENDING_DIR_NAME))
+
+
+def test_process_queue_moves_failed_jobs_aside(tmp_path):
+    queue_dir = str(tmp_path / "queue")
+    hook.enqueue_push(
+        queue_dir,
+        dict(
+            repo_path=str(tmp_path / "no-such-repo"),
+            old="a" * 40,
+            new="b" * 40,
+            ref="refs/heads/master",
+            connector_id="test/git/test",
+            forced_repo_name="test-repo",
+            output_dir=str(tmp_path / "out"),
+        ),
+    )
+
+    assert hook.process_queue(queue_dir) == 1
+    assert not os.listdir(os.path.join(queue_dir, hook.PENDING_DIR_NAME))
+    assert len(os.listdir(os.path.join(queue_dir, hook.FAILED_DIR_NAME))) == 1
+
+
+def test_hook_post_receive_requires_destination(test_repo_path):
+    runner = CliRunner()
+    with pytest.raises(ValueError):
+        runner.invoke(
+            cli,
+            ["hook", "post-receive", "--connector-id=test/git/test"],
+            input="",
+            catch_exceptions=False,
+        )
@@ -1,5 +1,20 @@
+import gzip
+import io
+import logging
+import os
+import queue
+import threading
+import time
+from unittest.mock import MagicMock
+
 import pytest
-from coco_agent.remote.logging import apply_log_config
+from coco_agent.remote.logging import (
+    BoundedBackgroundThreadTransport,
+    DroppingQueueHandler,
+    apply_log_config,
+    create_rotating_file_handler,
+    stop_queued_logging,
+)
 
 
 def test_cloud_logging_validation():
@@ -8,3 +23,114 @@ def test_cloud_logging_validation():
 
     with pytest.raises(ValueError, match="Credentials file path required"):
         apply_log_config("info", log_to_cloud=True)
+
+
+def test_rotating_file_handler_gzips_backups(tmp_path):
+    handler = create_rotating_file_handler(
+        str(tmp_path / "agent.log"), max_bytes=100, backup_count=2
+    )
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    for i in range(20):
+        handler.emit(logging.makeLogRecord({"msg": f"line {i} " + "x" * 20}))
+    handler.close()
+
+    assert sorted(os.listdir(tmp_path)) == [
+        "agent.log",
+        "agent.log.1.gz",
+        "agent.log.2.gz",
+    ]
+    with gzip.open(tmp_path / "agent.log.1.gz", "rt") as f:
+        assert f.read().startswith("line ")
+
+
+def test_dropping_queue_handler():
+    handler = DroppingQueueHandler(queue.Queue(2))
+    for i in range(5):
+        handler.handle(logging.makeLogRecord({"msg": f"record {i}"}))
+    assert handler.num_dropped == 3
+
+    # the drops are reported once there's room
+    handler.queue.get_nowait()
+    handler.queue.get_nowait()
+    handler.handle(logging.makeLogRecord({"msg": "record 5"}))
+    messages = [handler.queue.get_nowait().msg for _ in range(2)]
+    assert messages == ["Dropped 3 log record(s) - log queue full", "record 5"]
+
+
+def test_apply_log_config_queued(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    root_logger = logging.getLogger()
+    console_handler = logging.StreamHandler(io.StringIO())
+    root_logger.addHandler(console_handler)
+    try:
+        # reapplied, as when the CLI runs in-process more than once
+        apply_log_config("debug", log_file_name="test", module="coco_agent_test")
+        apply_log_config("debug", log_file_name="test", module="coco_agent_test")
+        # only the queue is on the root logger, the console is behind its listener
+        assert console_handler not in root_logger.handlers
+        assert (
+            len(
+                [h for h in root_logger.handlers if isinstance(h, DroppingQueueHandler)]
+            )
+            == 1
+        )
+
+        logging.getLogger("coco_agent_test.sub").debug("queued")
+        logging.getLogger("other").warning("not for the file")
+    finally:
+        stop_queued_logging()
+        root_logger.removeHandler(console_handler)
+
+    assert not [h for h in root_logger.handlers if isinstance(h, DroppingQueueHandler)]
+    assert "queued" in console_handler.stream.getvalue()
+    log_text = (tmp_path / "test.log").read_text()
+    assert "DEBUG: queued" in log_text
+    assert "not for the file" not in log_text
+
+
+class _FakeBatch:
+    def __init__(self, sent, release):
+        self.entries = []
+        self._sent = sent
+        self._release = release
+
+    def log(self, **entry):
+        self.entries.append(entry)
+
+    def commit(self):
+        self._release.wait()
+        self._sent.extend(self.entries)
+
+
+class _FakeCloudLogger:
+    def __init__(self):
+        self.sent = []
+        self.release = threading.Event()
+
+    def batch(self):
+        return _FakeBatch(self.sent, self.release)
+
+
+def test_bounded_background_thread_transport():
+    cloud_logger = _FakeCloudLogger()
+    client = MagicMock()
+    client.logger.return_value = cloud_logger
+    transport = BoundedBackgroundThreadTransport(
+        client, "test", max_queue_size=2, batch_size=1
+    )
+
+    # one entry in flight, blocked on sending, two queued, the rest dropped
+    for i in range(5):
+        record = logging.makeLogRecord({"name": "coco_agent", "msg": f"entry {i}"})
+        transport.send(record, f"entry {i}")
+        time.sleep(0.05)
+    assert transport.num_dropped == 2
+
+    cloud_logger.release.set()
+    transport.close()
+    assert [e["message"] for e in cloud_logger.sent] == [
+        "entry 0",
+        "entry 1",
+        "entry 2",
+    ]
+    assert cloud_logger.sent[0]["labels"] == {"python_logger": "coco_agent"}
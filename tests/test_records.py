@@ -0,0 +1,61 @@
+import pickle
+
+import pytest
+import srsly
+
+from coco_agent.services.records import DiffRecord, HunkDiffRecord
+
+DIFF = dict(
+    insertions=1,
+    deletions=2,
+    lines=3,
+    tm_id="gdf-1",
+    connector_id="con-1",
+    repo_id="gir-1",
+    commit_id="gic-1",
+    a_path="src/app.py",
+    b_path="src/app.py",
+    a_object_id="gip-1",
+    b_object_id="gip-1",
+    size_delta=-5,
+    type="M",
+)
+
+
+def test_diff_record_mapping():
+    record = DiffRecord(**DIFF)
+
+    assert record == DIFF
+    assert DIFF == record
+    assert dict(record) == DIFF
+    assert list(record) == list(DIFF)
+    assert record["a_path"] == "src/app.py"
+    assert record.get("branches") is None
+    with pytest.raises(KeyError):
+        record["toDict"]
+
+    # slotted, i.e. no per-record dict
+    assert not hasattr(record, "__dict__")
+    with pytest.raises(TypeError):
+        DiffRecord(**DIFF, extra=1)
+    with pytest.raises(TypeError):
+        DiffRecord(insertions=1)
+
+
+def test_diff_record_serialization():
+    record = DiffRecord(**DIFF)
+
+    assert srsly.json_dumps(record) == srsly.json_dumps(DIFF)
+    assert srsly.json_dumps({"diffs": [record]}) == srsly.json_dumps({"diffs": [DIFF]})
+    assert pickle.loads(pickle.dumps(record)) == DIFF
+
+
+def test_hunk_diff_record():
+    record = HunkDiffRecord(**DIFF, hunks=[[1, 0, 2, 1]], hunks_truncated=False)
+
+    assert record == dict(DIFF, hunks=[[1, 0, 2, 1]], hunks_truncated=False)
+    assert list(record)[-2:] == ["hunks", "hunks_truncated"]
+    assert not hasattr(record, "__dict__")
+    assert pickle.loads(pickle.dumps(record)) == record
+    with pytest.raises(KeyError):
+        DiffRecord(**DIFF)["hunks"]
@@ -0,0 +1,142 @@
+import io
+import sqlite3
+
+import pytest
+import srsly
+
+from coco_agent.services.git import ingest_repo_to_sink
+from coco_agent.services.sinks import (
+    NULL_SINK,
+    SQLITE_SINK,
+    STDOUT_SINK,
+    NullSink,
+    Sink,
+    SqliteSink,
+    StdoutSink,
+    create_sink,
+)
+
+RECORDS = [{"tm_id": "gic-1", "summary": "c1"}, {"tm_id": "gic-2", "summary": "c2"}]
+
+
+def test_null_sink_counts_records():
+    with NullSink() as sink:
+        sink("git_commits", "gir-1", iter(RECORDS))
+        sink("git_commits", "gir-1", RECORDS[:1])
+
+    assert sink.num_records == 3
+    assert sink.num_bytes == 0
+
+
+def test_stdout_sink_writes_ndjson():
+    stream = io.StringIO()
+    with StdoutSink(stream=stream) as sink:
+        sink("git_commits", "gir-1", RECORDS)
+
+    lines = stream.getvalue().splitlines()
+    assert [srsly.json_loads(line) for line in lines] == [
+        {"type": "git_commits", "record": record} for record in RECORDS
+    ]
+    assert sink.num_records == 2
+    assert sink.num_bytes == len(stream.getvalue())
+
+
+def test_create_sink():
+    assert isinstance(create_sink(NULL_SINK), NullSink)
+    assert isinstance(create_sink(STDOUT_SINK, stream=io.StringIO()), StdoutSink)
+
+    with pytest.raises(ValueError):
+        create_sink("nowhere")
+
+
+def _sqlite_rows(db_path, query):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(query).fetchall()
+    finally:
+        conn.close()
+
+
+def test_sqlite_sink(tmp_path, test_repo_path):
+    db_path = str(tmp_path / "coco.db")
+
+    for _ in range(2):
+        ingest_repo_to_sink(
+            "cust-1",
+            "src-1",
+            test_repo_path,
+            "master",
+            create_sink(SQLITE_SINK, path=db_path),
+        )
+
+    # repeated runs upsert rather than duplicate
+    assert _sqlite_rows(db_path, "SELECT count(*) FROM git_repos") == [(1,)]
+    assert _sqlite_rows(db_path, "SELECT count(*) FROM git_commits") == [(7,)]
+    assert _sqlite_rows(db_path, "SELECT count(*) FROM git_commit_diffs") == [(11,)]
+
+    ((summary, author_name, parents),) = _sqlite_rows(
+        db_path,
+        "SELECT summary, author_name, parents FROM git_commits WHERE summary LIKE 'm1%'",
+    )
+    assert author_name
+    assert len(srsly.json_loads(parents)) == 2
+
+    indexes = {
+        name
+        for (name,) in _sqlite_rows(
+            db_path, "SELECT name FROM sqlite_master WHERE type = 'index'"
+        )
+    }
+    assert "git_commit_diffs_commit_id" in indexes
+
+
+def test_sqlite_sink_commits_per_batch(tmp_path):
+    db_path = str(tmp_path / "coco.db")
+    sink = SqliteSink(db_path)
+    sink("git_repos", "gir-1", [{"tm_id": "gir-1", "name": "repo"}])
+    assert _sqlite_rows(db_path, "SELECT count(*) FROM git_repos") == [(0,)]
+
+    sink.batch_stored("abc")
+    assert _sqlite_rows(db_path, "SELECT count(*) FROM git_repos") == [(1,)]
+
+    with pytest.raises(ValueError):
+        sink("git_things", "gir-1", [{"tm_id": "x"}])
+    sink.close()
+
+
+def test_sqlite_sink_repo_parents(tmp_path):
+    db_path = str(tmp_path / "coco.db")
+    # a database from before parent columns were added
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "CREATE TABLE git_repos (tm_id, connector_id, name, url, path_prefix, "
+        "PRIMARY KEY (tm_id))"
+    )
+    conn.close()
+
+    with SqliteSink(db_path) as sink:
+        sink("git_repos", "gir-1", [{"tm_id": "gir-1", "name": "app"}])
+        sink(
+            "git_repos",
+            "gir-2",
+            [
+                {
+                    "tm_id": "gir-2",
+                    "name": "lib",
+                    "parent_repo_id": "gir-1",
+                    "parent_path": "vendor/lib",
+                }
+            ],
+        )
+
+    assert _sqlite_rows(
+        db_path, "SELECT tm_id, parent_repo_id, parent_path FROM git_repos"
+    ) == [("gir-1", None, None), ("gir-2", "gir-1", "vendor/lib")]
+
+
+def test_sink_requires_write():
+    class WritelessSink(Sink):
+        pass
+
+    with pytest.raises(TypeError, match="abstract"):
+        WritelessSink()
@@ -1,3 +1,6 @@
+import hashlib
+
+import base62
 import pytest
 
 from coco_agent.services import tm_id
@@ -45,3 +48,52 @@ def test_split_connector_id_bad_source_type(connector_id, match):
 )
 def test_split_connector_id_bad_source_type(connector_id, expected):
     assert tm_id.split_connector_id(connector_id) == expected
+
+
+def _encode_via_hex(id_):
+    # original implementation - ids must stay identical
+    hashed = hashlib.sha256(id_.encode("utf-8")).hexdigest()
+    truncated = int(hashed, base=16) >> (
+        tm_id.HASH_LENGTH_BITS - tm_id.IDENTIFIER_LENGTH_BITS
+    )
+    return base62.encode(truncated)
+
+
+IDS = ["hello", "a", "repo::src/app.py", "ünïcødé/path", "x" * 1000] + [
+    f"{i:040x}" for i in range(0, 2**160, 2**152)
+]
+
+
+def test_encode_unchanged():
+    for id_ in IDS:
+        assert tm_id.encode(id_) == _encode_via_hex(id_)
+
+
+def test_encode_many():
+    assert tm_id.encode_many(IDS) == [tm_id.encode(id_) for id_ in IDS]
+    assert tm_id.encode_many([]) == []
+    with pytest.raises(ValueError, match="Empty id"):
+        tm_id.encode_many(["a", ""])
+
+
+def test_git_ids_memoized():
+    tm_id.git_path.cache_clear()
+
+    assert tm_id.git_path("repo", "src/app.py") == "gip-" + _encode_via_hex(
+        "repo::src/app.py"
+    )
+    assert tm_id.git_path("repo", "src/app.py") == tm_id.git_path("repo", "src/app.py")
+    assert tm_id.git_path.cache_info().hits == 2
+    assert tm_id.git_commit("abc") == "gic-" + _encode_via_hex("abc")
+
+
+def test_git_commit_diffs():
+    paths = ["src/app.py", "README.md"]
+    assert tm_id.git_commit_diffs("abc", paths) == [
+        tm_id.git_commit_diff("abc", path) for path in paths
+    ]
+
+
+def test_base62_encode():
+    for n in [0, 1, 61, 62, 3843, 3844, 3845, 2**80 - 1] + [7**i for i in range(30)]:
+        assert tm_id._base62_encode(n) == base62.encode(n)
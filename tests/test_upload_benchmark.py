@@ -0,0 +1,25 @@
+import pytest
+from coco_agent.remote.upload_benchmark import (
+    UPLOAD_BENCHMARK_FLOWS,
+    run_upload_benchmark,
+)
+
+
+def test_run_upload_benchmark():
+    report = run_upload_benchmark(num_files=3, file_size_kb=300, max_workers=2)
+
+    assert report["api_endpoint"] == "fake"
+    assert [run["flow"] for run in report["runs"]] == list(UPLOAD_BENCHMARK_FLOWS)
+    for run in report["runs"]:
+        assert run["files"] == 3
+        assert run["bytes"] == 3 * 300 * 1024
+        assert run["files_per_sec"] > 0
+        assert run["mb_per_sec"] > 0
+
+
+def test_run_upload_benchmark_validation():
+    with pytest.raises(ValueError, match="multiple of 256 KB"):
+        run_upload_benchmark(resumable_chunk_size_kb=100)
+
+    with pytest.raises(ValueError, match="Unknown upload flow"):
+        run_upload_benchmark(flows=["carrier-pigeon"])